@@ -3,51 +3,86 @@ from __future__ import annotations
 
 import asyncio
 import io
+import os
+import time
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, Set, Tuple
 
-import qrcode
 from telethon import TelegramClient
 from telethon.errors import SessionPasswordNeededError
 
 from bot.config import settings
 from bot.logger import logger
+from bot.metrics import io_timer
+
+
+class TimedTelegramClient(TelegramClient):
+    """TelegramClient whose requests count as Telethon time in handler metrics."""
+
+    async def __call__(self, *args, **kwargs):
+        with io_timer("telethon"):
+            return await super().__call__(*args, **kwargs)
+
+    async def connect(self):
+        with io_timer("telethon"):
+            return await super().connect()
 
 
 class AuthManager:
     """
     One live Telethon client per user; manages QR login & 2FA.
 
-    _pending  – client waiting for the user to enter 2-FA password
-    _active   – fully authorised client you can reuse any time
+    _pending  – client waiting for the user to enter 2-FA password; a login
+                nobody finishes is dropped after STATE_TTL
+    _active   – the user's reusable client: authorised after login, but also
+                any client handed out by client() / session_is_authorized()
+                before that, so it may not be authorised (check first). One
+                found unauthorised is disconnected and dropped.
     _qr_event – asyncio.Event we set when QR is scanned / 2-FA required
+    _waiters  – the task waiting on each user's current QR login
+    _status   – uid → checked_at, for authorised users only (absent =
+                logged out); answers menu decisions without disk
+                or network I/O, re-verified in the background once older
+                than AUTH_STATUS_TTL
+
+    So every map holds logged-in users or logins in progress, never
+    everyone who ever talked to the bot.
     """
 
     _pending: Dict[int, TelegramClient] = {}
     _active: Dict[int, TelegramClient] = {}
     _qr_event: Dict[int, asyncio.Event] = {}
+    _waiters: Dict[int, asyncio.Task] = {}
+    _status: Dict[int, float] = {}
+    _verifying: Dict[int, asyncio.Task] = {}
+    _closing: Set[asyncio.Task] = set()
 
     # ------------------------------------------------------------------ #
     # helpers                                                            #
     # ------------------------------------------------------------------ #
 
     def _session_path(self, uid: int) -> str:
-        Path(settings.SESSION_DIR).mkdir(exist_ok=True)
+        # SESSION_DIR is created once, by load_status_index() at startup
         return f"{settings.SESSION_DIR}/{uid}"
 
     def _new_client(self, uid: int) -> TelegramClient:
         """Create a *disconnected* Telethon client for this user."""
-        return TelegramClient(
+        return TimedTelegramClient(
             self._session_path(uid), settings.API_ID, settings.API_HASH
         )
 
     def client(self, uid: int) -> TelegramClient:
-        """Return cached or new TelegramClient for this user."""
-        return (
-            self._active.get(uid)
-            or self._pending.get(uid)
-            or self._new_client(uid)
-        )
+        """
+        Return cached or new TelegramClient for this user.
+
+        A new client is cached in _active straight away (as
+        session_is_authorized does): callers connect it, and one that
+        nothing refers to could never be disconnected again.
+        """
+        client = self._active.get(uid) or self._pending.get(uid)
+        if client is None:
+            client = self._active[uid] = self._new_client(uid)
+        return client
 
     # ------------------------------------------------------------------ #
     # public API                                                         #
@@ -60,11 +95,14 @@ class AuthManager:
         The connected client is cached in _pending until the user
         finishes 2-factor verification.
         """
+        await self._abandon_login(uid)
         client = self._new_client(uid)
         await client.connect()
         qr_login = await client.qr_login()
 
-        # Render QR
+        # Render QR (qrcode + PIL are only imported once someone logs in)
+        import qrcode
+
         img = qrcode.make(qr_login.url)
         buf = io.BytesIO()
         img.save(buf, format="PNG")
@@ -84,15 +122,120 @@ class AuthManager:
                 logger.error("QR wait error for %s: %s", uid, exc)
             finally:
                 ev.set()
+                if self._waiters.get(uid) is task:
+                    del self._waiters[uid]
 
-        asyncio.create_task(_waiter())
+        task = self._waiters[uid] = asyncio.create_task(_waiter())
+        # By then the password prompt has expired as well
+        asyncio.get_running_loop().call_later(settings.STATE_TTL, self._expire_login, uid, client)
         return client, buf
 
+    def _expire_login(self, uid: int, client: TelegramClient) -> None:
+        """Drop a login that is still unfinished after STATE_TTL."""
+        if self._pending.get(uid) is not client:
+            return
+        del self._pending[uid]
+        logger.info("Login of %s was abandoned, dropping its client", uid)
+        self._disconnect_later(client)
+
+    def _disconnect_later(self, client: TelegramClient) -> None:
+        if client.is_connected():
+            task = asyncio.create_task(client.disconnect())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def discard_client(self, uid: int, client: TelegramClient) -> None:
+        """Drop uid's cached client if it is `client` (found not authorised)."""
+        if self._active.get(uid) is client:
+            del self._active[uid]
+            if client.is_connected():
+                await client.disconnect()
+
+    async def _abandon_login(self, uid: int) -> None:
+        """
+        Drop an unfinished earlier login of uid: its waiter is cancelled (which
+        releases the handler waiting on it) and its client disconnected, rather
+        than both lingering until the QR code expires.
+        """
+        waiter = self._waiters.pop(uid, None)
+        if waiter:
+            waiter.cancel()
+        client = self._pending.pop(uid, None)
+        if client and client.is_connected():
+            await client.disconnect()
+
+    def is_current_login(self, uid: int, client: TelegramClient) -> bool:
+        """False once a newer login (or a logout) has replaced this one."""
+        return self._pending.get(uid) is client
+
+    async def complete_login(self, uid: int) -> None:
+        """A QR login went through without 2FA: its client becomes the active one."""
+        client = self._pending.pop(uid, None)
+        if client is not None:
+            await self._promote(uid, client)
+
+    async def _promote(self, uid: int, client: TelegramClient) -> None:
+        """Make client the active one, disconnecting the one it replaces."""
+        old = self._active.get(uid)
+        if old is not None and old is not client and old.is_connected():
+            await old.disconnect()
+        self._active[uid] = client
+        self.set_status(uid, True)
+
+    # ------------------------------------------------------------------ #
+    # auth-status index                                                  #
+    # ------------------------------------------------------------------ #
+
+    def load_status_index(self) -> None:
+        """
+        Seed the index from one scan of SESSION_DIR.
+
+        A session file only means "probably logged in", so those entries are
+        stored as already stale and get verified on first use.
+        """
+        Path(settings.SESSION_DIR).mkdir(exist_ok=True)
+        with os.scandir(settings.SESSION_DIR) as it:
+            for entry in it:
+                stem, ext = os.path.splitext(entry.name)
+                if ext == ".session" and stem.lstrip("-").isdigit():
+                    self._status.setdefault(int(stem), 0.0)
+
+    def set_status(self, uid: int, authorized: bool) -> None:
+        """Record an authoritative answer (login, 2FA, logout, forwarder)."""
+        if authorized:
+            self._status[uid] = time.monotonic()
+        else:
+            self._status.pop(uid, None)
+
+    def is_authorized_cached(self, uid: int) -> bool:
+        """Answer from the index only; stale entries are re-checked in the background."""
+        checked = self._status.get(uid)
+        if checked is None:
+            return False    # no session file at startup and no login since
+        if time.monotonic() - checked > settings.AUTH_STATUS_TTL:
+            self._verify_soon(uid)
+        return True
+
+    def _verify_soon(self, uid: int) -> None:
+        if uid in self._verifying:
+            return
+
+        async def _verify() -> None:
+            try:
+                self.set_status(uid, await self.session_is_authorized(uid))
+            except Exception as exc:
+                logger.warning("Auth status check failed for %s: %s", uid, exc)
+            finally:
+                self._verifying.pop(uid, None)
+
+        self._verifying[uid] = asyncio.create_task(_verify())
+
     async def wait_complete(self, uid: int) -> None:
         ev = self._qr_event.get(uid)
         if ev:
             await ev.wait()
-            self._qr_event.pop(uid, None)
+            if self._qr_event.get(uid) is ev:    # not a newer login's
+                del self._qr_event[uid]
 
     async def finish_with_password(
         self, uid: int, pwd: str
@@ -112,7 +255,7 @@ class AuthManager:
         try:
             await client.sign_in(password=pwd)
             logger.info("User %s passed 2FA", uid)
-            self._active[uid] = client          # promote to active cache
+            await self._promote(uid, client)
             return True, client
         except Exception as exc:
             logger.warning("2FA login failed for %s: %s", uid, exc)
@@ -137,4 +280,24 @@ class AuthManager:
                 return False
 
         self._active[uid] = client
-        return await client.is_user_authorized()
+        authorized = await client.is_user_authorized()
+        self.set_status(uid, authorized)
+        if not authorized:
+            await self.discard_client(uid, client)
+        return authorized
+
+    async def logout(self, uid: int) -> None:
+        """Drop every cached client for uid and delete its session file."""
+        waiter = self._waiters.pop(uid, None)
+        if waiter:
+            waiter.cancel()
+        for cache in (self._active, self._pending):
+            client = cache.pop(uid, None)
+            if client and client.is_connected():
+                await client.disconnect()
+        self._qr_event.pop(uid, None)
+        self.set_status(uid, False)
+        try:
+            Path(self._session_path(uid) + ".session").unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,25 @@
+"""
+bot/bootstrap.py
+----------------
+Imported first by bot.entry: starts the startup timer and loads the heavy
+modules in timed groups. entry.py's own imports are then cache hits and can
+stay at the top of the file.
+"""
+from __future__ import annotations
+
+from bot.profiling import StartupTimer
+
+startup = StartupTimer()        # import + startup phase breakdown, logged once polling starts
+
+startup.imports("import aiogram", "aiogram", "aiogram.client.default", "aiogram.enums")
+startup.imports(
+    "import core + telethon",
+    "bot.runtime", "bot.config", "bot.logger", "bot.forwarding", "bot.outbound",
+)
+startup.imports(
+    "import routers",
+    "bot.routers.conversation", "bot.routers.admin", "bot.routers.auth",
+    "bot.routers.sources", "bot.routers.targets", "bot.routers.filters",
+    "bot.routers.bulk", "bot.routers.misc",
+    "bot.middlewares.error_logger", "bot.middlewares.timing",
+)
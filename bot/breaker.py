@@ -0,0 +1,141 @@
+"""Per-target circuit breaker for deliveries.
+
+A target the user can no longer post to (chat deleted, rights taken away,
+account banned there) fails every delivery the same way. After `threshold`
+such errors in a row the breaker opens: deliveries are parked in the outbox
+without calling Telegram until `retry_at`, when a single one goes out as a
+probe. A probe that fails again reopens the breaker for twice as long (up to
+`backoff_max`); any successful delivery closes it.
+
+Only TARGET_ERRORS count. Flood waits, network trouble and the like say
+nothing about the target and leave the breaker as it is. The lookup errors in
+SOURCE_OR_TARGET_ERRORS can also come from the source side of a forward (a
+source that went private); before one of those opens the breaker the caller
+reads the target once to check it is really the target that is gone.
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from telethon.errors import (
+    ChannelInvalidError,
+    ChannelPrivateError,
+    ChatAdminRequiredError,
+    ChatForbiddenError,
+    ChatGuestSendForbiddenError,
+    ChatIdInvalidError,
+    ChatRestrictedError,
+    ChatWriteForbiddenError,
+    PeerIdInvalidError,
+    TopicDeletedError,
+    UserBannedInChannelError,
+)
+
+# Errors that mean the target itself is unusable, not this one message
+TARGET_ERRORS = (
+    ChannelInvalidError,
+    ChannelPrivateError,
+    ChatAdminRequiredError,
+    ChatForbiddenError,
+    ChatGuestSendForbiddenError,
+    ChatIdInvalidError,
+    ChatRestrictedError,
+    ChatWriteForbiddenError,
+    PeerIdInvalidError,
+    TopicDeletedError,
+    UserBannedInChannelError,
+)
+
+# ...of which these may just as well be about the forward's source
+SOURCE_OR_TARGET_ERRORS = (
+    ChannelInvalidError,
+    ChannelPrivateError,
+    ChatIdInvalidError,
+    PeerIdInvalidError,
+)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+@dataclass(slots=True)
+class TargetBreaker:
+    """Delivery state of one user's target (wall clock, like ClientHealth)."""
+
+    target: int                             # marked chat id it guards
+    threshold: int = 5
+    backoff_base: float = 60.0
+    backoff_max: float = 3600.0
+    state: str = CLOSED
+    failures: int = 0                       # consecutive target errors
+    backoff: float = 0.0
+    retry_at: float = 0.0                   # next probe, while not closed
+    opened_at: Optional[float] = None
+    last_error: Optional[str] = None
+    parked: int = 0                         # deliveries held since it opened
+    trips: int = 0
+
+    def allow(self) -> bool:
+        """
+        May a delivery go out now? Once retry_at has passed, one caller gets
+        True and becomes the probe; everyone else waits for the next retry_at.
+        """
+        if self.state == CLOSED:
+            return True
+        now = time.time()
+        if now < self.retry_at:
+            return False
+        # Due – or a probe that never reported back (failed for another reason)
+        self.state = HALF_OPEN
+        self.retry_at = now + self.backoff
+        return True
+
+    def success(self) -> bool:
+        """A delivery went through; True if that closed an open breaker."""
+        recovered = self.state != CLOSED
+        self.state = CLOSED
+        self.failures = 0
+        if recovered:
+            self.backoff = self.retry_at = 0.0
+            self.opened_at = self.last_error = None
+            self.parked = 0
+        return recovered
+
+    def would_trip(self) -> bool:
+        """Would one more failure open the breaker (or keep it open)?"""
+        return self.state != CLOSED or self.failures + 1 >= self.threshold
+
+    def failure(self, error: str) -> bool:
+        """A target error; True when it opened a closed breaker (tell the user)."""
+        self.failures += 1
+        self.last_error = error
+        if self.state == CLOSED:
+            if self.failures < self.threshold:
+                return False
+            self.trips += 1
+            self.opened_at = time.time()
+            self.backoff = self.backoff_base
+            tripped = True
+        else:
+            self.backoff = min(self.backoff_max, self.backoff * 2)
+            tripped = False
+        self.state = OPEN
+        self.retry_at = time.time() + self.backoff
+        return tripped
+
+    def probe_now(self) -> None:
+        """Let the next delivery probe without waiting (the user changed something)."""
+        if self.state != CLOSED:
+            self.retry_at = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "open_for": time.time() - self.opened_at if self.opened_at else 0.0,
+            "retry_in": max(0.0, self.retry_at - time.time()) if self.state != CLOSED else 0.0,
+            "parked": self.parked,
+            "trips": self.trips,
+        }
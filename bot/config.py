@@ -12,6 +12,90 @@ class Settings:
     LOG_FILE: str = os.getenv("LOG_FILE", "logs/bot.log")
     SESSION_DIR: str = os.getenv("SESSION_DIR", "sessions")
 
+    # Use uvloop for the event loop when it is installed (set UVLOOP=0 to opt out)
+    UVLOOP: bool = os.getenv("UVLOOP", "1") != "0"
+
+    # Telegram user ids allowed to run /profile and other diagnostics
+    ADMIN_IDS: frozenset[int] = frozenset(
+        int(x) for x in os.getenv("ADMIN_IDS", "").replace(",", " ").split()
+    )
+    # Event-loop diagnostics: stall threshold in seconds (0 = monitor off) and
+    # default length of a /profile or SIGUSR1 profile
+    LOOP_LAG_THRESHOLD: float = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))
+    PROFILE_SECONDS: float = float(os.getenv("PROFILE_SECONDS", "30"))
+
+    # Seconds before a cached "logged in" answer is re-verified in the background
+    AUTH_STATUS_TTL: float = float(os.getenv("AUTH_STATUS_TTL", "600"))
+
+    # Conversation state: seconds before an abandoned flow expires, max users
+    # tracked, and an optional SQLite file so flows survive restarts
+    STATE_TTL: float = float(os.getenv("STATE_TTL", "900"))
+    STATE_MAX: int = int(os.getenv("STATE_MAX", "10000"))
+    STATE_DB_PATH: str = os.getenv("STATE_DB_PATH", "")
+
+    # Fair-share forwarding scheduler
+    FORWARD_WORKERS: int = int(os.getenv("FORWARD_WORKERS", "4"))
+    FORWARD_QUEUE_MAX: int = int(os.getenv("FORWARD_QUEUE_MAX", "1000"))
+    # Default per-user messages/min; empty = unlimited
+    FORWARD_QUOTA_PER_MIN: int | None = int(os.getenv("FORWARD_QUOTA_PER_MIN") or 0) or None
+
+    # Config changes rebuild a user's forwarder after this many quiet seconds,
+    # but never later than REFRESH_MAX_DELAY after the first change
+    REFRESH_DEBOUNCE: float = float(os.getenv("REFRESH_DEBOUNCE", "1.5"))
+    REFRESH_MAX_DELAY: float = float(os.getenv("REFRESH_MAX_DELAY", "5"))
+
+    # Forwarding clients that drop are reconnected after a jittered delay that
+    # doubles per failed attempt, from RECONNECT_BASE up to RECONNECT_MAX seconds
+    RECONNECT_BASE: float = float(os.getenv("RECONNECT_BASE", "1"))
+    RECONNECT_MAX: float = float(os.getenv("RECONNECT_MAX", "300"))
+
+    # "First mention only" filter: a token address counts as new again after
+    # FIRST_SEEN_WINDOW seconds; each user remembers at most FIRST_SEEN_MAX
+    FIRST_SEEN_WINDOW: float = float(os.getenv("FIRST_SEEN_WINDOW", "86400"))
+    FIRST_SEEN_MAX: int = int(os.getenv("FIRST_SEEN_MAX", "20000"))
+
+    # 'digest' delivery: send a summary every DIGEST_INTERVAL seconds or once
+    # DIGEST_MAX_MESSAGES are waiting; keep at most DIGEST_BUFFER_MAX per user
+    DIGEST_INTERVAL: float = float(os.getenv("DIGEST_INTERVAL", "600"))
+    DIGEST_MAX_MESSAGES: int = int(os.getenv("DIGEST_MAX_MESSAGES", "50"))
+    DIGEST_BUFFER_MAX: int = int(os.getenv("DIGEST_BUFFER_MAX", "500"))
+
+    # Message ledger (source → target ids, for mirroring edits / deletions):
+    # rows kept LEDGER_RETENTION seconds, the newest LEDGER_HOT_MAX in memory;
+    # deletions arriving within LEDGER_DELETE_DELAY are sent as one call
+    LEDGER_RETENTION: float = float(os.getenv("LEDGER_RETENTION", str(7 * 86400)))
+    LEDGER_HOT_MAX: int = int(os.getenv("LEDGER_HOT_MAX", "100000"))
+    LEDGER_DELETE_DELAY: float = float(os.getenv("LEDGER_DELETE_DELAY", "1.0"))
+
+    # Append every incoming source update (text hashed, see bot/recorder.py) to
+    # this file for offline replay with tools/replay_updates.py; empty = off
+    RECORD_UPDATES: str = os.getenv("RECORD_UPDATES", "")
+
+    # Bot API sends: messages/s over all chats, per private chat, and per group
+    # per minute (each allowing OUTBOUND_BURST at once); 429s and network errors
+    # are retried OUTBOUND_MAX_RETRIES times, flood waits up to OUTBOUND_MAX_RETRY_AFTER s
+    OUTBOUND_GLOBAL_RATE: float = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+    OUTBOUND_CHAT_RATE: float = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+    OUTBOUND_GROUP_PER_MIN: float = float(os.getenv("OUTBOUND_GROUP_PER_MIN", "20"))
+    OUTBOUND_BURST: float = float(os.getenv("OUTBOUND_BURST", "3"))
+    OUTBOUND_MAX_RETRIES: int = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+    OUTBOUND_MAX_RETRY_AFTER: float = float(os.getenv("OUTBOUND_MAX_RETRY_AFTER", "60"))
+
+    # Per-target circuit breaker: BREAKER_THRESHOLD permission / peer errors in
+    # a row stop deliveries to a target; it is probed after BREAKER_BACKOFF
+    # seconds, doubling per failed probe up to BREAKER_BACKOFF_MAX
+    BREAKER_THRESHOLD: int = int(os.getenv("BREAKER_THRESHOLD", "5"))
+    BREAKER_BACKOFF: float = float(os.getenv("BREAKER_BACKOFF", "60"))
+    BREAKER_BACKOFF_MAX: float = float(os.getenv("BREAKER_BACKOFF_MAX", "3600"))
+
+    # Durable outbox: retries with exponential backoff, then dead-letter
+    OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+    OUTBOX_RETRY_INTERVAL: float = float(os.getenv("OUTBOX_RETRY_INTERVAL", "2"))
+
+    # Seconds allowed to drain queued forwards on shutdown; keep it below
+    # Docker's stop timeout (stop_grace_period, 10s by default)
+    SHUTDOWN_DEADLINE: float = float(os.getenv("SHUTDOWN_DEADLINE", "8"))
+
     # Runtime sanity‑checks
     def validate(self):
         required = ["BOT_TOKEN", "API_ID", "API_HASH"]
@@ -0,0 +1,131 @@
+"""Copy delivery: re-send a message's content without the "Forwarded from" header.
+
+Media is re-sent by reference (the InputMedia built from the existing photo or
+document id + file_reference), so nothing is ever downloaded or re-uploaded.
+File references expire after a while; FileRefRefresher re-fetches them in one
+GetMessages call per source chat when several messages need it at once."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Dict, Optional, Set, Tuple
+
+from telethon import TelegramClient, utils
+from telethon.helpers import generate_random_long
+from telethon.tl import functions, types
+from telethon.tl.custom import Message
+from telethon.tl.types import TypeInputPeer
+
+log = logging.getLogger(__name__)
+
+
+def input_media_for(msg: Message) -> Optional[types.TypeInputMedia]:
+    """
+    Build the InputMedia that re-sends msg.media by reference.
+
+    Returns None for text-only messages (web page previews are rebuilt by
+    Telegram from the text). Raises TypeError for media that cannot be
+    re-sent this way (e.g. unanswered quizzes).
+    """
+    media = msg.media
+    if media is None or isinstance(media, (types.MessageMediaWebPage, types.MessageMediaEmpty)):
+        return None
+    if isinstance(media, types.MessageMediaPhoto) and media.photo:
+        return types.InputMediaPhoto(
+            id=utils.get_input_photo(media.photo), spoiler=media.spoiler
+        )
+    if isinstance(media, types.MessageMediaDocument) and media.document:
+        return types.InputMediaDocument(
+            id=utils.get_input_document(media.document), spoiler=media.spoiler
+        )
+    input_media = utils.get_input_media(media)
+    if isinstance(input_media, types.InputMediaEmpty):
+        raise TypeError(f"Cannot copy {type(media).__name__}")
+    return input_media
+
+
+def copy_request(msg: Message, to_peer: TypeInputPeer, top_msg_id: Optional[int]):
+    """Raw request that re-creates msg in to_peer (optionally inside a forum topic)."""
+    reply_to = types.InputReplyToMessage(reply_to_msg_id=top_msg_id) if top_msg_id else None
+    media = input_media_for(msg)
+    if media is None:
+        return functions.messages.SendMessageRequest(
+            peer=to_peer,
+            message=msg.message,
+            entities=msg.entities,
+            reply_to=reply_to,
+            random_id=generate_random_long(),
+        )
+    return functions.messages.SendMediaRequest(
+        peer=to_peer,
+        media=media,
+        message=msg.message or "",
+        entities=msg.entities,
+        reply_to=reply_to,
+        random_id=generate_random_long(),
+    )
+
+
+def sent_message_id(result, random_id: int) -> Optional[int]:
+    """Id of the message a send / forward request produced, from its Updates."""
+    if isinstance(result, types.UpdateShortSentMessage):
+        return result.id
+    for update in getattr(result, "updates", ()):
+        if isinstance(update, types.UpdateMessageID) and update.random_id == random_id:
+            return update.id
+    return None
+
+
+class FileRefRefresher:
+    """
+    Coalesce file-reference refreshes into one GetMessages call per chat.
+
+    Callers that hit FILE_REFERENCE_EXPIRED within `delay` seconds of each other
+    for the same source chat *through the same client* share a single
+    round-trip. Batches are per account: message ids of basic groups and
+    private chats are numbered per account, so another user's client would
+    fetch different messages.
+    """
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self._pending: Dict[Tuple[TelegramClient, int], Dict[int, asyncio.Future]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def refresh(
+        self, client: TelegramClient, peer: TypeInputPeer, msg_id: int
+    ) -> Optional[Message]:
+        """Return msg_id re-fetched with fresh file references (None if gone)."""
+        loop = asyncio.get_running_loop()
+        key = (client, utils.get_peer_id(peer))
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = {}
+            loop.call_later(self.delay, self._spawn_flush, client, peer, key)
+        fut = batch.get(msg_id)
+        if fut is None:
+            fut = batch[msg_id] = loop.create_future()
+        return await fut
+
+    def _spawn_flush(self, client: TelegramClient, peer: TypeInputPeer, key: Tuple[TelegramClient, int]):
+        task = asyncio.create_task(self._flush(client, peer, key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, client: TelegramClient, peer: TypeInputPeer, key: Tuple[TelegramClient, int]):
+        batch = self._pending.pop(key, {})
+        if not batch:
+            return
+        chat_id = key[1]
+        try:
+            fresh = await client.get_messages(peer, ids=list(batch))
+        except Exception as e:
+            log.warning("File reference refresh failed for %s: %s", chat_id, e)
+            for fut in batch.values():
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        log.debug("Refreshed %d file references in %s", len(batch), chat_id)
+        for fut, msg in zip(batch.values(), fresh):
+            if not fut.done():
+                fut.set_result(msg)
@@ -1,7 +1,10 @@
+import asyncio
+import json
 import aiosqlite
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from .config import settings
+from .metrics import instrument
 
 @dataclass
 class Source:
@@ -9,15 +12,33 @@ class Source:
     topic_id: Optional[int]
     title: str
 
+@dataclass
+class OutboxEntry:
+    id: int
+    tg_id: int
+    chat_id: int
+    msg_id: int
+    attempts: int
+
 @dataclass
 class Target:
     chat_id: int
     topic_id: Optional[int]
+    mode: str = "forward"       # 'forward' keeps the header, 'copy' re-sends content,
+                                # 'digest' batches messages into summaries
 
+DELIVERY_MODES = ("forward", "copy", "digest")
+
+# 'all' forwards everything, 'token' only token-related messages, 'first'
+# only messages mentioning a token the user hasn't seen yet (bot/first_seen.py)
+FILTER_MODES = ("all", "token", "first")
+
+@instrument("db")
 class Database:
     def __init__(self):
         self._path = settings.DB_PATH
         self.conn: Optional[aiosqlite.Connection] = None
+        self._tx_lock = asyncio.Lock()      # one explicit transaction at a time
 
     async def init(self):
         self.conn = await aiosqlite.connect(self._path, isolation_level=None)
@@ -30,7 +51,9 @@ class Database:
 
             CREATE TABLE IF NOT EXISTS users (
                 tg_id      INTEGER PRIMARY KEY,
-                filter_mode TEXT  NOT NULL DEFAULT 'all'
+                filter_mode TEXT  NOT NULL DEFAULT 'all',
+                tier        TEXT  NOT NULL DEFAULT 'normal',
+                quota_per_min INTEGER
             );
 
             CREATE TABLE IF NOT EXISTS sources (
@@ -46,9 +69,57 @@ class Database:
             CREATE TABLE IF NOT EXISTS targets (
                 tg_id     INTEGER PRIMARY KEY,
                 chat_id   INTEGER NOT NULL,
-                topic_id  INTEGER
+                topic_id  INTEGER,
+                mode      TEXT    NOT NULL DEFAULT 'forward'
             );
 
+            -- Accepted-but-unsent forwards; delivered rows are deleted,
+            -- rows that keep failing end up with status='dead'
+            CREATE TABLE IF NOT EXISTS outbox (
+                id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                tg_id        INTEGER NOT NULL,
+                chat_id      INTEGER NOT NULL,
+                msg_id       INTEGER NOT NULL,
+                status       TEXT    NOT NULL DEFAULT 'pending',
+                attempts     INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL    NOT NULL DEFAULT 0,
+                last_error   TEXT,
+                UNIQUE(tg_id, chat_id, msg_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt);
+
+            -- Token keys (64-bit hashes) already forwarded in "first" filter mode
+            CREATE TABLE IF NOT EXISTS first_seen (
+                tg_id     INTEGER NOT NULL,
+                key       INTEGER NOT NULL,
+                seen      REAL    NOT NULL,
+                PRIMARY KEY (tg_id, key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_first_seen_seen ON first_seen(seen);
+
+            -- Messages waiting for the next digest (targets in 'digest' mode)
+            CREATE TABLE IF NOT EXISTS digest_buffer (
+                tg_id     INTEGER NOT NULL,
+                chat_id   INTEGER NOT NULL,
+                msg_id    INTEGER NOT NULL,
+                added     REAL    NOT NULL,
+                excerpt   TEXT    NOT NULL DEFAULT '',
+                PRIMARY KEY (tg_id, chat_id, msg_id)
+            ) WITHOUT ROWID;
+
+            -- Source message → the message it produced in the target (bot/ledger.py).
+            -- Non-channel sources share one per-account id sequence: chat_id 0
+            CREATE TABLE IF NOT EXISTS message_ledger (
+                tg_id       INTEGER NOT NULL,
+                chat_id     INTEGER NOT NULL,
+                msg_id      INTEGER NOT NULL,
+                target_chat INTEGER NOT NULL,
+                target_msg  INTEGER NOT NULL,
+                created     REAL    NOT NULL,
+                PRIMARY KEY (tg_id, chat_id, msg_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_message_ledger_created ON message_ledger(created);
+
             CREATE TABLE IF NOT EXISTS filtered_users (
                 id          INTEGER PRIMARY KEY AUTOINCREMENT,
                 tg_id       INTEGER NOT NULL,
@@ -59,39 +130,92 @@ class Database:
             );
             """
         )
+        await self._add_column_if_missing("targets", "mode", "TEXT NOT NULL DEFAULT 'forward'")
+        await self._add_column_if_missing("users", "tier", "TEXT NOT NULL DEFAULT 'normal'")
+        await self._add_column_if_missing("users", "quota_per_min", "INTEGER")
         await self.conn.commit()
 
+    async def _add_column_if_missing(self, table: str, column: str, decl: str):
+        """Bring databases created by older versions up to the current schema."""
+        cur = await self.conn.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] async for row in cur]:
+            await self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+    async def _execute_tx(self, sql: str, params=()):
+        """
+        Run one write statement and commit it.
+
+        Goes through the same lock as _executemany_tx: the connection is shared,
+        so a plain execute + commit issued while a batch transaction is open
+        would be committed (or rolled back) together with that batch.
+        """
+        async with self._tx_lock:
+            try:
+                await self.conn.execute(sql, params)
+            except BaseException:
+                await self.conn.rollback()
+                raise
+            await self.conn.commit()
+
+    async def _executemany_tx(self, sql: str, rows):
+        """Run one statement for many rows inside a single transaction."""
+        async with self._tx_lock:
+            await self.conn.execute("BEGIN")
+            try:
+                await self.conn.executemany(sql, rows)
+            except BaseException:       # cancellation must not leave the tx open
+                await self.conn.rollback()
+                raise
+            await self.conn.commit()
+
     # User helpers ------------------------------------------------------------------
     async def add_user_if_missing(self, tg_id: int):
-        await self.conn.execute("INSERT OR IGNORE INTO users(tg_id) VALUES (?)", (tg_id,))
-        await self.conn.commit()
+        await self._execute_tx("INSERT OR IGNORE INTO users(tg_id) VALUES (?)", (tg_id,))
 
     async def set_filter_mode(self, tg_id: int, mode: str):
-        await self.conn.execute("UPDATE users SET filter_mode=? WHERE tg_id=?", (mode, tg_id))
-        await self.conn.commit()
+        await self._execute_tx("UPDATE users SET filter_mode=? WHERE tg_id=?", (mode, tg_id))
 
     async def get_filter_mode(self, tg_id: int) -> str:
         cur = await self.conn.execute("SELECT filter_mode FROM users WHERE tg_id=?", (tg_id,))
         row = await cur.fetchone()
         return row[0] if row else "all"
 
+    async def set_user_limits(self, tg_id: int, tier: str, quota_per_min: Optional[int]):
+        await self._execute_tx(
+            "UPDATE users SET tier=?, quota_per_min=? WHERE tg_id=?", (tier, quota_per_min, tg_id)
+        )
+
+    async def get_user_limits(self, tg_id: int) -> Tuple[str, Optional[int]]:
+        """Return (tier, quota_per_min) for the fair-share scheduler."""
+        cur = await self.conn.execute("SELECT tier, quota_per_min FROM users WHERE tg_id=?", (tg_id,))
+        row = await cur.fetchone()
+        return (row[0], row[1]) if row else ("normal", None)
+
     # Source helpers ----------------------------------------------------------------
     async def add_source(self, tg_id: int, chat_id: int, topic_id: Optional[int], title: str):
-        await self.conn.execute(
+        await self._execute_tx(
             """INSERT INTO sources(tg_id, chat_id, topic_id, title)
                    VALUES(?, ?, ?, ?)
                    ON CONFLICT(tg_id, chat_id, topic_id)
                    DO UPDATE SET title=excluded.title""",
             (tg_id, chat_id, topic_id, title),
         )
-        await self.conn.commit()
+
+    async def add_sources_many(self, tg_id: int, rows: List[Tuple[int, Optional[int], str]]):
+        """Upsert many (chat_id, topic_id, title) sources in one transaction."""
+        await self._executemany_tx(
+            """INSERT INTO sources(tg_id, chat_id, topic_id, title)
+                   VALUES(?, ?, ?, ?)
+                   ON CONFLICT(tg_id, chat_id, topic_id)
+                   DO UPDATE SET title=excluded.title""",
+            [(tg_id, *row) for row in rows],
+        )
 
     async def remove_source(self, tg_id: int, chat_id: int, topic_id: Optional[int]):
-        await self.conn.execute(
+        await self._execute_tx(
             "DELETE FROM sources WHERE tg_id=? AND chat_id=? AND (topic_id=? OR (topic_id IS NULL AND ? IS NULL))",
             (tg_id, chat_id, topic_id, topic_id),
         )
-        await self.conn.commit()
 
     async def list_sources(self, tg_id: int) -> List[Source]:
         cur = await self.conn.execute(
@@ -101,39 +225,206 @@ class Database:
 
     # Target helpers ----------------------------------------------------------------
     async def set_target(self, tg_id: int, chat_id: int, topic_id: Optional[int]):
-        await self.conn.execute(
+        await self._execute_tx(
             "INSERT INTO targets(tg_id, chat_id, topic_id) VALUES(?, ?, ?) "
             "ON CONFLICT(tg_id) DO UPDATE SET chat_id=excluded.chat_id, topic_id=excluded.topic_id",
             (tg_id, chat_id, topic_id),
         )
-        await self.conn.commit()
 
     async def get_target(self, tg_id: int) -> Optional[Target]:
         cur = await self.conn.execute(
-            "SELECT chat_id, topic_id FROM targets WHERE tg_id=?", (tg_id,)
+            "SELECT chat_id, topic_id, mode FROM targets WHERE tg_id=?", (tg_id,)
         )
         row = await cur.fetchone()
         return Target(*row) if row else None
 
+    async def set_delivery_mode(self, tg_id: int, mode: str):
+        await self._execute_tx("UPDATE targets SET mode=? WHERE tg_id=?", (mode, tg_id))
+
     # Filtered users helpers ---------------------------------------------------------
     async def add_filtered_user(self, tg_id: int, user_id: int, display_name: str):
-        await self.conn.execute(
+        await self._execute_tx(
             """INSERT INTO filtered_users(tg_id, user_id, display_name)
                    VALUES(?, ?, ?)
                    ON CONFLICT(tg_id, user_id)
                    DO UPDATE SET display_name=excluded.display_name""",
             (tg_id, user_id, display_name),
         )
-        await self.conn.commit()
+
+    async def add_filtered_users_many(self, tg_id: int, rows: List[Tuple[int, str]]):
+        """Upsert many (user_id, display_name) filtered users in one transaction."""
+        await self._executemany_tx(
+            """INSERT INTO filtered_users(tg_id, user_id, display_name)
+                   VALUES(?, ?, ?)
+                   ON CONFLICT(tg_id, user_id)
+                   DO UPDATE SET display_name=excluded.display_name""",
+            [(tg_id, *row) for row in rows],
+        )
+
+    async def list_filtered_users_named(self, tg_id: int) -> List[Tuple[int, str]]:
+        cur = await self.conn.execute(
+            "SELECT user_id, display_name FROM filtered_users WHERE tg_id=?", (tg_id,)
+        )
+        return [tuple(row) async for row in cur]
 
     async def remove_filtered_user(self, tg_id: int, user_id: int):
-        await self.conn.execute(
+        await self._execute_tx(
             "DELETE FROM filtered_users WHERE tg_id=? AND user_id=?", (tg_id, user_id)
         )
-        await self.conn.commit()
 
     async def list_filtered_users(self, tg_id: int) -> List[int]:
         cur = await self.conn.execute(
             "SELECT user_id FROM filtered_users WHERE tg_id=?", (tg_id,)
         )
         return [row[0] async for row in cur]
+
+    async def list_configured_users(self) -> List[int]:
+        """Users with a target and at least one source (i.e. something to forward)."""
+        cur = await self.conn.execute(
+            "SELECT t.tg_id FROM targets t WHERE EXISTS (SELECT 1 FROM sources s WHERE s.tg_id=t.tg_id)"
+        )
+        return [row[0] async for row in cur]
+
+    # Outbox helpers -----------------------------------------------------------------
+    async def outbox_add_many(self, rows: List[Tuple[int, int, int]]):
+        """Append (tg_id, chat_id, msg_id) rows in one transaction."""
+        await self._executemany_tx(
+            "INSERT OR IGNORE INTO outbox(tg_id, chat_id, msg_id) VALUES(?, ?, ?)", rows
+        )
+
+    async def outbox_done_many(self, keys: List[Tuple[int, int, int]]):
+        await self._executemany_tx(
+            "DELETE FROM outbox WHERE tg_id=? AND chat_id=? AND msg_id=?", keys
+        )
+
+    async def outbox_fail_many(self, rows: List[Tuple[str, float, str, int, int, int]]):
+        """Bump attempts for (status, next_attempt, error, tg_id, chat_id, msg_id) rows."""
+        await self._executemany_tx(
+            """UPDATE outbox SET status=?, next_attempt=?, last_error=?, attempts=attempts+1
+                   WHERE tg_id=? AND chat_id=? AND msg_id=?""",
+            rows,
+        )
+
+    async def outbox_defer_many(self, rows: List[Tuple[float, str, int, int, int]]):
+        """
+        Push (next_attempt, error, tg_id, chat_id, msg_id) rows back without
+        using an attempt. The error is marked so outbox_wake() finds them.
+        """
+        await self._executemany_tx(
+            """UPDATE outbox SET next_attempt=?, last_error='deferred: ' || ?
+                   WHERE tg_id=? AND chat_id=? AND msg_id=? AND status='pending'""",
+            rows,
+        )
+
+    async def outbox_wake(self, tg_id: int):
+        """Make a user's deferred rows due now (failed ones keep their backoff)."""
+        await self._execute_tx(
+            """UPDATE outbox SET next_attempt=0
+                   WHERE tg_id=? AND status='pending' AND last_error LIKE 'deferred: %'""",
+            (tg_id,),
+        )
+
+    async def outbox_due(
+        self, now: float, limit: int, tg_ids: List[int], after_id: int = 0
+    ) -> List[OutboxEntry]:
+        """Pending rows of the given users whose retry time has come, oldest first."""
+        cur = await self.conn.execute(
+            """SELECT id, tg_id, chat_id, msg_id, attempts FROM outbox
+                   WHERE status='pending' AND next_attempt<=? AND id>?
+                     AND tg_id IN (SELECT value FROM json_each(?))
+                   ORDER BY id LIMIT ?""",
+            (now, after_id, json.dumps(tg_ids), limit),
+        )
+        return [OutboxEntry(*row) async for row in cur]
+
+    async def outbox_dead_letter_user(self, tg_id: int, reason: str):
+        """Give up on every pending row of a user (logged out, session revoked)."""
+        await self._execute_tx(
+            "UPDATE outbox SET status='dead', last_error=? WHERE tg_id=? AND status='pending'",
+            (reason, tg_id),
+        )
+
+    async def outbox_counts(self, tg_id: int) -> Tuple[int, int]:
+        """Return (pending, dead) outbox rows for one user."""
+        cur = await self.conn.execute(
+            """SELECT COALESCE(SUM(status='pending'), 0), COALESCE(SUM(status='dead'), 0)
+                   FROM outbox WHERE tg_id=?""",
+            (tg_id,),
+        )
+        row = await cur.fetchone()
+        return row[0], row[1]
+
+    # First-seen index helpers -------------------------------------------------------
+    async def first_seen_add_many(self, rows: List[Tuple[int, int, float]]):
+        """Store (tg_id, key, seen) rows in one transaction."""
+        await self._executemany_tx(
+            "INSERT OR REPLACE INTO first_seen(tg_id, key, seen) VALUES(?, ?, ?)", rows
+        )
+
+    async def first_seen_load(self, since: float) -> List[Tuple[int, int, float]]:
+        """Rows seen after `since`, oldest first."""
+        cur = await self.conn.execute(
+            "SELECT tg_id, key, seen FROM first_seen WHERE seen>? ORDER BY seen", (since,)
+        )
+        return [tuple(row) async for row in cur]
+
+    async def first_seen_prune(self, before: float):
+        await self._execute_tx("DELETE FROM first_seen WHERE seen<=?", (before,))
+
+    # Digest buffer helpers ----------------------------------------------------------
+    async def digest_add_many(self, rows: List[Tuple[int, int, int, float, str]]):
+        """Store (tg_id, chat_id, msg_id, added, excerpt) rows in one transaction."""
+        await self._executemany_tx(
+            """INSERT OR IGNORE INTO digest_buffer(tg_id, chat_id, msg_id, added, excerpt)
+                   VALUES(?, ?, ?, ?, ?)""",
+            rows,
+        )
+
+    async def digest_remove_many(self, keys: List[Tuple[int, int, int]]):
+        await self._executemany_tx(
+            "DELETE FROM digest_buffer WHERE tg_id=? AND chat_id=? AND msg_id=?", keys
+        )
+
+    async def digest_load(self) -> List[Tuple[int, int, int, float, str]]:
+        """Every buffered row, oldest first."""
+        cur = await self.conn.execute(
+            "SELECT tg_id, chat_id, msg_id, added, excerpt FROM digest_buffer ORDER BY added"
+        )
+        return [tuple(row) async for row in cur]
+
+    # Message ledger helpers ---------------------------------------------------------
+    async def ledger_add_many(self, rows: List[Tuple[int, int, int, int, int, float]]):
+        """Store (tg_id, chat_id, msg_id, target_chat, target_msg, created) rows."""
+        await self._executemany_tx(
+            """INSERT OR REPLACE INTO message_ledger(tg_id, chat_id, msg_id, target_chat, target_msg, created)
+                   VALUES(?, ?, ?, ?, ?, ?)""",
+            rows,
+        )
+
+    async def ledger_remove_many(self, keys: List[Tuple[int, int, int]]):
+        await self._executemany_tx(
+            "DELETE FROM message_ledger WHERE tg_id=? AND chat_id=? AND msg_id=?", keys
+        )
+
+    async def ledger_get(self, tg_id: int, chat_id: int, msg_id: int) -> Optional[Tuple[int, int]]:
+        """(target_chat, target_msg) of a source message, if recorded."""
+        cur = await self.conn.execute(
+            "SELECT target_chat, target_msg FROM message_ledger WHERE tg_id=? AND chat_id=? AND msg_id=?",
+            (tg_id, chat_id, msg_id),
+        )
+        row = await cur.fetchone()
+        return tuple(row) if row else None
+
+    async def ledger_load(self, since: float, limit: int) -> List[Tuple[int, int, int, int, int, float]]:
+        """The newest `limit` rows created after `since`, oldest first."""
+        cur = await self.conn.execute(
+            """SELECT * FROM (
+                   SELECT tg_id, chat_id, msg_id, target_chat, target_msg, created FROM message_ledger
+                   WHERE created>? ORDER BY created DESC LIMIT ?
+               ) ORDER BY created""",
+            (since, limit),
+        )
+        return [tuple(row) async for row in cur]
+
+    async def ledger_prune(self, before: float):
+        await self._execute_tx("DELETE FROM message_ledger WHERE created<=?", (before,))
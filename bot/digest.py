@@ -0,0 +1,254 @@
+"""Digest delivery: collapse a noisy feed into periodic summary messages.
+
+When a target's delivery mode is 'digest', accepted messages are not
+forwarded one by one. They are buffered per user and emitted as one composed
+message (a line per original, with a t.me link back to it) every
+DIGEST_INTERVAL seconds, or as soon as DIGEST_MAX_MESSAGES are waiting.
+
+The buffer is bounded (DIGEST_BUFFER_MAX per user; the oldest entries are
+dropped and counted when a target stays unreachable) and written through to
+the `digest_buffer` table in batches, so a restart neither loses nor repeats
+a pending digest.
+"""
+from __future__ import annotations
+
+import asyncio
+import html
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from telethon.tl.custom import Message
+
+from .db import Database
+
+log = logging.getLogger(__name__)
+
+EXCERPT_LEN = 120
+MESSAGE_LIMIT = 4000    # Telegram allows 4096 characters per message
+
+Key = Tuple[int, int, int]      # (tg_id, chat_id, msg_id)
+
+
+@dataclass(slots=True)
+class DigestEntry:
+    chat_id: int
+    msg_id: int
+    added: float
+    excerpt: str
+
+
+def excerpt_of(msg: Message) -> str:
+    """First line of the text, shortened; a marker for media-only posts."""
+    text = (msg.raw_text or "").strip().split("\n", 1)[0]
+    if len(text) > EXCERPT_LEN:
+        text = text[:EXCERPT_LEN - 1] + "…"
+    if not text and msg.media:
+        text = "📎 media"
+    return text
+
+
+def message_link(chat_id: int, msg_id: int) -> Optional[str]:
+    """t.me link for a channel / supergroup message (marked id -100…)."""
+    if chat_id < -10**12:
+        return f"https://t.me/c/{-chat_id - 10**12}/{msg_id}"
+    return None
+
+
+def compose_digest(
+    entries: List[DigestEntry], titles: Dict[int, str], dropped: int = 0
+) -> List[Tuple[str, List[DigestEntry]]]:
+    """
+    Render entries grouped by source chat, split to fit Telegram's limit.
+    Each chunk comes with the entries it lists, so a digest that fails half
+    way can be marked delivered up to the last chunk that went out.
+    """
+    chats: Dict[int, List[DigestEntry]] = {}
+    for e in entries:
+        chats.setdefault(e.chat_id, []).append(e)
+    span = time.strftime("%H:%M", time.localtime(entries[0].added)) + "–" + \
+        time.strftime("%H:%M", time.localtime(entries[-1].added))
+    header = f"🗞 <b>Digest</b>: {len(entries)} messages from {len(chats)} chats ({span})"
+    if dropped:
+        header += f"\n⚠️ {dropped} older messages were dropped while the target was unreachable"
+
+    lines: List[Tuple[str, Optional[DigestEntry]]] = [(header, None)]
+    for chat_id, items in chats.items():
+        lines.append((f"\n<b>{html.escape(titles.get(chat_id, str(chat_id)))}</b>", None))
+        for e in items:
+            stamp = time.strftime("%H:%M", time.localtime(e.added))
+            link = message_link(chat_id, e.msg_id)
+            stamp = f'<a href="{link}">{stamp}</a>' if link else stamp
+            lines.append((f"• {stamp} {html.escape(e.excerpt)}", e))
+
+    chunks: List[Tuple[str, List[DigestEntry]]] = []
+    current, listed = "", []
+    for line, entry in lines:
+        if current and len(current) + len(line) + 1 > MESSAGE_LIMIT:
+            chunks.append((current, listed))
+            current, listed = "", []
+        current = f"{current}\n{line}" if current else line
+        if entry is not None:
+            listed.append(entry)
+    chunks.append((current, listed))
+    return chunks
+
+
+class DigestBuffer:
+    def __init__(
+        self,
+        db: Database,
+        send: Callable[[int, List[DigestEntry], int], Awaitable[bool]],
+        interval: float = 600,
+        max_messages: int = 50,
+        max_buffer: int = 500,
+        flush_interval: float = 1.0,
+    ):
+        self.db = db
+        # send(tg_id, entries, dropped) → True once delivered, False to retry later
+        # (delivered() drops entries of chunks that went out before a failure)
+        self.send = send
+        self.interval = interval
+        self.max_messages = max_messages
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        self._entries: Dict[int, Deque[DigestEntry]] = {}
+        self._dropped: Dict[int, int] = {}
+        self._retry_at: Dict[int, float] = {}      # after a failed send
+        self._added: List[Tuple[int, int, int, float, str]] = []
+        self._removed: List[Key] = []
+        self._kick = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._tasks: List[asyncio.Task] = []
+        self.emitted = 0
+        self.digested = 0
+
+    # ----------------------------- hot path -----------------------------------
+    def add(self, tg_id: int, chat_id: int, msg: Message) -> None:
+        entry = DigestEntry(chat_id, msg.id, time.time(), excerpt_of(msg))
+        buf = self._entries.get(tg_id)
+        if buf is None:
+            buf = self._entries[tg_id] = deque()
+        buf.append(entry)
+        self._added.append((tg_id, chat_id, msg.id, entry.added, entry.excerpt))
+        if len(buf) > self.max_buffer:
+            old = buf.popleft()
+            self._dropped[tg_id] = self._dropped.get(tg_id, 0) + 1
+            self._removed.append((tg_id, old.chat_id, old.msg_id))
+        if len(buf) >= self.max_messages:
+            self._kick.set()
+
+    def pending(self, tg_id: int) -> int:
+        return len(self._entries.get(tg_id, ()))
+
+    # ----------------------------- emitting -----------------------------------
+    def _due(self, now: float) -> List[int]:
+        return [
+            uid for uid, buf in self._entries.items()
+            if buf
+            and (len(buf) >= self.max_messages or now - buf[0].added >= self.interval)
+            and self._retry_at.get(uid, 0) <= now
+        ]
+
+    async def emit(self, tg_id: int) -> bool:
+        buf = self._entries.get(tg_id)
+        if not buf:
+            return True
+        entries = list(buf)
+        dropped = self._dropped.get(tg_id, 0)
+        try:
+            sent = await self.send(tg_id, entries, dropped)
+        except Exception as e:      # noqa: BLE001
+            log.warning("Digest for %s failed: %s", tg_id, e)
+            sent = False
+        if not sent:
+            self._retry_at[tg_id] = time.time() + min(60.0, self.interval)
+            return False
+        self._retry_at.pop(tg_id, None)
+        self.delivered(tg_id, entries)
+        self.emitted += 1
+        log.info("Digest of %d messages sent for %s", len(entries), tg_id)
+        return True
+
+    def delivered(self, tg_id: int, entries: List[DigestEntry]) -> None:
+        """
+        Drop entries that reached the target. Called by send() for the chunks
+        that went out before a later one failed, so the retry skips them.
+        """
+        buf = self._entries.get(tg_id)
+        if not buf or not entries:
+            return
+        # New entries may have arrived (and old ones overflowed) meanwhile
+        sent_ids = {id(e) for e in entries}
+        kept: Deque[DigestEntry] = deque()
+        for e in buf:
+            if id(e) in sent_ids:
+                self._removed.append((tg_id, e.chat_id, e.msg_id))
+                self.digested += 1
+            else:
+                kept.append(e)
+        self._entries[tg_id] = kept
+        self._dropped.pop(tg_id, None)      # the header with the count went out
+
+    async def _emit_loop(self) -> None:
+        tick = min(30.0, self.interval / 4)
+        while True:
+            try:
+                await asyncio.wait_for(self._kick.wait(), tick)
+            except asyncio.TimeoutError:
+                pass
+            self._kick.clear()
+            for uid in self._due(time.time()):
+                await self.emit(uid)
+
+    # ----------------------------- persistence --------------------------------
+    async def load(self) -> None:
+        """Refill the buffers from the table (before any handler runs)."""
+        rows = await self.db.digest_load()
+        for tg_id, chat_id, msg_id, added, excerpt in rows:
+            self._entries.setdefault(tg_id, deque()).append(DigestEntry(chat_id, msg_id, added, excerpt))
+        if rows:
+            log.info("Digest buffer restored %d messages for %d users", len(rows), len(self._entries))
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            added, self._added = self._added, []
+            removed, self._removed = self._removed, []
+            try:
+                if added:
+                    await self.db.digest_add_many(added)
+            except BaseException:
+                self._added[:0] = added
+                self._removed[:0] = removed
+                raise
+            try:
+                if removed:
+                    await self.db.digest_remove_many(removed)
+            except BaseException:
+                self._removed[:0] = removed
+                raise
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:      # noqa: BLE001
+                log.error("Digest buffer flush failed: %s", e)
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._flush_loop()),
+                asyncio.create_task(self._emit_loop()),
+            ]
+
+    async def stop(self) -> None:
+        """Stop emitting; whatever is buffered stays in the table for next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.flush()
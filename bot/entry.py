@@ -7,7 +7,12 @@ Keep this file tiny: all heavy logic lives in the routers or helpers.
 from __future__ import annotations
 
 import asyncio
-import logging
+import signal
+import time
+from pathlib import Path
+
+from bot.bootstrap import startup     # first: times the imports below
+from bot.profiling import LoopLagMonitor, profile_loop
 
 from aiogram import Bot, Dispatcher, Router, types
 from aiogram.client.default import DefaultBotProperties
@@ -16,16 +21,21 @@ from aiogram.enums import ParseMode
 from bot import runtime as r
 
 from bot.config import settings
-from bot.logger import logger
+from bot.logger import logger, setup_logging
 from bot.forwarding import ForwardManager
+from bot.outbound import OutboundSender
 
+from bot.routers.conversation import router as conversation_router
+from bot.routers.admin import router as admin_router
 from bot.routers.auth import router as auth_router
 from bot.routers.sources import router as sources_router
 from bot.routers.targets import router as targets_router
 from bot.routers.filters import router as filters_router
+from bot.routers.bulk    import router as bulk_router
 from bot.routers.misc    import router as misc_router
 
 from bot.middlewares.error_logger import ErrorLogger
+from bot.middlewares.timing import HandlerTimer
 
 # ----------------------------------------------------------------------------
 # Instantiate core services (singletons shared across the package)
@@ -36,6 +46,16 @@ bot = Bot(
     settings.BOT_TOKEN,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML),
 )
+# Every Bot API call goes through one rate-limited, retrying sender
+r.outbound = OutboundSender(
+    global_rate=settings.OUTBOUND_GLOBAL_RATE,
+    chat_rate=settings.OUTBOUND_CHAT_RATE,
+    group_per_min=settings.OUTBOUND_GROUP_PER_MIN,
+    burst=settings.OUTBOUND_BURST,
+    max_retries=settings.OUTBOUND_MAX_RETRIES,
+    max_retry_after=settings.OUTBOUND_MAX_RETRY_AFTER,
+)
+bot.session.middleware(r.outbound)
 dp = Dispatcher()
 
 # --------------------------------------------------------------
@@ -44,32 +64,77 @@ dp = Dispatcher()
 
 dp.message.middleware(ErrorLogger())          # log any exception in message handlers
 dp.callback_query.middleware(ErrorLogger())   # ...and in callback handlers
+dp.message.middleware(HandlerTimer())         # per-route latency / error metrics
+dp.callback_query.middleware(HandlerTimer())
 
+dp.include_router(admin_router)          # admin-only commands
+dp.include_router(conversation_router)   # multi-step flows first
 dp.include_router(auth_router)
 dp.include_router(sources_router)
 dp.include_router(targets_router)
 dp.include_router(filters_router)
+dp.include_router(bulk_router)
 dp.include_router(misc_router)
 
+startup.mark("wire dispatcher")
+
 # ----------------------------------------------------------------------------
 # Startup / shutdown helpers
 # ----------------------------------------------------------------------------
 
+async def _notify_user(uid: int, text: str) -> None:
+    await bot.send_message(uid, text)
+
+
 async def _on_startup():
     await r.db.init()
-    r.forwarder = ForwardManager(r.db, r.auth)
+    startup.mark("db init")
+    r.auth.load_status_index()
+    r.forwarder = ForwardManager(r.db, r.auth, notify=_notify_user)
+    r.forwarder.start()
+    startup.mark("services")
+    # Reconnecting every user's client can take a while; don't hold up polling
+    r.resume_task = asyncio.create_task(r.forwarder.resume_all())
+
+
+@dp.startup()
+async def _on_polling_started():
+    startup.mark("polling started")
+    logger.info("Startup: %s", startup.report())
+
+
+def _start_diagnostics() -> None:
+    """Loop-lag monitor + SIGUSR1 profiler; both live for the whole process."""
+    if settings.LOOP_LAG_THRESHOLD > 0:
+        r.loop_monitor = LoopLagMonitor(threshold=settings.LOOP_LAG_THRESHOLD)
+        r.loop_monitor.start()
+
+    async def _profile_to_file() -> None:
+        folded = await profile_loop(settings.PROFILE_SECONDS)
+        path = Path(settings.LOG_FILE).parent / time.strftime("profile-%Y%m%d-%H%M%S.folded")
+        path.write_text(folded)
+        logger.info("Profile written to %s", path)
+
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGUSR1, lambda: asyncio.create_task(_profile_to_file())
+        )
+    except (NotImplementedError, AttributeError):   # Windows
+        pass
 
 
 async def _on_shutdown() -> None:
+    if r.resume_task and not r.resume_task.done():
+        r.resume_task.cancel()
     if r.forwarder:
         await r.forwarder.stop_all()
     logger.info("Bot stopped")
 
 
 async def main() -> None:
-    # Stream logs to stdout (visible in Docker)
-    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
-
+    setup_logging()
+    startup.mark("logging")
+    _start_diagnostics()
     await _on_startup()
     try:
         await dp.start_polling(bot)
@@ -77,5 +142,18 @@ async def main() -> None:
         await _on_shutdown()
 
 
-if __name__ == "__main__":
+def run() -> None:
+    """Run main() on uvloop when it is installed and UVLOOP isn't disabled."""
+    if settings.UVLOOP:
+        try:
+            import uvloop
+        except ImportError:
+            pass
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            startup.mark("uvloop")
     asyncio.run(main())
+
+
+if __name__ == "__main__":
+    run()
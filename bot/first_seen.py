@@ -0,0 +1,190 @@
+"""First-seen index of token addresses, per user.
+
+In "first" filter mode a message is forwarded only if it mentions an address
+(or, lacking one, a $TICKER) the user hasn't seen within FIRST_SEEN_WINDOW
+seconds. Keys are stored as 64-bit hashes in one insertion-ordered dict per
+user, so a lookup is a single dict probe and expiry / eviction only ever
+looks at the oldest entry. Each user holds at most FIRST_SEEN_MAX keys.
+
+A sighting made for a message that still has to be delivered is held as a
+claim on that message: it suppresses repeats right away, but is only
+persisted once the delivery went through (`confirm`), and is taken back if
+the message is given up on (`release`), so an address whose first mention was
+never delivered isn't muted for the rest of the window.
+
+New sightings are buffered and written to the `first_seen` table in one
+transaction per flush, and loaded back on start, so a restart doesn't
+re-forward everything seen in the last window.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .db import Database
+
+log = logging.getLogger(__name__)
+
+Claim = Tuple[int, int, int]        # (tg_id, chat_id, msg_id) of the message
+
+
+def key_hash(key: str) -> int:
+    """Stable signed 64-bit hash (fits an SQLite INTEGER)."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+class FirstSeenIndex:
+    def __init__(
+        self,
+        db: Database,
+        window: float = 86_400,
+        max_per_user: int = 20_000,
+        flush_interval: float = 5.0,
+        flush_size: int = 1000,
+    ):
+        self.db = db
+        self.window = window
+        self.max_per_user = max_per_user
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        # uid → key hash → first-seen time, oldest first
+        self._seen: Dict[int, "OrderedDict[int, float]"] = {}
+        self._pending: List[Tuple[int, int, float]] = []
+        # Sightings of messages not delivered yet: claim → [(key hash, time)]
+        self._claims: Dict[Claim, List[Tuple[int, float]]] = {}
+        self._kick = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+
+    def _expire(self, seen: "OrderedDict[int, float]", now: float) -> None:
+        cutoff = now - self.window
+        while seen:
+            h, ts = next(iter(seen.items()))
+            if ts > cutoff and len(seen) <= self.max_per_user:
+                break
+            seen.popitem(last=False)
+
+    def check(self, uid: int, keys: Iterable[str], claim: Optional[Claim] = None) -> bool:
+        """
+        Record `keys` for `uid`; True if at least one of them is new.
+
+        A key keeps its original first-seen time, so a token that is mentioned
+        all day still only comes through once per window. With `claim`, new
+        keys wait for confirm() / release() of that message before they are
+        persisted.
+        """
+        now = time.time()
+        seen = self._seen.get(uid)
+        if seen is None:
+            seen = self._seen[uid] = OrderedDict()
+        fresh = False
+        for key in keys:
+            h = key_hash(key)
+            ts = seen.get(h)
+            if ts is not None and ts > now - self.window:
+                continue
+            seen.pop(h, None)           # an expired entry goes back to the end
+            seen[h] = now
+            if claim is None:
+                self._pending.append((uid, h, now))
+            else:
+                self._claims.setdefault(claim, []).append((h, now))
+            fresh = True
+        self._expire(seen, now)
+        if len(self._pending) >= self.flush_size:
+            self._kick.set()
+        if fresh:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return fresh
+
+    def confirm(self, claim: Claim) -> None:
+        """The claiming message was delivered: its sightings become permanent."""
+        for h, ts in self._claims.pop(claim, ()):
+            self._pending.append((claim[0], h, ts))
+
+    def release(self, claim: Claim) -> None:
+        """The claiming message won't be delivered: its keys count as unseen again."""
+        sightings = self._claims.pop(claim, None)
+        seen = self._seen.get(claim[0])
+        if not sightings or seen is None:
+            return
+        for h, ts in sightings:
+            if seen.get(h) == ts:       # not re-seen by a later message meanwhile
+                del seen[h]
+
+    def release_user(self, uid: int) -> None:
+        for claim in [c for c in self._claims if c[0] == uid]:
+            self.release(claim)
+
+    def forget(self, uid: int) -> None:
+        self._seen.pop(uid, None)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._seen),
+            "keys": sum(len(s) for s in self._seen.values()),
+            "claimed": len(self._claims),
+            "new": self.misses,
+            "repeats": self.hits,
+        }
+
+    # ----------------------------- persistence --------------------------------
+    async def load(self) -> None:
+        """Fill the index from the table, dropping rows older than the window."""
+        cutoff = time.time() - self.window
+        await self.db.first_seen_prune(cutoff)
+        loaded = 0
+        for uid, h, ts in await self.db.first_seen_load(cutoff):
+            seen = self._seen.get(uid)
+            if seen is None:
+                seen = self._seen[uid] = OrderedDict()
+            if h not in seen:
+                seen[h] = ts
+                loaded += 1
+        for seen in self._seen.values():
+            self._expire(seen, time.time())
+        log.info("First-seen index loaded %d keys for %d users", loaded, len(self._seen))
+
+    async def flush(self) -> None:
+        rows, self._pending = self._pending, []
+        if not rows:
+            return
+        try:
+            await self.db.first_seen_add_many(rows)
+        except BaseException:
+            self._pending[:0] = rows
+            raise
+
+    async def _flush_loop(self) -> None:
+        last_prune = time.time()
+        while True:
+            try:
+                await asyncio.wait_for(self._kick.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._kick.clear()
+            try:
+                await self.flush()
+                if time.time() - last_prune > self.window / 24:
+                    last_prune = time.time()
+                    await self.db.first_seen_prune(last_prune - self.window)
+            except Exception as e:      # noqa: BLE001
+                log.error("First-seen flush failed: %s", e)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
@@ -2,31 +2,467 @@
 alive as long as the user is authenticated and has at least one source + target."""
 from __future__ import annotations
 import asyncio
+import html
 import logging
-from typing import Dict, Tuple
+import random
+from typing import Awaitable, Callable, Dict
 
-from telethon import events, TelegramClient
+from telethon import events, TelegramClient, utils
+from telethon.errors import (
+    AuthKeyDuplicatedError,
+    AuthKeyUnregisteredError,
+    FileReferenceExpiredError,
+    FileReferenceInvalidError,
+    MessageNotModifiedError,
+    SessionExpiredError,
+    SessionRevokedError,
+    UserDeactivatedBanError,
+    UserDeactivatedError,
+)
+from telethon.helpers import generate_random_long
+from telethon.tl import functions, types
 from telethon.tl.custom import Message
 
+from .breaker import CLOSED, HALF_OPEN, SOURCE_OR_TARGET_ERRORS, TARGET_ERRORS, TargetBreaker
+from .config import settings
+from .copying import FileRefRefresher, copy_request, sent_message_id
 from .db import Database, Source, Target
+from .digest import DigestBuffer, DigestEntry, compose_digest
+from .first_seen import FirstSeenIndex
+from .ledger import MessageLedger
+from .outbox import Key, Outbox
+from .recorder import UpdateRecorder
+from .registry import NO_TOPICS, ClientHealth, UserRegistry, UserRuntime, compact_ids, sender_allowed
+from .scheduler import FairScheduler, Job
 from .auth import AuthManager
-from .utils import contains_token_related
+from .utils import contains_token_related, extract_token_keys
 
 log = logging.getLogger(__name__)
 
+# Messages outside any forum thread live in the "General" topic, whose id is 1.
+GENERAL_TOPIC_ID = 1
+
+# The session is gone for good; reconnecting cannot help
+SESSION_DEAD_ERRORS = (
+    AuthKeyUnregisteredError,
+    AuthKeyDuplicatedError,
+    SessionRevokedError,
+    SessionExpiredError,
+    UserDeactivatedError,
+    UserDeactivatedBanError,
+)
+
+
+# Deletions outside channels carry no chat id, so one chat-less builder can
+# serve every client (_on_delete filters by itself)
+_DELETED = events.MessageDeleted()
+
+
+class _Handlers:
+    """
+    Event callbacks of one user's client. Bound methods of this small object
+    take less than half the memory of three functools.partial objects.
+    """
+
+    __slots__ = ("fm", "tg_id", "rt")
+
+    def __init__(self, fm: "ForwardManager", tg_id: int, rt: UserRuntime):
+        self.fm = fm
+        self.tg_id = tg_id
+        self.rt = rt
+
+    def new(self, event):
+        return self.fm._on_message(self.tg_id, self.rt, event)
+
+    def edited(self, event):
+        return self.fm._on_edit(self.tg_id, self.rt, event)
+
+    def deleted(self, event):
+        return self.fm._on_delete(self.tg_id, self.rt, event)
+
+
+def message_topic_id(msg: Message) -> int:
+    """Return the forum topic a message belongs to (General when not threaded)."""
+    reply = msg.reply_to
+    if reply is None or not getattr(reply, "forum_topic", False):
+        return GENERAL_TOPIC_ID
+    return reply.reply_to_top_id or reply.reply_to_msg_id
+
 
 class ForwardManager:
-    def __init__(self, db: Database, auth: AuthManager):
+    def __init__(
+        self,
+        db: Database,
+        auth: AuthManager,
+        notify: Callable[[int, str], Awaitable[None]] | None = None,
+    ):
         self.db = db
         self.auth = auth
-        # Keep track of the live TelegramClient and its run task per user
-        self._clients: Dict[int, Tuple[TelegramClient, asyncio.Task]] = {}
+        # Sends a bot message to a user (revoked session, dead target notices)
+        self.notify = notify
+        # Everything held per user: live runtime, refresh lock/timer, health
+        self.users = UserRegistry()
+        self._file_refs = FileRefRefresher()
+        # Matching messages are queued per user and delivered fairly
+        self.scheduler = FairScheduler(
+            self._deliver_job,
+            workers=settings.FORWARD_WORKERS,
+            max_queue=settings.FORWARD_QUEUE_MAX,
+            default_quota=settings.FORWARD_QUOTA_PER_MIN,
+        )
+        # ...after being persisted, so a crash or redeploy doesn't lose them
+        self.outbox = Outbox(db, max_attempts=settings.OUTBOX_MAX_ATTEMPTS)
+        self._retry_task: asyncio.Task | None = None
+        # Token keys already forwarded, for the "first mention only" filter
+        self.first_seen = FirstSeenIndex(
+            db, window=settings.FIRST_SEEN_WINDOW, max_per_user=settings.FIRST_SEEN_MAX
+        )
+        # Targets in 'digest' mode get periodic summaries instead of forwards
+        self.digest = DigestBuffer(
+            db,
+            self._send_digest,
+            interval=settings.DIGEST_INTERVAL,
+            max_messages=settings.DIGEST_MAX_MESSAGES,
+            max_buffer=settings.DIGEST_BUFFER_MAX,
+        )
+        # Source → target message ids, to mirror edits and deletions
+        self.ledger = MessageLedger(
+            db, retention=settings.LEDGER_RETENTION, hot_max=settings.LEDGER_HOT_MAX
+        )
+        self._mirror_tasks: set[asyncio.Task] = set()
+        # Opt-in capture of the incoming update stream (tools/replay_updates.py)
+        self.recorder = UpdateRecorder(settings.RECORD_UPDATES) if settings.RECORD_UPDATES else None
+        # Config changes are debounced into one rebuild per user, one at a time
+        self._refresh_tasks: set[asyncio.Task] = set()
+        self.refresh_counts = {"requested": 0, "rebuilds": 0, "coalesced": 0}
+        self._closing = False
+
+    # ----------------------------- helpers ------------------------------------
+    async def _resolve_runtime(
+        self, tg_id: int, client: TelegramClient, sources: list[Source], target: Target
+    ) -> UserRuntime | None:
+        """Resolve every InputPeer up front so the hot path never looks one up."""
+        try:
+            target_peer = await client.get_input_entity(target.chat_id)
+        except Exception as e:
+            log.warning("Cannot resolve target %s for %s: %s", target.chat_id, tg_id, e)
+            return None
+
+        rt = UserRuntime(
+            client=client, target_peer=target_peer, top_msg_id=target.topic_id, mode=target.mode
+        )
+        topics: Dict[int, set[int] | None] = {}
+        for src in sources:
+            try:
+                peer = await client.get_input_entity(src.chat_id)
+            except Exception as e:
+                log.warning("Cannot resolve source %s for %s: %s", src.chat_id, tg_id, e)
+                continue
+            chat_id = utils.get_peer_id(peer)
+            rt.source_peers[chat_id] = peer
+            if src.topic_id is None:
+                topics[chat_id] = None              # whole chat wins over topics
+            elif chat_id not in topics or topics[chat_id] is not None:
+                topics.setdefault(chat_id, set()).add(src.topic_id)
+
+        # Whole-chat sources are simply absent: .get() gives None for them too
+        rt.source_topics = {cid: frozenset(t) for cid, t in topics.items() if t is not None} or NO_TOPICS
+        return rt if rt.source_peers else None
+
+    async def _forward(
+        self, rt: UserRuntime, chat_id: int, msg_id: int, drop_author: bool = False
+    ) -> int | None:
+        """Forward one message; returns its id in the target (None if unknown)."""
+        random_id = generate_random_long()
+        result = await rt.client(functions.messages.ForwardMessagesRequest(
+            from_peer=rt.source_peers[chat_id],
+            id=[msg_id],
+            to_peer=rt.target_peer,
+            random_id=[random_id],
+            top_msg_id=rt.top_msg_id,
+            drop_author=drop_author or None,
+        ))
+        return sent_message_id(result, random_id)
+
+    async def _copy(self, rt: UserRuntime, chat_id: int, msg: Message) -> int | None:
+        """Re-send msg by reference; refresh its file reference once if it expired."""
+        try:
+            request = copy_request(msg, rt.target_peer, rt.top_msg_id)
+        except TypeError:
+            # Media we can't rebuild (e.g. quizzes) – let Telegram copy it server-side
+            return await self._forward(rt, chat_id, msg.id, drop_author=True)
+        try:
+            result = await rt.client(request)
+        except (FileReferenceExpiredError, FileReferenceInvalidError):
+            fresh = await self._file_refs.refresh(rt.client, rt.source_peers[chat_id], msg.id)
+            if fresh is None:
+                raise
+            request = copy_request(fresh, rt.target_peer, rt.top_msg_id)
+            result = await rt.client(request)
+        return sent_message_id(result, request.random_id)
+
+    async def _deliver(self, rt: UserRuntime, job: Job) -> int | None:
+        if rt.mode != "copy":
+            return await self._forward(rt, job.chat_id, job.msg_id)
+        msg = job.msg
+        if msg is None:
+            # Replayed from the outbox – copy mode needs the content back
+            msg = await self._file_refs.refresh(rt.client, rt.source_peers[job.chat_id], job.msg_id)
+            if msg is None:
+                return None     # deleted at the source meanwhile
+        return await self._copy(rt, job.chat_id, msg)
+
+    async def _deliver_job(self, tg_id: int, job: Job):
+        """Scheduler callback: deliver with whatever runtime the user has *now*."""
+        key = (tg_id, job.chat_id, job.msg_id)
+        rt = self.users.runtime(tg_id)
+        if rt is None:
+            self.outbox.release(key)    # user offline; the retry loop picks it up later
+            return
+        if job.chat_id not in rt.source_peers:
+            self.outbox.done(key)       # source removed while queued
+            self.first_seen.release(key)
+            return
+        breaker = self._breaker(tg_id, rt)
+        if breaker is not None and not breaker.allow():
+            # Target known dead: park it until the next probe, no API call
+            breaker.parked += 1
+            self.outbox.defer(key, breaker.retry_at, breaker.last_error or "target unavailable")
+            return
+        probe = breaker is not None and breaker.state == HALF_OPEN
+        try:
+            target_msg = await self._deliver(rt, job)
+            self.outbox.done(key)
+            self.first_seen.confirm(key)
+            if target_msg is not None:
+                self.ledger.record(tg_id, job.chat_id, job.msg_id, utils.get_peer_id(rt.target_peer), target_msg)
+            log.info("Message forwarded for %s", tg_id)
+            if breaker is not None and breaker.success():
+                log.info("Target %s of %s is reachable again", breaker.target, tg_id)
+                await self.outbox.wake(tg_id)
+        except TARGET_ERRORS as e:
+            breaker = breaker or self._breaker(tg_id, rt, create=True)
+            if not await self._target_at_fault(rt, breaker, e):
+                self._job_failed(tg_id, key, job, e)    # the source's problem
+                return
+            await self._target_failed(tg_id, breaker, e)
+            if breaker.state != CLOSED and not probe:
+                breaker.parked += 1
+                self.outbox.defer(key, breaker.retry_at, str(e))
+            else:
+                # A failed probe still costs the row an attempt, so it cannot loop forever
+                self._job_failed(tg_id, key, job, e)
+        except Exception as e:
+            self._job_failed(tg_id, key, job, e)
+
+    def _job_failed(self, tg_id: int, key: Key, job: Job, error: Exception):
+        if self.outbox.fail(key, job.attempts, str(error)):
+            log.error("Forward dead-lettered for %s (msg %s): %s", tg_id, job.msg_id, error)
+            self.first_seen.release(key)
+        else:
+            log.warning("Forward failed for %s: %s", tg_id, error)
+
+    # ----------------------------- circuit breaker ----------------------------
+    def _breaker(self, tg_id: int, rt: UserRuntime, create: bool = False) -> TargetBreaker | None:
+        """
+        The breaker guarding rt's target. Most targets never fail, so one is
+        only made (`create`) on the first target error; a changed target
+        starts afresh.
+        """
+        slot = self.users.slot(tg_id)
+        target = utils.get_peer_id(rt.target_peer)
+        breaker = slot.breaker
+        if breaker is not None and breaker.target != target:
+            breaker = slot.breaker = None
+        if breaker is None and create:
+            breaker = slot.breaker = TargetBreaker(
+                target,
+                threshold=settings.BREAKER_THRESHOLD,
+                backoff_base=settings.BREAKER_BACKOFF,
+                backoff_max=settings.BREAKER_BACKOFF_MAX,
+            )
+        return breaker
+
+    def _target_open(self, tg_id: int) -> bool:
+        slot = self.users.get(tg_id)
+        return slot is not None and slot.breaker is not None and slot.breaker.state != CLOSED
+
+    async def _target_at_fault(self, rt: UserRuntime, breaker: TargetBreaker, error: Exception) -> bool:
+        """
+        Is `error` about the target? Lookup errors may come from the forward's
+        source just as well; before one opens (or keeps open) the breaker,
+        a read of the target settles it.
+        """
+        if not isinstance(error, SOURCE_OR_TARGET_ERRORS) or not breaker.would_trip():
+            return True
+        try:
+            await rt.client(functions.messages.GetPeerDialogsRequest([types.InputDialogPeer(rt.target_peer)]))
+        except TARGET_ERRORS:
+            return True
+        except Exception as e:      # noqa: BLE001
+            log.info("Could not check target %s: %s", breaker.target, e)
+        return False
+
+    async def _target_failed(self, tg_id: int, breaker: TargetBreaker, error: Exception):
+        """Count a target error; the first time the breaker opens, tell the user."""
+        if not breaker.failure(f"{type(error).__name__}: {error}"):
+            if breaker.state != CLOSED:
+                log.info("Target %s of %s still failing, next probe in %.0fs", breaker.target, tg_id, breaker.backoff)
+            return
+        log.warning(
+            "Target %s of %s failed %d times in a row (%s), pausing deliveries",
+            breaker.target, tg_id, breaker.failures, error,
+        )
+        if self.notify:
+            reason = html.escape(str(error), quote=False)
+            try:
+                await self.notify(
+                    tg_id,
+                    f"⚠️ Forwarding to your target ({breaker.target}) keeps failing: {reason}\n"
+                    "New messages are held and delivery is retried from time to time. "
+                    "Check that the chat still exists and that you may post there, "
+                    "or choose another target.",
+                )
+            except Exception as e:      # noqa: BLE001
+                log.warning("Could not notify %s about the failing target: %s", tg_id, e)
+
+    async def _retry_loop(self):
+        """Re-queue outbox rows that are due: startup replay and failed retries."""
+        while True:
+            try:
+                for row in await self.outbox.due([uid for uid, _ in self.users.runtimes()]):
+                    key = (row.tg_id, row.chat_id, row.msg_id)
+                    self.outbox.claim(key)
+                    job = Job(row.chat_id, row.msg_id, attempts=row.attempts)
+                    if not self.scheduler.submit(row.tg_id, job):
+                        self.outbox.release(key)
+            except Exception as e:      # noqa: BLE001
+                log.error("Outbox replay failed: %s", e)
+            await asyncio.sleep(settings.OUTBOX_RETRY_INTERVAL)
 
     # ----------------------------- public API ---------------------------------
-    async def refresh_user(self, tg_id: int):
+    def start(self):
+        """Spin up the delivery workers; call once the event loop is running."""
+        self.outbox.start()
+        self.first_seen.start()
+        self.digest.start()
+        self.ledger.start()
+        if self.recorder:
+            self.recorder.start()
+        self.scheduler.start()
+        self._retry_task = asyncio.create_task(self._retry_loop())
+
+    async def resume_all(self):
+        """Restart forwarding for every configured user with a live session."""
+        try:
+            await self.first_seen.load()    # before any handler can consult it
+        except Exception as e:      # noqa: BLE001
+            log.error("Could not load the first-seen index: %s", e)
+        try:
+            await self.digest.load()
+        except Exception as e:      # noqa: BLE001
+            log.error("Could not restore the digest buffer: %s", e)
+        try:
+            await self.ledger.load()
+        except Exception as e:      # noqa: BLE001
+            log.error("Could not load the message ledger: %s", e)
+        for uid in await self.db.list_configured_users():
+            try:
+                await self.refresh_user(uid, immediate=True)
+            except Exception as e:      # noqa: BLE001
+                log.warning("Could not resume forwarding for %s: %s", uid, e)
+
+    def queue_stats(self, tg_id: int) -> dict:
+        """Pending count, dispatched/dropped totals and wait times for one user."""
+        return dict(self.scheduler.stats(tg_id), digest=self.digest.pending(tg_id))
+
+    async def _send_digest(self, tg_id: int, entries: list[DigestEntry], dropped: int) -> bool:
+        """DigestBuffer callback: post the summary to the user's target."""
+        rt = self.users.runtime(tg_id)
+        if rt is None:
+            return False            # offline; kept until the client is back
+        breaker = self._breaker(tg_id, rt)
+        if breaker is not None and not breaker.allow():
+            return False            # target down; kept until it is back
+        titles = {s.chat_id: s.title for s in await self.db.list_sources(tg_id)}
+        sent: list[DigestEntry] = []
+        try:
+            for text, listed in compose_digest(entries, titles, dropped):
+                await rt.client.send_message(
+                    rt.target_peer, text, reply_to=rt.top_msg_id, parse_mode="html", link_preview=False
+                )
+                sent += listed
+        except TARGET_ERRORS as e:
+            await self._target_failed(tg_id, breaker or self._breaker(tg_id, rt, create=True), e)
+            raise
+        finally:
+            # A later chunk failed: the retry only resends what is left
+            self.digest.delivered(tg_id, sent)
+        if breaker is not None and breaker.success():
+            await self.outbox.wake(tg_id)
+        return True
+
+    async def refresh_user(self, tg_id: int, immediate: bool = False):
+        """
+        Ask for the user's forwarder to be rebuilt from their current config.
+
+        Requests are debounced: the rebuild runs REFRESH_DEBOUNCE seconds after
+        the last request (at most REFRESH_MAX_DELAY after the first), so a
+        burst of menu clicks costs a single reconnect. `immediate=True`
+        rebuilds now and waits for it.
+        """
+        self.refresh_counts["requested"] += 1
+        if self._closing:
+            return
+        slot = self.users.slot(tg_id)
+        first = slot.refresh_first
+        if slot.cancel_refresh():
+            self.refresh_counts["coalesced"] += 1
+            slot.refresh_folded += 1
+        if immediate:
+            await self._rebuild_locked(tg_id)
+            return
+
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot.refresh_first = first = first or now
+        due = min(now + settings.REFRESH_DEBOUNCE, first + settings.REFRESH_MAX_DELAY)
+        slot.refresh_timer = loop.call_at(due, self._fire_refresh, tg_id)
+
+    def _fire_refresh(self, tg_id: int):
+        slot = self.users.slot(tg_id)
+        slot.refresh_timer, slot.refresh_first = None, 0.0
+        task = asyncio.create_task(self._rebuild_locked(tg_id))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _rebuild_locked(self, tg_id: int):
+        slot = self.users.slot(tg_id)
+        async with slot.lock:
+            if self._closing:
+                return
+            self.refresh_counts["rebuilds"] += 1
+            folded, slot.refresh_folded = slot.refresh_folded, 0
+            try:
+                await self._rebuild(tg_id)
+            except Exception as e:      # noqa: BLE001
+                log.warning("Forwarder rebuild failed for %s: %s", tg_id, e)
+                return
+            finally:
+                if self.users.runtime(tg_id) is None:
+                    self._forget_queue(tg_id)   # config incomplete or not authorised
+            if folded:
+                log.info("Rebuilt forwarder for %s (coalesced %d requests)", tg_id, folded)
+
+    def refresh_stats(self) -> dict:
+        """Refresh requests, actual rebuilds and how many requests were folded."""
+        pending = sum(1 for _, s in self.users.items() if s.refresh_timer is not None)
+        return dict(self.refresh_counts, pending=pending)
+
+    async def _rebuild(self, tg_id: int):
         """(Re)start the forwarder task for a user if they have valid config."""
-        if tg_id in self._clients:
-            await self.stop_user(tg_id)
+        if self.users.runtime(tg_id) is not None:
+            await self._stop(tg_id)
 
         sources: list[Source] = await self.db.list_sources(tg_id)
         target: Target | None = await self.db.get_target(tg_id)
@@ -34,50 +470,387 @@ class ForwardManager:
             return  # nothing to do yet
 
         client = self.auth.client(tg_id)
-        await client.start()
+        if not client.is_connected():
+            await client.connect()
+        authorized = await client.is_user_authorized()
+        self.auth.set_status(tg_id, authorized)
+        if not authorized:
+            log.info("Session of %s is not authorised, not forwarding", tg_id)
+            await self.auth.discard_client(tg_id, client)
+            return
+
+        rt = await self._resolve_runtime(tg_id, client, sources, target)
+        if rt is None:
+            return
+
+        rt.filter_mode = await self.db.get_filter_mode(tg_id)
+        rt.allowed_senders = compact_ids(await self.db.list_filtered_users(tg_id))
+        tier, quota = await self.db.get_user_limits(tg_id)
+        self.scheduler.configure(tg_id, tier, quota)
+        self._attach(tg_id, rt)
+
+        self.users.slot(tg_id).runtime = rt
+        rt.task = asyncio.create_task(self._supervise(tg_id, rt))
+        breaker = self._breaker(tg_id, rt)
+        if breaker is not None and breaker.state != CLOSED:
+            # The user changed something – maybe fixed the target; check now
+            breaker.probe_now()
+            await self.outbox.wake(tg_id)
+        log.info("Forward loop started for %s", tg_id)
 
-        filter_mode = await self.db.get_filter_mode(tg_id)
-        filtered_ids = await self.db.list_filtered_users(tg_id)
+    def _attach(self, tg_id: int, rt: UserRuntime):
+        """Register rt's handlers on its client."""
+        h = _Handlers(self, tg_id, rt)
+        rt.handlers = (h.new, h.edited, h.deleted)
+        chats = frozenset(rt.source_peers)
+        new, edited = events.NewMessage(chats=chats), events.MessageEdited(chats=chats)
+        # The chats are marked ids already: resolving would only copy them into
+        # a set (plus a lock) per builder, so both share this one instead
+        new.resolved = edited.resolved = True
+        rt.client.add_event_handler(rt.handlers[0], new)
+        rt.client.add_event_handler(rt.handlers[1], edited)
+        rt.client.add_event_handler(rt.handlers[2], _DELETED)
 
-        async def _handler(event: events.NewMessage.Event):
-            msg: Message = event.message
+    async def _on_message(self, tg_id: int, rt: UserRuntime, event: events.NewMessage.Event):
+        """NewMessage handler for one user's sources; everything it needs is on rt."""
+        msg: Message = event.message
+        if self.recorder:
+            self.recorder.message("n", tg_id, event.chat_id, msg)
 
-            # 1️⃣ Optional user‑ID filter
-            if filtered_ids and (msg.from_id is None or msg.from_id.user_id not in filtered_ids):
+        # 0️⃣ Topic filter for sources pinned to a forum thread
+        topics = rt.source_topics.get(event.chat_id)
+        if topics is not None and message_topic_id(msg) not in topics:
+            return
+
+        # 1️⃣ Optional user‑ID filter
+        if rt.allowed_senders is not None and not sender_allowed(
+            rt.allowed_senders, getattr(msg.from_id, "user_id", None)
+        ):
+            return
+
+        # 2️⃣ Content filter
+        if rt.filter_mode == "first":
+            keys = extract_token_keys(msg.raw_text)
+            # Digests are buffered durably; a forward holds its keys until delivered
+            claim = None if rt.mode == "digest" else (tg_id, event.chat_id, msg.id)
+            if not keys or not self.first_seen.check(tg_id, keys, claim):
                 return
+        elif rt.filter_mode != "all" and not contains_token_related(msg.raw_text):
+            return
+
+        if rt.mode == "digest":
+            self.digest.add(tg_id, event.chat_id, msg)
+            return
+
+        key = (tg_id, event.chat_id, msg.id)
+        self.outbox.add(key)
+        if not self.scheduler.submit(tg_id, Job(event.chat_id, msg.id, msg)):
+            self.outbox.release(key)    # stays in the outbox, retried later
+            log.warning("Queue full for %s, deferring message %s", tg_id, msg.id)
+
+    # ----------------------------- mirroring ----------------------------------
+    async def _on_edit(self, tg_id: int, rt: UserRuntime, event: events.MessageEdited.Event):
+        """
+        Mirror an edit in a source onto the message it produced in the target.
+
+        Copies are edited in place. A forward can't be edited by the sender, so
+        the edited message is forwarded again and the stale forward deleted.
+        """
+        msg: Message = event.message
+        if self.recorder:
+            self.recorder.message("e", tg_id, event.chat_id, msg)
+        if msg.edit_date is None or msg.edit_hide:
+            return              # reactions, view counts and the like
+        if self._target_open(tg_id):
+            return              # target unreachable; not worth a call
+        entry = await self.ledger.get(tg_id, event.chat_id, msg.id)
+        if entry is None:
+            return
+        target_chat, target_msg = entry
+        if target_chat != utils.get_peer_id(rt.target_peer):
+            return              # forwarded to a target the user has since replaced
+        if not self.ledger.edit_is_new(tg_id, event.chat_id, msg.id, msg.edit_date.timestamp()):
+            return
+        try:
+            if rt.mode == "copy":
+                await rt.client(functions.messages.EditMessageRequest(
+                    peer=rt.target_peer, id=target_msg, message=msg.message, entities=msg.entities,
+                ))
+            else:
+                fresh = await self._forward(rt, event.chat_id, msg.id)
+                if fresh is not None:
+                    self.ledger.record(tg_id, event.chat_id, msg.id, target_chat, fresh)
+                self._queue_delete(tg_id, rt, target_msg)
+            log.info("Edit of message %s mirrored for %s", msg.id, tg_id)
+        except MessageNotModifiedError:
+            pass
+        except Exception as e:      # noqa: BLE001
+            log.warning("Mirroring edit of %s failed for %s: %s", msg.id, tg_id, e)
+
+    async def _on_delete(self, tg_id: int, rt: UserRuntime, event: events.MessageDeleted.Event):
+        """Delete what the deleted source messages produced in the target."""
+        if event.chat_id is not None and event.chat_id not in rt.source_peers:
+            return
+        if self.recorder:
+            self.recorder.deleted(tg_id, event.chat_id, event.deleted_ids)
+        target_chat = utils.get_peer_id(rt.target_peer)
+        for msg_id in event.deleted_ids:
+            entry = await self.ledger.get(tg_id, event.chat_id, msg_id)
+            if entry is None:
+                continue
+            self.ledger.forget(tg_id, event.chat_id, msg_id)
+            if entry[0] == target_chat:
+                self._queue_delete(tg_id, rt, entry[1])
+
+    def _queue_delete(self, tg_id: int, rt: UserRuntime, target_msg: int):
+        """Collect target ids for LEDGER_DELETE_DELAY, then delete them in one call."""
+        if rt.pending_deletes is None:
+            rt.pending_deletes = []
+            task = asyncio.create_task(self._delete_later(tg_id, rt))
+            self._mirror_tasks.add(task)
+            task.add_done_callback(self._mirror_tasks.discard)
+        rt.pending_deletes.append(target_msg)
+
+    async def _delete_later(self, tg_id: int, rt: UserRuntime):
+        await asyncio.sleep(settings.LEDGER_DELETE_DELAY)
+        ids, rt.pending_deletes = rt.pending_deletes, None
+        if self._target_open(tg_id):
+            log.info("Dropping %d mirrored deletions for %s, target unreachable", len(ids), tg_id)
+            return
+        try:
+            await rt.client.delete_messages(rt.target_peer, ids)
+            log.info("Mirrored %d deletions for %s", len(ids), tg_id)
+        except Exception as e:      # noqa: BLE001
+            log.warning("Mirroring %d deletions failed for %s: %s", len(ids), tg_id, e)
+
+    # ----------------------------- supervision --------------------------------
+    def _reconnect_delay(self, attempt: int) -> float:
+        """Exponential backoff capped at RECONNECT_MAX, jittered over its upper half."""
+        cap = min(settings.RECONNECT_MAX, settings.RECONNECT_BASE * 2 ** attempt)
+        return random.uniform(cap / 2, cap)
+
+    async def _supervise(self, tg_id: int, rt: UserRuntime):
+        """
+        Keep rt.client connected for as long as rt is the user's live runtime.
+
+        Telethon retries dropped connections itself; this covers the cases where
+        run_until_disconnected() gives up or raises. Event handlers stay
+        registered on the client, so a reconnect resumes delivery as is.
+        """
+        slot = self.users.slot(tg_id)
+        health = slot.health = slot.health or ClientHealth()
+        health.revoked = False
+        attempt = 0
+        while True:
+            if rt.client.is_connected():
+                health.up()
+                try:
+                    await rt.client.run_until_disconnected()
+                    error = "disconnected"
+                except SESSION_DEAD_ERRORS as e:
+                    await self._session_revoked(tg_id, rt, type(e).__name__)
+                    return
+                except Exception as e:      # noqa: BLE001
+                    error = f"{type(e).__name__}: {e}"
+                health.down(error if slot.runtime is rt else None)
+            if slot.runtime is not rt:
+                return              # stopped or rebuilt on purpose
 
-            # 2️⃣ Content filter
-            if filter_mode != "all" and not contains_token_related(msg.raw_text):
+            delay = self._reconnect_delay(attempt)
+            log.warning(
+                "Client of %s lost (%s); reconnecting in %.1fs (attempt %d)",
+                tg_id, health.last_error, delay, attempt + 1,
+            )
+            await asyncio.sleep(delay)
+            if slot.runtime is not rt:
                 return
+            try:
+                await rt.client.connect()
+                authorized = await rt.client.is_user_authorized()
+            except SESSION_DEAD_ERRORS as e:
+                await self._session_revoked(tg_id, rt, type(e).__name__)
+                return
+            except Exception as e:      # noqa: BLE001
+                health.last_error = f"{type(e).__name__}: {e}"
+                attempt += 1
+                continue
+            if not authorized:
+                await self._session_revoked(tg_id, rt, "no longer authorised")
+                return
+            attempt = 0
+            health.reconnects += 1
+            log.info("Client of %s reconnected (%d so far)", tg_id, health.reconnects)
 
+    async def _session_revoked(self, tg_id: int, rt: UserRuntime, reason: str):
+        """The user logged the session out elsewhere: stop for good and tell them."""
+        slot = self.users.slot(tg_id)
+        health = slot.health = slot.health or ClientHealth()
+        health.down(f"session revoked ({reason})")
+        health.revoked = True
+        if slot.runtime is rt:
+            slot.runtime = None
+        for handler in rt.handlers:
+            rt.client.remove_event_handler(handler)
+        rt.handlers = ()
+        self._forget_queue(tg_id)
+        log.warning("Session of %s was revoked: %s", tg_id, reason)
+        await self.abandon_outbox(tg_id, f"session revoked ({reason})")
+        try:
+            await self.auth.logout(tg_id)
+        except Exception as e:      # noqa: BLE001
+            log.warning("Cleaning up revoked session of %s failed: %s", tg_id, e)
+        if self.notify:
             try:
-                await client.forward_messages(
-                    entity=(target.chat_id, target.topic_id) if target.topic_id else target.chat_id,
-                    messages=msg,
+                await self.notify(
+                    tg_id,
+                    "⚠️ Your Telegram session was ended (logged out from another "
+                    "device?). Forwarding is paused – log in again to resume.",
                 )
-                log.info("Message forwarded for %s", tg_id)
-            except Exception as e:
-                log.warning("Forward failed for %s: %s", tg_id, e)
+            except Exception as e:      # noqa: BLE001
+                log.warning("Could not notify %s about the revoked session: %s", tg_id, e)
 
-        for src in sources:
-            chat = (src.chat_id, src.topic_id) if src.topic_id else src.chat_id
-            client.add_event_handler(_handler, events.NewMessage(chats=chat))
+    def health(self, tg_id: int) -> dict | None:
+        """Connection health for one user, None if their client never ran."""
+        slot = self.users.get(tg_id)
+        return slot.health.as_dict() if slot and slot.health else None
 
-        task = asyncio.create_task(client.run_until_disconnected())
-        self._clients[tg_id] = (client, task)
-        log.info("Forward loop started for %s", tg_id)
+    def target_state(self, tg_id: int) -> dict | None:
+        """Circuit breaker of the user's target, None before the first delivery."""
+        slot = self.users.get(tg_id)
+        return slot.breaker.as_dict() if slot and slot.breaker else None
+
+    def all_health(self) -> Dict[int, dict]:
+        return {uid: s.health.as_dict() for uid, s in self.users.items() if s.health}
+
+    def memory_report(self) -> dict:
+        """Bytes held per user by the forwarder's registry (see registry.py)."""
+        return self.users.memory_report()
 
     async def stop_user(self, tg_id: int):
-        entry = self._clients.pop(tg_id, None)
-        if not entry:
+        """
+        Stop forwarding for a user now, dropping any pending rebuild. Their
+        slot goes as well unless something else is already waiting on it.
+        """
+        slot = self.users.get(tg_id)
+        if slot is None:
             return
-        client, task = entry
-        if client.is_connected():
-            await client.disconnect()
-        if task and not task.done():
-            task.cancel()
+        slot.cancel_refresh()
+        slot.refresh_folded = 0
+        async with slot.lock:
+            await self._stop(tg_id)
+        self._forget_queue(tg_id)
+        self.users.discard(tg_id)
+
+    async def abandon_outbox(self, tg_id: int, reason: str):
+        """
+        Dead-letter a user's undelivered messages: once logged out nothing will
+        ever send them, and left pending they would be replayed forever.
+        """
+        self.first_seen.release_user(tg_id)
+        try:
+            await self.outbox.dead_letter_user(tg_id, reason)
+        except Exception as e:      # noqa: BLE001
+            log.error("Could not dead-letter the outbox of %s: %s", tg_id, e)
+
+    def _forget_queue(self, tg_id: int):
+        """Drop the user's scheduler queue; what it held stays in the outbox."""
+        for job in self.scheduler.forget(tg_id):
+            self.outbox.release((tg_id, job.chat_id, job.msg_id))
+
+    async def set_limits(self, tg_id: int, tier: str, quota_per_min: int | None):
+        """Store a user's scheduler tier / quota and apply it right away."""
+        await self.db.set_user_limits(tg_id, tier, quota_per_min)
+        if self.users.runtime(tg_id) is not None:
+            self.scheduler.configure(tg_id, tier, quota_per_min)
+
+    async def _stop(self, tg_id: int):
+        slot = self.users.get(tg_id)
+        rt = slot.runtime if slot else None
+        if not rt:
+            return
+        slot.runtime = None
+        for handler in rt.handlers:
+            rt.client.remove_event_handler(handler)
+        if rt.client.is_connected():
+            await rt.client.disconnect()
+        if rt.task and not rt.task.done():
+            rt.task.cancel()
+        if slot.health:
+            slot.health.down()
         log.info("Forward loop stopped for %s", tg_id)
 
-    async def stop_all(self):
-        for uid in list(self._clients.keys()):
-            await self.stop_user(uid)
+    async def stop_all(self, deadline: float | None = None) -> tuple[int, int]:
+        """
+        Graceful shutdown, bounded by `deadline` seconds overall.
+
+        1. stop accepting new events (handlers detached, clients stay online)
+        2. drain queued forwards until empty or 60% of the budget is spent
+        3. send pending mirrored deletions and flush the write buffers
+        4. disconnect every client concurrently
+
+        Each phase only gets what is left of the budget, so a slow disk or
+        client cannot push shutdown past the container's stop timeout.
+
+        Returns (drained, abandoned) message counts.
+        """
+        deadline = settings.SHUTDOWN_DEADLINE if deadline is None else deadline
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        self._closing = True
+        for _, slot in self.users.items():
+            slot.cancel_refresh()
+        for task in self._refresh_tasks:
+            task.cancel()
+
+        for _, rt in self.users.runtimes():
+            for handler in rt.handlers:
+                rt.client.remove_event_handler(handler)
+            rt.handlers = ()
+
+        if self._retry_task:
+            self._retry_task.cancel()
+        # Every phase gets what is left of the budget; ~20% is kept back for
+        # disconnecting, which the final flushes may not eat into
+        end = started + deadline
+        reserve = deadline * 0.2
+
+        def left(keep: float = 0.0) -> float:
+            return max(0.0, end - keep - loop.time())
+
+        drained, abandoned = await self.scheduler.drain(deadline * 0.6)
+        await self.scheduler.stop()
+        if self._mirror_tasks:
+            # Deletions collected just before shutdown are still sent, if time allows
+            _, late = await asyncio.wait(
+                set(self._mirror_tasks), timeout=min(settings.LEDGER_DELETE_DELAY + 1, left(reserve))
+            )
+            for task in late:
+                task.cancel()
+        stops = [
+            ("outbox", self.outbox.stop),       # abandoned rows are replayed on next start
+            ("first-seen", self.first_seen.stop),
+            ("digest buffer", self.digest.stop),    # pending digests are sent after restart
+            ("message ledger", self.ledger.stop),
+        ]
+        if self.recorder:
+            stops.append(("update recording", self.recorder.stop))
+        for name, stop in stops:
+            try:
+                await asyncio.wait_for(stop(), left(reserve))
+            except asyncio.TimeoutError:
+                log.error("Final %s flush did not finish within the shutdown deadline", name)
+            except Exception as e:      # noqa: BLE001
+                log.error("Final %s flush failed: %s", name, e)
+
+        stops = [self.stop_user(uid) for uid, _ in self.users.runtimes()]
+        try:
+            await asyncio.wait_for(asyncio.gather(*stops, return_exceptions=True), left())
+        except asyncio.TimeoutError:
+            log.warning("Some clients did not disconnect within the shutdown deadline")
+
+        log.info(
+            "Forwarder stopped in %.1fs: %d drained, %d abandoned",
+            loop.time() - started, drained, abandoned,
+        )
+        return drained, abandoned
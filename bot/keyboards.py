@@ -1,16 +1,118 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+# Rows per page in list keyboards (Telegram allows 100 buttons per markup)
+PAGE_SIZE = 8
+
+# Target delivery modes (bot.db.DELIVERY_MODES) as shown to users
+DELIVERY_MODE_LABELS = {
+    "forward": "Forward",
+    "copy": "Copy (no forward header)",
+    "digest": "Digest (periodic summary)",
+}
 
-def main_menu() -> InlineKeyboardBuilder:
+# Content filter modes (bot.db.FILTER_MODES) as shown to users
+FILTER_MODE_LABELS = {
+    "all": "All messages",
+    "token": "Token-related only",
+    "first": "First mention of each token only",
+}
+
+
+@lru_cache(maxsize=None)
+def main_menu() -> InlineKeyboardMarkup:
+    """The main menu never changes, so it is built once and shared."""
     kb = InlineKeyboardBuilder()
     kb.button(text="➕ Add source", callback_data="add_src")
     kb.button(text="📚 Manage sources", callback_data="mgr_src")
     kb.button(text="🎯 Set target", callback_data="set_tgt")
+    kb.button(text="📨 Forward / copy", callback_data="toggle_delivery")
     kb.button(text="👤 Add filtered user", callback_data="add_filter")
     kb.button(text="👥 Manage filtered users", callback_data="mgr_filter")
     kb.button(text="🛠️ Toggle filter", callback_data="toggle_mode")
     kb.button(text="📄 View config", callback_data="view_cfg")
+    kb.button(text="📥 Import list", callback_data="import_cfg")
+    kb.button(text="📤 Export list", callback_data="export_cfg")
     kb.button(text="❤️ Donate", callback_data="donate")
     kb.button(text="🔒 Log out", callback_data="logout")
     kb.adjust(2)
-    return kb
+    return kb.as_markup()
+
+
+# -----------------------------------------------------------------------------
+# Paginated list keyboards
+# -----------------------------------------------------------------------------
+
+Item = Tuple[str, str]      # (button text, callback data)
+
+
+def page_count(items: List[Item]) -> int:
+    return max(1, -(-len(items) // PAGE_SIZE))
+
+
+def paginated_kb(items: List[Item], page_prefix: str, page: int) -> InlineKeyboardMarkup:
+    """
+    One page of `items` plus a ◀️ n/m ▶️ row; page buttons send
+    "<page_prefix>:<page>".
+    """
+    pages = page_count(items)
+    page = min(max(page, 0), pages - 1)
+    rows = [
+        [InlineKeyboardButton(text=text, callback_data=data)]
+        for text, data in items[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+    ]
+    if pages > 1:
+        rows.append([
+            InlineKeyboardButton(text="◀️", callback_data=f"{page_prefix}:{(page - 1) % pages}"),
+            InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data="noop"),
+            InlineKeyboardButton(text="▶️", callback_data=f"{page_prefix}:{(page + 1) % pages}"),
+        ])
+    rows.append([InlineKeyboardButton(text="⬅️ Back", callback_data="back_main")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+class KeyboardCache:
+    """
+    Per-user cache of list keyboards, keyed by (uid, kind).
+
+    Holds the item list loaded from the DB plus every page rendered from it;
+    routers call invalidate() whenever the underlying rows change. Least
+    recently used users are dropped beyond `max_users`.
+    """
+
+    def __init__(self, max_users: int = 1000):
+        self.max_users = max_users
+        self._data: "OrderedDict[Tuple[int, str], Tuple[List[Item], Dict[int, InlineKeyboardMarkup]]]" = OrderedDict()
+
+    def items(self, uid: int, kind: str) -> List[Item] | None:
+        entry = self._data.get((uid, kind))
+        if entry is None:
+            return None
+        self._data.move_to_end((uid, kind))
+        return entry[0]
+
+    def store(self, uid: int, kind: str, items: List[Item]) -> None:
+        self._data[(uid, kind)] = (items, {})
+        self._data.move_to_end((uid, kind))
+        while len(self._data) > self.max_users:
+            self._data.popitem(last=False)
+
+    def page(self, uid: int, kind: str, page_prefix: str, page: int) -> InlineKeyboardMarkup:
+        items, pages = self._data[(uid, kind)]
+        page = min(max(page, 0), page_count(items) - 1)
+        markup = pages.get(page)
+        if markup is None:
+            markup = pages[page] = paginated_kb(items, page_prefix, page)
+        return markup
+
+    def invalidate(self, uid: int, kind: str) -> None:
+        self._data.pop((uid, kind), None)
+
+
+kb_cache = KeyboardCache()
@@ -0,0 +1,161 @@
+"""Ledger of forwarded messages: source message → the message it produced.
+
+Every successful forward / copy records (tg_id, source chat, source msg) →
+(target chat, target msg), so edits and deletions in the source can be
+mirrored onto the target. The newest LEDGER_HOT_MAX mappings live in one
+insertion-ordered dict, so the lookup for a fresh edit or deletion is a single
+dict probe. Older ones fall back to the primary-key lookup in the
+`message_ledger` table, but only once the window has actually dropped
+something, so deleting messages that were never forwarded costs nothing.
+Inserts are buffered and written in one transaction per flush, and rows older
+than LEDGER_RETENTION are pruned.
+
+Telegram only says which chat a deletion happened in for channels and
+supergroups. Everywhere else message ids come from one per-account sequence,
+so those sources are all keyed under chat 0 (see `ledger_chat`).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from .db import Database
+
+log = logging.getLogger(__name__)
+
+Key = Tuple[int, int, int]          # (tg_id, ledger chat, msg_id)
+Entry = Tuple[int, int]             # (target chat, target msg)
+
+
+def ledger_chat(chat_id: Optional[int]) -> int:
+    """Chat part of a ledger key: the marked id for channels, else 0."""
+    return chat_id if chat_id is not None and chat_id < -10**12 else 0
+
+
+class MessageLedger:
+    def __init__(
+        self,
+        db: Database,
+        retention: float = 7 * 86_400,
+        hot_max: int = 100_000,
+        flush_interval: float = 2.0,
+        flush_size: int = 1000,
+    ):
+        self.db = db
+        self.retention = retention
+        self.hot_max = hot_max
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._hot: "OrderedDict[Key, Entry]" = OrderedDict()
+        self._complete = True       # nothing evicted yet: a miss is definitive
+        # last mirrored edit_date per message, so reaction / view-count updates
+        # (which arrive as edits too) are not mirrored again
+        self._edits: "OrderedDict[Key, float]" = OrderedDict()
+        self._added: List[Tuple[int, int, int, int, int, float]] = []
+        self._removed: List[Key] = []
+        self._kick = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+
+    # ----------------------------- hot path -----------------------------------
+    def record(self, tg_id: int, chat_id: int, msg_id: int, target_chat: int, target_msg: int) -> None:
+        key = (tg_id, ledger_chat(chat_id), msg_id)
+        self._hot.pop(key, None)
+        self._hot[key] = (target_chat, target_msg)
+        if len(self._hot) > self.hot_max:
+            self._hot.popitem(last=False)
+            self._complete = False
+        self._added.append((*key, target_chat, target_msg, time.time()))
+        if len(self._added) >= self.flush_size:
+            self._kick.set()
+
+    async def get(self, tg_id: int, chat_id: Optional[int], msg_id: int) -> Optional[Entry]:
+        key = (tg_id, ledger_chat(chat_id), msg_id)
+        entry = self._hot.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        if self._complete:
+            return None
+        return await self.db.ledger_get(*key)
+
+    def forget(self, tg_id: int, chat_id: Optional[int], msg_id: int) -> None:
+        key = (tg_id, ledger_chat(chat_id), msg_id)
+        self._hot.pop(key, None)
+        self._edits.pop(key, None)
+        self._removed.append(key)
+
+    def edit_is_new(self, tg_id: int, chat_id: int, msg_id: int, edit_date: float) -> bool:
+        """True once per distinct edit_date of a message."""
+        key = (tg_id, ledger_chat(chat_id), msg_id)
+        if self._edits.get(key) == edit_date:
+            return False
+        self._edits.pop(key, None)
+        self._edits[key] = edit_date
+        if len(self._edits) > self.hot_max // 10 + 1:
+            self._edits.popitem(last=False)
+        return True
+
+    def stats(self) -> dict:
+        return {"hot": len(self._hot), "hits": self.hits, "misses": self.misses}
+
+    # ----------------------------- persistence --------------------------------
+    async def load(self) -> None:
+        """Warm the hot window with the newest rows still within retention."""
+        cutoff = time.time() - self.retention
+        await self.db.ledger_prune(cutoff)
+        for tg_id, chat, msg, target_chat, target_msg, _ in await self.db.ledger_load(cutoff, self.hot_max):
+            self._hot[(tg_id, chat, msg)] = (target_chat, target_msg)
+        self._complete = len(self._hot) < self.hot_max
+        log.info("Message ledger loaded %d recent mappings", len(self._hot))
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            added, self._added = self._added, []
+            removed, self._removed = self._removed, []
+            try:
+                if added:
+                    await self.db.ledger_add_many(added)
+            except BaseException:
+                self._added[:0] = added
+                self._removed[:0] = removed
+                raise
+            try:
+                if removed:
+                    await self.db.ledger_remove_many(removed)
+            except BaseException:
+                self._removed[:0] = removed
+                raise
+
+    async def _flush_loop(self) -> None:
+        last_prune = time.time()
+        while True:
+            try:
+                await asyncio.wait_for(self._kick.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._kick.clear()
+            try:
+                await self.flush()
+                if time.time() - last_prune > self.retention / 24:
+                    last_prune = time.time()
+                    await self.db.ledger_prune(last_prune - self.retention)
+            except Exception as e:      # noqa: BLE001
+                log.error("Message ledger flush failed: %s", e)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
@@ -3,12 +3,19 @@ from logging.handlers import RotatingFileHandler
 from pathlib import Path
 from .config import settings
 
-Path(settings.LOG_FILE).parent.mkdir(parents=True, exist_ok=True)
+logger = logging.getLogger("bot")
 
-handler = RotatingFileHandler(settings.LOG_FILE, maxBytes=2_000_000, backupCount=5)
-handler.setFormatter(logging.Formatter("%(asctime)s | %(levelname)-8s | %(name)s | %(message)s"))
 
-logging.basicConfig(level=logging.INFO, handlers=[handler])
-logging.getLogger("aiogram.dispatcher").setLevel(logging.DEBUG)
-logging.getLogger("telethon").setLevel(logging.INFO)
-logger = logging.getLogger("bot")
+def setup_logging() -> None:
+    """Rotating file + stdout (visible in Docker); called once from bot.entry.main."""
+    Path(settings.LOG_FILE).parent.mkdir(parents=True, exist_ok=True)
+    fmt = logging.Formatter("%(asctime)s | %(levelname)-8s | %(name)s | %(message)s")
+
+    handler = RotatingFileHandler(settings.LOG_FILE, maxBytes=2_000_000, backupCount=5)
+    handler.setFormatter(fmt)
+    stream = logging.StreamHandler()
+    stream.setFormatter(fmt)
+
+    logging.basicConfig(level=logging.INFO, handlers=[handler, stream])
+    logging.getLogger("aiogram.dispatcher").setLevel(logging.DEBUG)
+    logging.getLogger("telethon").setLevel(logging.INFO)
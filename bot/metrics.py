@@ -0,0 +1,151 @@
+"""Per-route handler latency histograms, in-process.
+
+Routes are labelled "<router>/<action>" (e.g. "sources/del_src:",
+"auth//start"). Each route keeps fixed-bucket histograms for total, DB and
+Telethon time, plus call / error / in-flight counters. DB and Telethon time
+are attributed through a context variable that the timing middleware opens
+per update and that `io_timer` adds to, so nested helpers need no plumbing.
+"""
+from __future__ import annotations
+
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Upper bounds in ms; the last bucket is +inf
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# kind ("db" / "telethon") → seconds spent during the current update
+_io: ContextVar[Optional[Dict[str, float]]] = ContextVar("handler_io", default=None)
+
+
+class Histogram:
+    __slots__ = ("counts", "total")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.total += ms
+
+    def quantile(self, q: float) -> float:
+        """Upper bound (ms) of the bucket holding the q-quantile."""
+        n = sum(self.counts)
+        if not n:
+            return 0.0
+        rank, seen = q * n, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else float("inf")
+        return float("inf")
+
+
+@dataclass
+class RouteStats:
+    calls: int = 0
+    errors: int = 0
+    in_flight: int = 0
+    total: Histogram = field(default_factory=Histogram)
+    db: Histogram = field(default_factory=Histogram)
+    telethon: Histogram = field(default_factory=Histogram)
+
+    def as_dict(self) -> dict:
+        def h(x: Histogram) -> dict:
+            mean = x.total / self.calls if self.calls else 0.0
+            return {"mean": mean, "p50": x.quantile(0.5), "p95": x.quantile(0.95), "p99": x.quantile(0.99)}
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": self.errors / self.calls if self.calls else 0.0,
+            "in_flight": self.in_flight,
+            "total_ms": h(self.total),
+            "db_ms": h(self.db),
+            "telethon_ms": h(self.telethon),
+        }
+
+
+class HandlerMetrics:
+    def __init__(self):
+        self.routes: Dict[str, RouteStats] = {}
+
+    def route(self, label: str) -> RouteStats:
+        stats = self.routes.get(label)
+        if stats is None:
+            stats = self.routes[label] = RouteStats()
+        return stats
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {label: s.as_dict() for label, s in sorted(self.routes.items())}
+
+    def render(self) -> str:
+        """Plain-text table, slowest p95 first."""
+        rows: List[str] = [
+            f"{'route':<28}{'calls':>7}{'err%':>6}{'busy':>5}"
+            f"{'p50':>7}{'p95':>7}{'db95':>7}{'tg95':>7}"
+        ]
+        by_p95 = sorted(self.routes.items(), key=lambda kv: kv[1].total.quantile(0.95), reverse=True)
+        for label, s in by_p95:
+            err = 100 * s.errors / s.calls if s.calls else 0.0
+            rows.append(
+                f"{label[:27]:<28}{s.calls:>7}{err:>6.1f}{s.in_flight:>5}"
+                f"{s.total.quantile(0.5):>7g}{s.total.quantile(0.95):>7g}"
+                f"{s.db.quantile(0.95):>7g}{s.telethon.quantile(0.95):>7g}"
+            )
+        return "\n".join(rows)
+
+    def reset(self) -> None:
+        self.routes.clear()
+
+
+metrics = HandlerMetrics()
+
+
+@contextmanager
+def io_scope():
+    """Open a fresh DB/Telethon accumulator for the current update."""
+    acc = {"db": 0.0, "telethon": 0.0}
+    token = _io.set(acc)
+    try:
+        yield acc
+    finally:
+        _io.reset(token)
+
+
+@contextmanager
+def io_timer(kind: str):
+    """Attribute the wrapped block's wall time to `kind` of the current update."""
+    acc = _io.get()
+    if acc is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        acc[kind] = acc.get(kind, 0.0) + time.perf_counter() - start
+
+
+def instrument(kind: str):
+    """Class decorator: time every public coroutine method as `kind` I/O."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        async def timed(*args, **kwargs):
+            with io_timer(kind):
+                return await fn(*args, **kwargs)
+        return timed
+
+    def decorator(cls):
+        for name, fn in list(vars(cls).items()):
+            if not name.startswith("_") and inspect.iscoroutinefunction(fn):
+                setattr(cls, name, wrap(fn))
+        return cls
+    return decorator
@@ -0,0 +1,57 @@
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message
+
+from bot.metrics import io_scope, metrics
+
+
+def route_label(event, data) -> str:
+    """
+    "<router>/<action>": router module of the handler + callback prefix or command.
+
+    Only commands a Command filter matched (it puts `command` into data) get
+    their own label; anything else a user types after "/" is "/other", so
+    made-up commands can't add routes without bound.
+    """
+    fn = data.get("state_handler")
+    if fn is None:
+        handler = data.get("handler")
+        fn = handler.callback if handler else None
+    router = fn.__module__.rsplit(".", 1)[-1] if fn else "?"
+
+    if isinstance(event, CallbackQuery):
+        raw = event.data or ""
+        prefix, sep, _ = raw.partition(":")
+        action = prefix + sep
+    elif isinstance(event, Message):
+        text = event.text or ""
+        if text.startswith("/"):
+            command = data.get("command")
+            action = f"/{command.command}" if command is not None else "/other"
+        else:
+            action = "document" if event.document else "text"
+    else:
+        action = type(event).__name__
+    return f"{router}/{action}"
+
+
+class HandlerTimer(BaseMiddleware):
+    """Records latency (total / DB / Telethon), in-flight and errors per route."""
+
+    async def __call__(self, handler, event, data):
+        stats = metrics.route(route_label(event, data))
+        stats.calls += 1
+        stats.in_flight += 1
+        start = time.perf_counter()
+        with io_scope() as io:
+            try:
+                return await handler(event, data)
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                stats.in_flight -= 1
+                stats.total.observe((time.perf_counter() - start) * 1000)
+                stats.db.observe(io["db"] * 1000)
+                stats.telethon.observe(io["telethon"] * 1000)
@@ -0,0 +1,243 @@
+"""Outbound Bot API layer: rate limits, flood-wait retries, edit coalescing.
+
+`OutboundSender` is a request middleware on the bot's session, so every call
+the routers make (`message.answer`, `edit_reply_markup`, `answer_photo`, the
+forwarder's notices, ...) goes through it without changing a call site.
+
+Methods addressed to a chat wait for two token buckets before they are sent:
+the chat's own (OUTBOUND_CHAT_RATE/s in private chats, OUTBOUND_GROUP_PER_MIN
+in groups, both allowing OUTBOUND_BURST at once) and the bot-wide one
+(OUTBOUND_GLOBAL_RATE/s). Calls to one chat are sent one at a time, in order.
+A 429 pauses that chat for its retry_after and the call is retried; network
+and 5xx errors are retried with a short backoff, OUTBOUND_MAX_RETRIES times –
+but only for methods that are safe to repeat. A send/forward/copy may have
+gone through before the connection broke, so those fail instead of posting
+the message twice.
+
+editMessageReplyMarkup calls for a message that already has one waiting are
+folded into it: the waiting request is sent with the newest markup and every
+caller gets its result. Paging through a list quickly then costs one edit per
+free slot rather than one per click.
+
+Methods without a chat (getUpdates, answerCallbackQuery, ...) pass straight
+through; callback answers must be quick and are not flood-limited per chat.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple, Union
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import EditMessageReplyMarkup, Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from .metrics import Histogram
+
+log = logging.getLogger(__name__)
+
+ChatId = Union[int, str]
+
+# Methods that post a new message: not retried after an unconfirmed attempt
+_POSTING = ("send", "forward", "copy")
+
+
+def _repeatable(method: TelegramMethod) -> bool:
+    name = method.__api_method__
+    return not name.startswith(_POSTING) or name == "sendChatAction"
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "stamp", "paused_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available (0 = take one now)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def take(self) -> None:
+        while True:
+            delay = self.delay(time.monotonic())
+            if not delay:
+                self.tokens -= 1
+                return
+            await asyncio.sleep(delay)
+
+    def idle(self, now: float) -> bool:
+        return now >= self.paused_until and self.delay(now) == 0 and self.tokens >= self.capacity
+
+
+class _ChatLane:
+    """Bucket and ordering lock of one chat."""
+
+    __slots__ = ("bucket", "lock")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.lock = asyncio.Lock()
+
+
+class _PendingEdit:
+    __slots__ = ("method", "future")
+
+    def __init__(self, method: EditMessageReplyMarkup, future: asyncio.Future):
+        self.method = method
+        self.future = future
+
+
+class OutboundSender(BaseRequestMiddleware):
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        group_per_min: float = 20,
+        burst: float = 3,
+        max_retries: int = 3,
+        max_retry_after: float = 60,
+    ):
+        self.chat_rate = chat_rate
+        self.group_rate = group_per_min / 60
+        self.burst = burst
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self._global = TokenBucket(global_rate, global_rate)
+        self._lanes: Dict[ChatId, _ChatLane] = {}
+        self._edits: Dict[Tuple[ChatId, int], _PendingEdit] = {}
+        self.waiting = 0
+        self.wait_ms = Histogram()
+        self.counts = {"sent": 0, "retried": 0, "flood_waits": 0, "coalesced": 0, "failed": 0}
+
+    # ----------------------------- lanes --------------------------------------
+    def _lane(self, chat_id: ChatId) -> _ChatLane:
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            if len(self._lanes) >= 10_000:
+                self._prune()
+            group = isinstance(chat_id, str) or chat_id < 0
+            lane = self._lanes[chat_id] = _ChatLane(
+                TokenBucket(self.group_rate if group else self.chat_rate, self.burst)
+            )
+        return lane
+
+    def _prune(self) -> None:
+        """Forget chats whose bucket is full again and that nobody is waiting on."""
+        now = time.monotonic()
+        for chat_id, lane in list(self._lanes.items()):
+            if not lane.lock.locked() and lane.bucket.idle(now):
+                del self._lanes[chat_id]
+
+    # ----------------------------- sending ------------------------------------
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+        if isinstance(method, EditMessageReplyMarkup) and method.message_id is not None:
+            return await self._edit(make_request, bot, method, chat_id)
+        return await self._send(make_request, bot, method, chat_id)
+
+    async def _send(self, make_request, bot, method, chat_id: ChatId, pending: Optional[_PendingEdit] = None):
+        lane = self._lane(chat_id)
+        queued = time.monotonic()
+        self.waiting += 1
+        waited = False
+        try:
+            async with lane.lock:
+                attempt = 0
+                while True:
+                    await lane.bucket.take()
+                    await self._global.take()
+                    if not waited:
+                        waited = True
+                        self.waiting -= 1
+                        self.wait_ms.observe((time.monotonic() - queued) * 1000)
+                        if pending is not None:
+                            # Last moment to fold in newer markup; later edits start afresh
+                            self._edits.pop((chat_id, method.message_id), None)
+                            method = pending.method
+                    try:
+                        response = await make_request(bot, method)
+                        self.counts["sent"] += 1
+                        return response
+                    except TelegramRetryAfter as e:
+                        self.counts["flood_waits"] += 1
+                        if attempt >= self.max_retries or e.retry_after > self.max_retry_after:
+                            self.counts["failed"] += 1
+                            raise
+                        log.warning(
+                            "Flood wait %ss on %s in chat %s", e.retry_after, type(method).__name__, chat_id
+                        )
+                        lane.bucket.paused_until = time.monotonic() + e.retry_after
+                    except (TelegramNetworkError, TelegramServerError) as e:
+                        # The request may have been carried out; resending could duplicate it
+                        if attempt >= self.max_retries or not _repeatable(method):
+                            self.counts["failed"] += 1
+                            raise
+                        log.warning(
+                            "%s failed (%s), retry %d/%d", type(method).__name__, e, attempt + 1, self.max_retries
+                        )
+                        await asyncio.sleep(2 ** attempt)
+                    attempt += 1
+                    self.counts["retried"] += 1
+        finally:
+            if not waited:
+                self.waiting -= 1
+
+    async def _edit(self, make_request, bot, method: EditMessageReplyMarkup, chat_id: ChatId):
+        key = (chat_id, method.message_id)
+        pending = self._edits.get(key)
+        if pending is not None:
+            pending.method = method
+            self.counts["coalesced"] += 1
+            return await asyncio.shield(pending.future)
+
+        pending = self._edits[key] = _PendingEdit(method, asyncio.get_running_loop().create_future())
+        try:
+            result = await self._send(make_request, bot, method, chat_id, pending)
+        except BaseException as e:
+            if self._edits.get(key) is pending:
+                del self._edits[key]
+            if isinstance(e, asyncio.CancelledError):
+                pending.future.cancel()
+            else:
+                pending.future.set_exception(e)
+                pending.future.exception()      # folded callers re-raise it; don't warn
+            raise
+        pending.future.set_result(result)
+        return result
+
+    # ----------------------------- metrics ------------------------------------
+    def stats(self) -> dict:
+        return dict(
+            self.counts,
+            waiting=self.waiting,
+            chats=len(self._lanes),
+            wait_p50=self.wait_ms.quantile(0.5),
+            wait_p95=self.wait_ms.quantile(0.95),
+        )
+
+    def render(self) -> str:
+        s = self.stats()
+        return (
+            f"bot api: {s['sent']} sent, {s['waiting']} waiting, wait p50 {s['wait_p50']:g} ms / "
+            f"p95 {s['wait_p95']:g} ms, {s['retried']} retried, {s['flood_waits']} flood waits, "
+            f"{s['coalesced']} edits coalesced, {s['failed']} failed"
+        )
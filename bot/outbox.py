@@ -0,0 +1,186 @@
+"""Durable outbox in front of the delivery scheduler.
+
+Every message a handler accepts is appended to the `outbox` table before it is
+queued; delivery removes the row, failure schedules a retry with exponential
+backoff, and after OUTBOX_MAX_ATTEMPTS the row is parked as 'dead'. Rows held
+back for a reason other than the message itself (an open circuit breaker, see
+breaker.py) are deferred without using up an attempt.
+
+Writes are buffered and flushed together (one transaction per flush), so
+the hot path only appends to a list. A crash loses at most one flush interval
+of accepted messages."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import List, Set, Tuple
+
+from .db import Database, OutboxEntry
+
+log = logging.getLogger(__name__)
+
+Key = Tuple[int, int, int]      # (tg_id, chat_id, msg_id)
+
+
+class Outbox:
+    def __init__(
+        self,
+        db: Database,
+        max_attempts: int = 5,
+        backoff_base: float = 5.0,
+        backoff_max: float = 900.0,
+        flush_interval: float = 0.2,
+        flush_size: int = 500,
+    ):
+        self.db = db
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+
+        self._added: List[Key] = []
+        self._done: List[Key] = []
+        self._failed: List[Tuple[str, float, str, int, int, int]] = []
+        self._deferred: List[Tuple[float, str, int, int, int]] = []
+        # Keys currently queued in memory, so due() never hands them out twice
+        self._in_flight: Set[Key] = set()
+        # Settled keys whose row update is still buffered: their rows still
+        # read as pending, so due() must skip them as well
+        self._settling: Set[Key] = set()
+        self._kick = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    # ----------------------------- hot path -----------------------------------
+    def add(self, key: Key) -> None:
+        self._in_flight.add(key)
+        self._added.append(key)
+        self._maybe_kick()
+
+    def _settle(self, key: Key) -> None:
+        self._in_flight.discard(key)
+        self._settling.add(key)
+
+    def done(self, key: Key) -> None:
+        self._settle(key)
+        self._done.append(key)
+        self._maybe_kick()
+
+    def fail(self, key: Key, attempts: int, error: str) -> bool:
+        """Record a failed attempt; True when the message was dead-lettered."""
+        self._settle(key)
+        attempts += 1
+        dead = attempts >= self.max_attempts
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        self._failed.append(
+            ("dead" if dead else "pending", time.time() + delay, error[:500], *key)
+        )
+        self._maybe_kick()
+        return dead
+
+    def defer(self, key: Key, until: float, reason: str) -> None:
+        """Hold a message back until `until` (wall clock); its attempts are kept."""
+        self._settle(key)
+        self._deferred.append((until, reason[:500], *key))
+        self._maybe_kick()
+
+    async def wake(self, tg_id: int) -> None:
+        """Make a user's deferred messages due now."""
+        await self.flush()
+        await self.db.outbox_wake(tg_id)
+
+    def release(self, key: Key) -> None:
+        """Forget a key without touching its row (it will be picked up by due())."""
+        self._in_flight.discard(key)
+
+    def _maybe_kick(self) -> None:
+        if len(self._added) + len(self._done) + len(self._failed) + len(self._deferred) >= self.flush_size:
+            self._kick.set()
+
+    # ----------------------------- persistence --------------------------------
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        added, self._added = self._added, []
+        done, self._done = self._done, []
+        failed, self._failed = self._failed, []
+        deferred, self._deferred = self._deferred, []
+        settled, self._settling = self._settling, set()
+        # Inserts first: a row may be delivered before its first flush.
+        # On error the unwritten batches go back to the front of their buffers.
+        steps = [
+            (added, self._added, self.db.outbox_add_many),
+            (done, self._done, self.db.outbox_done_many),
+            (failed, self._failed, self.db.outbox_fail_many),
+            (deferred, self._deferred, self.db.outbox_defer_many),
+        ]
+        for i, (batch, _, write) in enumerate(steps):
+            if not batch:
+                continue
+            try:
+                await write(batch)
+            except BaseException:
+                for pending, buf, _ in steps[i:]:
+                    buf[:0] = pending
+                self._settling |= settled
+                raise
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._kick.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._kick.clear()
+            try:
+                await self.flush()
+            except Exception as e:      # noqa: BLE001
+                log.error("Outbox flush failed: %s", e)
+
+    async def due(self, tg_ids: List[int], limit: int = 500) -> List[OutboxEntry]:
+        """
+        Pending rows of tg_ids ready for (re)delivery that aren't already queued.
+
+        Users are filtered in SQL, and queued rows are paged past, so rows
+        nobody can deliver never crowd out the ones that can be. Rows settled
+        while the query runs are skipped too: the flush lock is held
+        throughout, so their keys stay in _settling until it is over.
+        """
+        if not tg_ids:
+            return []
+        async with self._flush_lock:
+            await self._flush()
+            now = time.time()
+            due: List[OutboxEntry] = []
+            after = 0
+            while len(due) < limit:
+                rows = await self.db.outbox_due(now, limit, tg_ids, after)
+                busy = self._in_flight | self._settling
+                due.extend(r for r in rows if (r.tg_id, r.chat_id, r.msg_id) not in busy)
+                if len(rows) < limit:
+                    break
+                after = rows[-1].id
+        return due[:limit]
+
+    async def dead_letter_user(self, tg_id: int, reason: str) -> None:
+        """Give up on a user's undelivered messages (they logged out)."""
+        await self.flush()
+        await self.db.outbox_dead_letter_user(tg_id, reason)
+
+    def claim(self, key: Key) -> None:
+        self._in_flight.add(key)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
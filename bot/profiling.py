@@ -0,0 +1,130 @@
+"""In-process diagnostics for the single asyncio loop.
+
+• LoopLagMonitor – always-on watchdog. The loop bumps a heartbeat every
+  `interval`; a daemon thread notices when the beat is late by more than
+  `threshold` and logs the loop thread's current stack, i.e. the callback
+  that is blocking everyone else.
+• StartupTimer – wall-clock breakdown of import and startup phases.
+• sample_profile – on-demand sampling profiler. A thread snapshots the loop
+  thread's stack every few ms for N seconds and returns the samples in
+  "collapsed stack" format (`frame;frame;frame count` per line), which
+  flamegraph.pl, speedscope and inferno read directly.
+
+The monitor and the profiler only read sys._current_frames() from a side
+thread, so they need no restart and cost nothing on the loop itself."""
+from __future__ import annotations
+
+import asyncio
+import importlib
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from types import FrameType
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", code.co_filename)
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+def _collapse(frame: Optional[FrameType]) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def sample_profile(thread_id: int, seconds: float, interval: float = 0.005) -> str:
+    """Sample `thread_id` for `seconds`; return collapsed stacks (blocking)."""
+    counts: Counter[str] = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            counts[_collapse(frame)] += 1
+        time.sleep(interval)
+    return "\n".join(f"{stack} {n}" for stack, n in counts.most_common())
+
+
+async def profile_loop(seconds: float) -> str:
+    """Profile the running loop's thread for `seconds` without blocking it."""
+    thread_id = threading.get_ident()
+    return await asyncio.get_running_loop().run_in_executor(
+        None, sample_profile, thread_id, seconds
+    )
+
+
+class LoopLagMonitor:
+    def __init__(self, threshold: float = 0.25, interval: float = 0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._stop = threading.Event()
+
+    def _heartbeat(self) -> None:
+        self._beat = time.monotonic()
+        if not self._stop.is_set():
+            self._loop.call_later(self.interval, self._heartbeat)
+
+    def _watch(self) -> None:
+        reported = False
+        while not self._stop.wait(self.interval):
+            lag = time.monotonic() - self._beat - self.interval
+            if lag <= self.threshold:
+                reported = False
+                continue
+            self.max_lag = max(self.max_lag, lag)
+            if reported:
+                continue        # one report per stall
+            reported = True
+            self.stalls += 1
+            frame = sys._current_frames().get(self._thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<no frame>"
+            log.warning("Event loop blocked for %.0f ms; loop thread is at:\n%s", lag * 1000, stack)
+
+    def start(self) -> None:
+        """Start watching the running loop (call from inside it)."""
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._loop.call_soon(self._heartbeat)
+        threading.Thread(target=self._watch, name="loop-lag-monitor", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+class StartupTimer:
+    """Wall-clock time between successive mark() calls, reported as one line."""
+
+    def __init__(self):
+        self._start = self._last = time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+
+    def mark(self, phase: str) -> None:
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def imports(self, phase: str, *modules: str) -> None:
+        """Import `modules` now and mark the time taken as `phase`."""
+        for name in modules:
+            importlib.import_module(name)
+        self.mark(phase)
+
+    def report(self) -> str:
+        total = (self._last - self._start) * 1000
+        parts = " | ".join(f"{name} {secs * 1000:.0f} ms" for name, secs in self.phases)
+        return f"{total:.0f} ms total: {parts}"
@@ -0,0 +1,154 @@
+"""Opt-in recording of the update stream the forwarder sees, for offline replay.
+
+With RECORD_UPDATES set, every new / edited / deleted message reaching a
+user's source handlers is appended to that file as one compact JSON array per
+line. No text is stored: a message keeps its length, the shape of its
+entities (type, offset, length), media kind, album (`grouped_id`), forum topic,
+sender and arrival time, plus salted 64-bit hashes of the text and of each
+token key it mentions. The salt is random per recording and never written, so
+hashes only tell which texts / tokens repeat *within* a recording; that is
+what the content filters need to decide the same way on replay.
+
+tools/replay_updates.py feeds a recording back through the real pipeline.
+
+File layout (version 1):
+
+    {"v": 1, "started": <unix time>}                  header, once per run
+    ["n", ms, tg_id, chat_id, msg_id, sender, topic, grouped_id,
+          text_len, text_hash, entities, media, keys]  new message
+    ["e", ms, ... same fields ...]                     edited message
+    ["d", ms, tg_id, chat_id, [msg_id, ...]]           deleted messages
+
+`ms` counts from the header's `started`; entities are [type, offset, length]
+with the MessageEntity prefix dropped; keys are [kind, hash] with kind 'a'
+(address) or 't' ($TICKER).
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Iterator, List, Optional
+
+from telethon.tl.custom import Message
+
+from .utils import extract_token_keys
+
+log = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+
+def _message_fields(msg: Message) -> list:
+    reply = msg.reply_to
+    topic = None
+    if reply is not None and getattr(reply, "forum_topic", False):
+        topic = reply.reply_to_top_id or reply.reply_to_msg_id
+    entities = [
+        [type(e).__name__.removeprefix("MessageEntity"), e.offset, e.length]
+        for e in msg.entities or ()
+    ]
+    media = type(msg.media).__name__.removeprefix("MessageMedia").lower() if msg.media else None
+    return [
+        msg.id,
+        getattr(msg.from_id, "user_id", None),
+        topic,
+        msg.grouped_id,
+        len(msg.message or ""),
+        entities,
+        media,
+    ]
+
+
+class UpdateRecorder:
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._salt = os.urandom(16)
+        self._started = time.time()
+        self._lines: List[str] = [json.dumps({"v": FORMAT_VERSION, "started": self._started}) + "\n"]
+        self._task: asyncio.Task | None = None
+        self.recorded = 0
+
+    def _hash(self, text: str) -> int:
+        digest = hashlib.blake2b(text.encode(), digest_size=8, key=self._salt).digest()
+        return int.from_bytes(digest, "big", signed=True)
+
+    def _append(self, record: list) -> None:
+        self._lines.append(json.dumps(record, separators=(",", ":")) + "\n")
+        self.recorded += 1
+
+    def _ms(self) -> int:
+        return round((time.time() - self._started) * 1000)
+
+    # ----------------------------- hot path -----------------------------------
+    def message(self, kind: str, tg_id: int, chat_id: int, msg: Message) -> None:
+        """kind: 'n' for a new message, 'e' for an edit."""
+        text = msg.message or ""
+        msg_id, sender, topic, grouped, length, entities, media = _message_fields(msg)
+        keys = [
+            ["t" if k.startswith("$") else "a", self._hash(k)]
+            for k in sorted(extract_token_keys(text))
+        ]
+        self._append([
+            kind, self._ms(), tg_id, chat_id, msg_id, sender, topic, grouped,
+            length, self._hash(text) if text else None, entities, media, keys,
+        ])
+
+    def deleted(self, tg_id: int, chat_id: Optional[int], msg_ids: List[int]) -> None:
+        self._append(["d", self._ms(), tg_id, chat_id, list(msg_ids)])
+
+    # ----------------------------- file ---------------------------------------
+    def _write(self, chunk: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(chunk)
+
+    async def flush(self) -> None:
+        lines, self._lines = self._lines, []
+        if lines:
+            await asyncio.to_thread(self._write, "".join(lines))
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:      # noqa: BLE001
+                log.error("Writing the update recording failed: %s", e)
+
+    def start(self) -> None:
+        if self._task is None:
+            log.info("Recording source updates to %s", self.path)
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+def read_recording(path: str) -> Iterator[list]:
+    """
+    Records of a recording in order, `ms` made continuous across runs
+    appended to the same file (each run restarts its clock at its header).
+    """
+    offset = last = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, dict):
+                if record.get("v") != FORMAT_VERSION:
+                    raise ValueError(f"Unsupported recording version {record.get('v')!r}")
+                offset = last
+                continue
+            record[1] += offset
+            last = record[1]
+            yield record
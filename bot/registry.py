@@ -0,0 +1,273 @@
+"""Per-user runtime state of the forwarder, in one place.
+
+ForwardManager keeps a single `UserRegistry`: uid → `UserSlot`, and every
+per-user thing the forwarder holds hangs off that slot (live runtime with
+client, task, resolved peers and compiled filters; refresh lock and debounce
+timer; connection health; the target's circuit breaker, once it has failed).
+All records use __slots__, so a user costs a few fixed-size objects instead of
+a dict per attribute spread over half a dozen manager-level maps, and
+`memory_report()` can account for all of it.
+
+Slots are dropped again when a user stops or logs out (`discard`).
+
+Measured with tools/bench_registry.py against the original forwarder's own
+structures (`_clients` tuple, handler closure, one NewMessage builder per
+source), 10k users: with 3 sources the registry is 9% larger without a sender
+filter (2405 vs 2199 B/user) and 13% / 48% smaller with 20 / 100 filtered
+senders (2645 vs 3031, 3285 vs 6263); with a single source it is 85% larger
+(2109 vs 1143). The fixed part is what the old code didn't have: resolved
+peers, connection health, and the edit / delete handlers.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import sys
+from array import array
+from bisect import bisect_left
+import time
+import types
+from dataclasses import dataclass, field
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from telethon import TelegramClient
+from telethon.tl.types import TypeInputPeer
+
+from .breaker import TargetBreaker
+
+
+# A sender allowlist is a sorted array of 64-bit ids searched with bisect:
+# 8 B per id and no int objects, less than even the plain list it replaced
+SenderIds = array
+
+
+def compact_ids(ids: Iterable[int]) -> Optional[SenderIds]:
+    """An allowlist in its compact, searchable form; None if empty."""
+    unique = sorted(set(ids))
+    return array("q", unique) if unique else None
+
+
+def sender_allowed(allowed: SenderIds, sender_id: Optional[int]) -> bool:
+    if sender_id is None:
+        return False
+    i = bisect_left(allowed, sender_id)
+    return i < len(allowed) and allowed[i] == sender_id
+
+
+# Sources without topic restrictions all share this one (read-only) mapping
+NO_TOPICS: Mapping[int, FrozenSet[int]] = types.MappingProxyType({})
+
+
+@dataclass(slots=True)
+class UserRuntime:
+    """
+    Live forwarding state for one user, resolved once in refresh_user.
+
+    source_peers    – marked chat id → InputPeer we forward *from*
+    source_topics   – marked chat id → allowed topic ids (absent = whole chat)
+    target_peer     – InputPeer we forward *to*
+    top_msg_id      – forum topic of the target, None for plain chats
+    mode            – 'forward', 'copy' (re-send without the forward header)
+                      or 'digest' (periodic summaries, see digest.py)
+    filter_mode     – content filter, one of db.FILTER_MODES
+    allowed_senders – sender ids to forward from (see sender_allowed),
+                      None = everyone
+    handlers        – event handlers registered on client (new / edited /
+                      deleted messages)
+    pending_deletes – target message ids waiting to be deleted in one call
+    """
+
+    client: TelegramClient
+    target_peer: TypeInputPeer
+    top_msg_id: Optional[int]
+    mode: str = "forward"
+    source_peers: Dict[int, TypeInputPeer] = field(default_factory=dict)
+    source_topics: Mapping[int, FrozenSet[int]] = field(default_factory=lambda: NO_TOPICS)
+    filter_mode: str = "all"
+    allowed_senders: Optional[SenderIds] = None
+    handlers: Tuple[Callable, ...] = ()
+    pending_deletes: Optional[List[int]] = None
+    task: Optional[asyncio.Task] = None
+
+
+@dataclass(slots=True)
+class ClientHealth:
+    """Connection history of one user's client, kept across rebuilds (wall clock)."""
+
+    since: float = field(default_factory=time.time)
+    connected_at: Optional[float] = None    # None while down
+    up_total: float = 0.0                   # closed connected intervals
+    reconnects: int = 0
+    last_error: Optional[str] = None
+    revoked: bool = False
+
+    def up(self) -> None:
+        if self.connected_at is None:
+            self.connected_at = time.time()
+
+    def down(self, error: Optional[str] = None) -> None:
+        if self.connected_at is not None:
+            self.up_total += time.time() - self.connected_at
+            self.connected_at = None
+        if error:
+            self.last_error = error
+
+    def as_dict(self) -> dict:
+        now = time.time()
+        current = now - self.connected_at if self.connected_at is not None else 0.0
+        span = max(now - self.since, 1e-9)
+        return {
+            "connected": self.connected_at is not None,
+            "uptime": current,
+            "availability": min(1.0, (self.up_total + current) / span),
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+            "revoked": self.revoked,
+        }
+
+
+class UserSlot:
+    """Everything the forwarder holds for one user."""
+
+    __slots__ = (
+        "runtime", "lock", "health", "breaker", "refresh_timer", "refresh_first", "refresh_folded",
+    )
+
+    def __init__(self):
+        self.runtime: Optional[UserRuntime] = None
+        self.lock = asyncio.Lock()
+        self.health: Optional[ClientHealth] = None
+        # Kept across rebuilds, replaced when the target changes
+        self.breaker: Optional[TargetBreaker] = None
+        # Debounced rebuild: pending timer, time of the first request it
+        # covers, and how many requests it has absorbed
+        self.refresh_timer: Optional[asyncio.TimerHandle] = None
+        self.refresh_first = 0.0
+        self.refresh_folded = 0
+
+    def idle(self) -> bool:
+        """Nothing running, pending or waiting on this slot's lock."""
+        return (
+            self.runtime is None
+            and self.refresh_timer is None
+            and not self.lock.locked()
+            and not getattr(self.lock, "_waiters", None)
+        )
+
+    def cancel_refresh(self) -> bool:
+        """Drop a pending debounced rebuild; True if there was one."""
+        timer, self.refresh_timer = self.refresh_timer, None
+        self.refresh_first = 0.0
+        if timer is None:
+            return False
+        timer.cancel()
+        return True
+
+
+# Objects a slot refers to but doesn't own (or that are accounted elsewhere)
+_SHARED = (TelegramClient, asyncio.Task, asyncio.AbstractEventLoop, asyncio.TimerHandle, type)
+
+
+def deep_sizeof(obj, seen: Optional[set] = None) -> int:
+    """sys.getsizeof over containers, records and closures, each object once."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, _SHARED):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, types.FunctionType):
+        # Code and globals are shared; the cells are what a closure costs
+        for cell in obj.__closure__ or ():
+            size += sys.getsizeof(cell)
+            try:
+                size += deep_sizeof(cell.cell_contents, seen)
+            except ValueError:      # empty cell
+                pass
+    elif isinstance(obj, types.MethodType):
+        # A slotted receiver is a per-user handler object: count the object
+        # itself, what it points to is the shared manager or counted already
+        owner = obj.__self__
+        if hasattr(type(owner), "__slots__") and id(owner) not in seen:
+            seen.add(id(owner))
+            size += sys.getsizeof(owner)
+    elif isinstance(obj, functools.partial):
+        size += deep_sizeof(obj.args, seen) + deep_sizeof(obj.keywords, seen)
+    elif isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(x, seen) for x in obj)
+    else:
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if hasattr(obj, name):
+                    size += deep_sizeof(getattr(obj, name), seen)
+        if hasattr(obj, "__dict__"):
+            size += deep_sizeof(obj.__dict__, seen)
+    return size
+
+
+class UserRegistry:
+    def __init__(self):
+        self._slots: Dict[int, UserSlot] = {}
+
+    def slot(self, uid: int) -> UserSlot:
+        s = self._slots.get(uid)
+        if s is None:
+            s = self._slots[uid] = UserSlot()
+        return s
+
+    def get(self, uid: int) -> Optional[UserSlot]:
+        return self._slots.get(uid)
+
+    def runtime(self, uid: int) -> Optional[UserRuntime]:
+        s = self._slots.get(uid)
+        return s.runtime if s else None
+
+    def discard(self, uid: int) -> bool:
+        """Drop uid's slot if it is idle (e.g. after logout); True if dropped."""
+        s = self._slots.get(uid)
+        if s is None or not s.idle():
+            return False
+        del self._slots[uid]
+        return True
+
+    def runtimes(self) -> Iterator[Tuple[int, UserRuntime]]:
+        for uid, s in list(self._slots.items()):
+            if s.runtime is not None:
+                yield uid, s.runtime
+
+    def items(self) -> Iterator[Tuple[int, UserSlot]]:
+        return iter(list(self._slots.items()))
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def memory_report(self) -> dict:
+        """
+        Bytes held per user by the registry, including the event builders
+        its handlers are registered with (clients and tasks excluded: they
+        are Telethon's and asyncio's, and the same with any layout).
+        """
+        seen: set = set()
+        total = sys.getsizeof(self._slots)
+        runtime_bytes = live = 0
+        for uid, s in self._slots.items():
+            total += deep_sizeof(uid, seen)
+            if s.runtime is not None:
+                live += 1
+                before = total
+                total += deep_sizeof(s.runtime, seen)
+                for entry in getattr(s.runtime.client, "_event_builders", ()):
+                    if entry[1] in s.runtime.handlers:
+                        total += deep_sizeof(entry, seen)
+                runtime_bytes += total - before
+            total += deep_sizeof(s, seen)
+        users = len(self._slots)
+        return {
+            "users": users,
+            "live": live,
+            "bytes": total,
+            "runtime_bytes": runtime_bytes,
+            "per_user": total / users if users else 0.0,
+            "per_live_runtime": runtime_bytes / live if live else 0.0,
+        }
@@ -0,0 +1,160 @@
+"""
+bot/routers/admin.py
+--------------------
+Operator-only diagnostics (users listed in ADMIN_IDS):
+• /profile [seconds] – sample the event loop and reply with a collapsed-stack
+  profile (feed it to flamegraph.pl or speedscope)
+• /looplag           – slow-callback monitor summary
+• /health            – per-user forwarding client uptime, availability and
+  reconnect counts
+• /memory            – bytes the forwarder holds per user (registry report)
+• /limits uid [tier [quota]] – show or set a user's scheduler tier
+  (low / normal / high) and messages-per-minute quota ('none' = default)
+• /metrics [json|reset] – per-route handler latency (total / DB / Telethon),
+  error rates and in-flight counts, plus how many forwarder refreshes were
+  coalesced by the debounce
+"""
+from __future__ import annotations
+
+import html
+import json
+import logging
+import math
+import time
+
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.types import BufferedInputFile, Message
+
+from bot.config import settings
+from bot.metrics import metrics
+from bot.profiling import profile_loop
+from bot.scheduler import TIER_WEIGHTS
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+MAX_PROFILE_SECONDS = 120
+
+router.message.filter(F.from_user.id.in_(settings.ADMIN_IDS))
+
+
+@router.message(Command("profile"))
+async def cmd_profile(msg: Message, command: CommandObject):
+    try:
+        seconds = float(command.args or settings.PROFILE_SECONDS)
+    except ValueError:
+        seconds = math.nan
+    if not math.isfinite(seconds) or seconds <= 0:
+        await msg.answer("Usage: /profile [seconds]")
+        return
+    seconds = min(seconds, MAX_PROFILE_SECONDS)
+    await msg.answer(f"⏱️ Profiling the event loop for {seconds:g}s…")
+    logger.info("Admin %s started a %gs profile", msg.from_user.id, seconds)
+    folded = await profile_loop(seconds)
+    name = time.strftime("profile-%Y%m%d-%H%M%S.folded")
+    await msg.answer_document(
+        BufferedInputFile(folded.encode(), filename=name),
+        caption=f"{len(folded.splitlines())} unique stacks",
+    )
+
+
+@router.message(Command("looplag"))
+async def cmd_looplag(msg: Message):
+    from bot import runtime as r
+
+    mon = r.loop_monitor
+    if mon is None:
+        await msg.answer("Loop-lag monitor is disabled (LOOP_LAG_THRESHOLD=0).")
+        return
+    await msg.answer(
+        f"Threshold {mon.threshold * 1000:.0f} ms • stalls {mon.stalls} • "
+        f"worst {mon.max_lag * 1000:.0f} ms"
+    )
+
+
+@router.message(Command("health"))
+async def cmd_health(msg: Message):
+    from bot import runtime as r
+
+    health = r.forwarder.all_health() if r.forwarder else {}
+    if not health:
+        await msg.answer("No forwarding clients have run yet.")
+        return
+    rows = [f"{'user':<14}{'state':<8}{'up(s)':>9}{'avail':>8}{'recon':>6}  last error"]
+    for uid, h in sorted(health.items(), key=lambda kv: kv[1]["availability"]):
+        state = "up" if h["connected"] else ("revoked" if h["revoked"] else "down")
+        rows.append(
+            f"{uid:<14}{state:<8}{h['uptime']:>9.0f}{h['availability']:>8.1%}"
+            f"{h['reconnects']:>6}  {h['last_error'] or ''}"
+        )
+    await msg.answer(f"<pre>{html.escape(chr(10).join(rows))[:4000]}</pre>")
+
+
+@router.message(Command("memory"))
+async def cmd_memory(msg: Message):
+    from bot import runtime as r
+
+    if not r.forwarder:
+        await msg.answer("Forwarder not running.")
+        return
+    m = r.forwarder.memory_report()
+    await msg.answer(
+        f"Registry: {m['users']} users ({m['live']} live), {m['bytes'] / 1024:.0f} KiB\n"
+        f"Per user {m['per_user']:.0f} B • per live runtime {m['per_live_runtime']:.0f} B\n"
+        f"(Telethon clients and tasks not included)"
+    )
+
+
+@router.message(Command("limits"))
+async def cmd_limits(msg: Message, command: CommandObject):
+    from bot import runtime as r
+
+    usage = f"Usage: /limits uid [{'|'.join(TIER_WEIGHTS)} [quota|none]]"
+    args = (command.args or "").split()
+    try:
+        uid = int(args[0])
+        tier = args[1] if len(args) > 1 else None
+        quota = None if len(args) < 3 or args[2].lower() == "none" else int(args[2])
+    except (IndexError, ValueError):
+        await msg.answer(usage)
+        return
+    if tier is None:
+        tier, quota = await r.db.get_user_limits(uid)
+        await msg.answer(f"User {uid}: tier {tier}, quota {quota or 'default'}/min")
+        return
+    if tier not in TIER_WEIGHTS or len(args) > 3 or (quota is not None and quota <= 0):
+        await msg.answer(usage)
+        return
+    await r.db.add_user_if_missing(uid)
+    if r.forwarder:
+        await r.forwarder.set_limits(uid, tier, quota)
+    else:
+        await r.db.set_user_limits(uid, tier, quota)
+    logger.info("Admin %s set limits of %s: %s, %s/min", msg.from_user.id, uid, tier, quota)
+    await msg.answer(f"✅ User {uid}: tier {tier}, quota {quota or 'default'}/min")
+
+
+@router.message(Command("metrics"))
+async def cmd_metrics(msg: Message, command: CommandObject):
+    arg = (command.args or "").strip().lower()
+    if arg == "reset":
+        metrics.reset()
+        await msg.answer("Handler metrics reset.")
+    elif arg == "json":
+        await msg.answer_document(
+            BufferedInputFile(json.dumps(metrics.snapshot(), indent=2).encode(), filename="metrics.json")
+        )
+    else:
+        from bot import runtime as r
+
+        text = metrics.render()
+        if r.forwarder:
+            rs = r.forwarder.refresh_stats()
+            text += (
+                f"\n\nforwarder refreshes: {rs['requested']} requested, "
+                f"{rs['rebuilds']} rebuilt, {rs['coalesced']} coalesced, {rs['pending']} pending"
+            )
+        if r.outbound:
+            text += "\n" + r.outbound.render()
+        await msg.answer(f"<pre>{html.escape(text)}</pre>")
@@ -6,7 +6,6 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from pathlib import Path
 
 from aiogram import Router, F
 from aiogram.exceptions import TelegramNetworkError
@@ -18,12 +17,7 @@ from aiogram.types import (
     InlineKeyboardMarkup,
     Message,
 )
-from bot.utils.state import user_state
-from bot.utils.state import (
-    WAITING_SRC,
-    WAITING_TGT,
-    WAITING_FILTER,
-)
+from bot.utils.state import on_state, user_state, WAITING_PWD
 
 
 router = Router()
@@ -45,10 +39,6 @@ async def ensure_user(event: Message | CallbackQuery):
     return uid
 
 
-# per-user flag while waiting for password
-AWAIT_PWD: dict[int, bool] = {}
-
-
 # --------------------------------------------------------------------------- #
 # /start  – decide which menu to show                                         #
 # --------------------------------------------------------------------------- #
@@ -57,10 +47,8 @@ async def cmd_start(msg: Message):
     db, auth, _, menu = services()
     uid = await ensure_user(msg)
 
-    session_ok = await auth.session_is_authorized(uid)
-
-    if session_ok:
-        await msg.answer("Welcome back!", reply_markup=menu().as_markup())
+    if auth.is_authorized_cached(uid):
+        await msg.answer("Welcome back!", reply_markup=menu())
     else:
         kb = InlineKeyboardMarkup(
             inline_keyboard=[[InlineKeyboardButton(text="🔑 Log in",callback_data="login")]]
@@ -79,7 +67,9 @@ async def login_qr(call: CallbackQuery):
     client, qr_png = await auth.start_login(uid)
     qr_file = BufferedInputFile(qr_png.getvalue(), filename="qr.png")
 
-    # send QR (retry 3× if Telegram connection hiccups)
+    # Send QR (retry 3× on connection hiccups). The outbound sender doesn't
+    # retry sends after a network error, as one may have gone through; a
+    # second QR photo is harmless, so this one is retried here.
     for attempt in range(3):
         try:
             await call.message.answer_photo(
@@ -98,33 +88,36 @@ async def login_qr(call: CallbackQuery):
         return
 
     await auth.wait_complete(uid)
+    if not auth.is_current_login(uid, client):
+        return      # superseded by a newer login (or a logout) meanwhile
 
     if await client.is_user_authorized():
-        await call.message.answer("✅ Logged in!", reply_markup=menu().as_markup())
+        await auth.complete_login(uid)
+        await call.message.answer("✅ Logged in!", reply_markup=menu())
         if fwd:
-            await fwd.refresh_user(uid)
+            await fwd.refresh_user(uid, immediate=True)
     else:
-        AWAIT_PWD[uid] = True
+        user_state[uid] = WAITING_PWD
         await call.message.answer("🔐 Send your 2-step password.")
 
 
 # --------------------------------------------------------------------------- #
 # 2-step Verification password                                                #
 # --------------------------------------------------------------------------- #
-@router.message(F.text, lambda m: AWAIT_PWD.get(m.from_user.id))
+@on_state(WAITING_PWD)
 async def receive_password(msg: Message):
     db, auth, fwd, menu = services()
     uid = msg.from_user.id
 
     ok, client = await auth.finish_with_password(uid, msg.text.strip())
     if ok and await client.is_user_authorized():
-        await msg.answer("✅ Logged in!", reply_markup=menu().as_markup())
+        await msg.answer("✅ Logged in!", reply_markup=menu())
         if fwd:
-            await fwd.refresh_user(uid)
+            await fwd.refresh_user(uid, immediate=True)
     else:
         await msg.answer("❌ Incorrect password.")
 
-    AWAIT_PWD.pop(uid, None)
+    user_state.pop(uid, None)
 
 
 # --------------------------------------------------------------------------- #
@@ -137,11 +130,9 @@ async def logout(call: CallbackQuery):
 
     if fwd:
         await fwd.stop_user(uid)
+        await fwd.abandon_outbox(uid, "logged out")
 
-    try:
-        Path(auth._session_path(uid) + ".session").unlink()
-    except FileNotFoundError:
-        pass
+    await auth.logout(uid)
 
     await call.message.answer("🔒 Logged out.")
 
@@ -152,13 +143,13 @@ async def logout(call: CallbackQuery):
 @router.message(F.chat.type == "private", flags={"block": False})
 async def auto_menu(msg: Message):
     uid = msg.from_user.id
-    if user_state.get(uid) in {WAITING_SRC, WAITING_TGT, WAITING_FILTER} or AWAIT_PWD.get(uid):
+    if uid in user_state:
         return
     db, auth, _, menu = services()
     await db.add_user_if_missing(uid)
 
-    if Path(auth._session_path(uid) + ".session").exists() and auth.client(uid).is_user_authorized():
-        await msg.answer("Main menu:", reply_markup=menu().as_markup())
+    if auth.is_authorized_cached(uid):
+        await msg.answer("Main menu:", reply_markup=menu())
     else:
         kb = InlineKeyboardMarkup(
             inline_keyboard=[[InlineKeyboardButton(text="🔑 Log in", callback_data="login")]]
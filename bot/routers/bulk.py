@@ -0,0 +1,286 @@
+"""
+bot/routers/bulk.py
+-------------------
+Bulk import / export of sources and filtered users:
+• "export_cfg" – send the lists back as a JSON document
+• "import_cfg" – prompt for a .json or .csv document
+• receives the document, validates every chat / user concurrently (rate
+  limited), writes the valid rows in one transaction per table and restarts
+  the forwarder once. Progress and errors go into a single edited message.
+
+JSON: {"sources": [{"chat_id": -100…, "topic_id": 5}, "-100…:5", …],
+       "filtered_users": [{"user_id": 123}, 456, …]}
+CSV : kind,id,topic_id   (kind = source | filter; header row optional)
+"""
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from aiogram import Router, F
+from aiogram.enums import ParseMode
+from aiogram.types import BufferedInputFile, CallbackQuery, Message
+from telethon.errors import FloodWaitError
+
+from bot.keyboards import kb_cache
+from bot.utils.state import on_state, user_state, WAITING_IMPORT
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+MAX_IMPORT_BYTES = 1_000_000
+MAX_IMPORT_ROWS = 2_000
+VALIDATE_CONCURRENCY = 5
+VALIDATE_PER_SECOND = 10
+PROGRESS_EVERY = 2.0        # seconds between progress edits
+MAX_FLOOD_WAIT = 30         # longer flood waits fail the row instead of stalling
+
+# -----------------------------------------------------------------------------
+# Lazy singletons to avoid circulars
+# -----------------------------------------------------------------------------
+
+def services():
+    from bot import runtime as r
+    from bot.keyboards import main_menu
+    return r.db, r.auth, r.forwarder, main_menu
+
+
+async def ensure_user(entry: Message | CallbackQuery):
+    db, *_ = services()
+    uid = entry.from_user.id
+    await db.add_user_if_missing(uid)
+    return uid
+
+# -----------------------------------------------------------------------------
+# Parsing
+# -----------------------------------------------------------------------------
+
+@dataclass
+class Row:
+    kind: str               # "source" | "filter"
+    id: int
+    topic_id: Optional[int] = None
+
+
+def _parse_source(value) -> Row:
+    if isinstance(value, dict):
+        return Row("source", int(value["chat_id"]), int(value["topic_id"]) if value.get("topic_id") else None)
+    cid, _, tid = str(value).partition(":")
+    return Row("source", int(cid), int(tid) if tid else None)
+
+
+def _parse_filter(value) -> Row:
+    return Row("filter", int(value["user_id"] if isinstance(value, dict) else value))
+
+
+def parse_import(name: str, raw: bytes) -> Tuple[List[Row], List[str]]:
+    """Return (rows, errors) from a JSON or CSV upload."""
+    rows: List[Row] = []
+    errors: List[str] = []
+    text = raw.decode("utf-8-sig")
+
+    if name.lower().endswith(".json"):
+        data = json.loads(text)
+        for key, parse in (("sources", _parse_source), ("filtered_users", _parse_filter)):
+            for i, value in enumerate(data.get(key, [])):
+                try:
+                    rows.append(parse(value))
+                except (KeyError, TypeError, ValueError):
+                    errors.append(f"{key}[{i}]: cannot parse {value!r}")
+        return rows, errors
+
+    for lineno, rec in enumerate(csv.reader(io.StringIO(text)), 1):
+        if not rec or (lineno == 1 and rec[0].strip().lower() == "kind"):
+            continue
+        kind = rec[0].strip().lower()
+        try:
+            if kind == "source":
+                topic = rec[2].strip() if len(rec) > 2 else ""
+                rows.append(Row("source", int(rec[1]), int(topic) if topic else None))
+            elif kind == "filter":
+                rows.append(Row("filter", int(rec[1])))
+            else:
+                errors.append(f"line {lineno}: unknown kind {kind!r}")
+        except (IndexError, ValueError):
+            errors.append(f"line {lineno}: cannot parse {','.join(rec)!r}")
+    return rows, errors
+
+# -----------------------------------------------------------------------------
+# Validation
+# -----------------------------------------------------------------------------
+
+class RateLimiter:
+    """At most `per_second` acquisitions per second, `concurrency` at a time."""
+
+    def __init__(self, per_second: float, concurrency: int):
+        self._interval = 1.0 / per_second
+        self._next = 0.0
+        self._sem = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self):
+        await self._sem.acquire()
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next)
+        self._next = slot + self._interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def __aexit__(self, *exc):
+        self._sem.release()
+
+
+async def _validate(client, limiter: RateLimiter, row: Row) -> Tuple[Row, Optional[str], Optional[str]]:
+    """
+    Return (row, display name, error).
+
+    A filtered user only needs resolving for its display name: like the
+    single-add flow, one that can't be resolved is kept as "user".
+    """
+    for attempt in range(2):
+        try:
+            async with limiter:
+                entity = await client.get_entity(row.id)
+        except FloodWaitError as e:
+            if attempt or e.seconds > MAX_FLOOD_WAIT:
+                if row.kind == "filter":
+                    return row, "user", None
+                return row, None, f"flood wait {e.seconds}s"
+            await asyncio.sleep(e.seconds)
+            continue
+        except Exception as e:      # noqa: BLE001
+            if row.kind == "filter":
+                return row, "user", None
+            return row, None, str(e)
+        if row.kind == "source":
+            title = getattr(entity, "title", str(entity))
+            return row, title + (f" (topic {row.topic_id})" if row.topic_id else ""), None
+        return row, getattr(entity, "first_name", None) or "user", None
+    return row, None, "unreachable"
+
+# -----------------------------------------------------------------------------
+# Export
+# -----------------------------------------------------------------------------
+
+@router.callback_query(F.data == "export_cfg")
+async def export_cfg(call: CallbackQuery):
+    db, *_ = services()
+    uid = await ensure_user(call)
+    data = {
+        "sources": [
+            {"chat_id": s.chat_id, "topic_id": s.topic_id, "title": s.title}
+            for s in await db.list_sources(uid)
+        ],
+        "filtered_users": [
+            {"user_id": u, "display_name": name}
+            for u, name in await db.list_filtered_users_named(uid)
+        ],
+    }
+    doc = BufferedInputFile(json.dumps(data, indent=2, ensure_ascii=False).encode(), filename="forwarder.json")
+    await call.message.answer_document(
+        doc, caption=f"{len(data['sources'])} sources, {len(data['filtered_users'])} filtered users"
+    )
+    await call.answer()
+
+# -----------------------------------------------------------------------------
+# Import
+# -----------------------------------------------------------------------------
+
+@router.callback_query(F.data == "import_cfg")
+async def import_start(call: CallbackQuery):
+    uid = await ensure_user(call)
+    user_state[uid] = WAITING_IMPORT
+    await call.message.answer(
+        "Send a <b>.json</b> or <b>.csv</b> file with sources and/or filtered users "
+        "(the format produced by 📤 Export). Send any text to cancel.",
+        parse_mode=ParseMode.HTML,
+    )
+
+
+@on_state(WAITING_IMPORT)
+async def import_cancel(message: Message):
+    *_, main_menu = services()
+    user_state.pop(message.from_user.id, None)
+    await message.answer("⏹️ Cancelled.", reply_markup=main_menu())
+
+
+@on_state(WAITING_IMPORT, content="document")
+async def import_finish(message: Message):
+    db, auth, forwarder, main_menu = services()
+    uid = message.from_user.id
+    user_state.pop(uid, None)
+    doc = message.document
+
+    if doc.file_size and doc.file_size > MAX_IMPORT_BYTES:
+        await message.answer("❌ File too large (1 MB max).")
+        return
+    buf = await message.bot.download(doc)
+    try:
+        rows, errors = parse_import(doc.file_name or "", buf.getvalue())
+    except (UnicodeDecodeError, json.JSONDecodeError, AttributeError) as e:
+        await message.answer(f"❌ Cannot read file: {e}")
+        return
+    if len(rows) > MAX_IMPORT_ROWS:
+        await message.answer(
+            f"❌ Too many rows: {len(rows)} ({MAX_IMPORT_ROWS} max). "
+            "Split the file and import the parts one by one.",
+            reply_markup=main_menu(),
+        )
+        return
+    if not rows:
+        await message.answer("❌ Nothing to import.", reply_markup=main_menu())
+        return
+
+    client = auth.client(uid)
+    if not client.is_connected():
+        await client.connect()
+    if not await client.is_user_authorized():
+        await message.answer("❌ Please log in first.")
+        return
+
+    status = await message.answer(f"⏳ Validating 0/{len(rows)}…")
+    limiter = RateLimiter(VALIDATE_PER_SECOND, VALIDATE_CONCURRENCY)
+    sources: List[Tuple[int, Optional[int], str]] = []
+    filters: List[Tuple[int, str]] = []
+    last_edit = time.monotonic()
+
+    tasks = [asyncio.create_task(_validate(client, limiter, row)) for row in rows]
+    for done, fut in enumerate(asyncio.as_completed(tasks), 1):
+        row, name, error = await fut
+        if error:
+            errors.append(f"{row.kind} {row.id}: {error}")
+        elif row.kind == "source":
+            sources.append((row.id, row.topic_id, name))
+        else:
+            filters.append((row.id, name))
+        if time.monotonic() - last_edit >= PROGRESS_EVERY:
+            last_edit = time.monotonic()
+            try:
+                await status.edit_text(f"⏳ Validating {done}/{len(rows)}… ({len(errors)} errors)")
+            except Exception:       # noqa: BLE001 – progress is best effort
+                pass
+
+    if sources:
+        await db.add_sources_many(uid, sources)
+        kb_cache.invalidate(uid, "src")
+    if filters:
+        await db.add_filtered_users_many(uid, filters)
+        kb_cache.invalidate(uid, "flt")
+    logger.info("User %s imported %d sources, %d filters", uid, len(sources), len(filters))
+    if forwarder and (sources or filters):
+        await forwarder.refresh_user(uid)
+
+    lines = [f"✅ Imported {len(sources)} sources and {len(filters)} filtered users."]
+    if errors:
+        lines.append(f"\n❌ {len(errors)} rows skipped:")
+        lines.extend(f"• {e}" for e in errors[:20])
+        if len(errors) > 20:
+            lines.append(f"… and {len(errors) - 20} more")
+    await status.edit_text("\n".join(lines)[:4000], parse_mode=None)
+    await message.answer("Main menu:", reply_markup=main_menu())
@@ -0,0 +1,41 @@
+"""
+bot/routers/conversation.py
+---------------------------
+Single entry point for replies inside a multi-step flow (add source, set
+target, add filter, 2FA password, bulk import). The user's state is looked up once and the
+message goes straight to the handler registered with `@on_state`, instead of
+every message running one lambda filter per router.
+
+Included before every other router so flows win over the auto-menu. Commands
+(/start, ...) are not flow input: they cancel the flow and go to their own
+handlers, as they did before flows were routed here.
+"""
+from __future__ import annotations
+
+from aiogram import Router, F
+from aiogram.types import Message
+
+from bot.utils.state import STATE_HANDLERS, user_state
+
+router = Router()
+
+
+def _is_command(msg: Message) -> bool:
+    entity = msg.entities[0] if msg.entities else None
+    return entity is not None and entity.type == "bot_command" and entity.offset == 0
+
+
+def _conversation(msg: Message) -> dict | bool:
+    state = user_state.get(msg.from_user.id)
+    if not state:
+        return False
+    if _is_command(msg):
+        user_state.pop(msg.from_user.id, None)      # a command abandons the flow
+        return False
+    handler = STATE_HANDLERS.get((state, "document" if msg.document else "text"))
+    return {"state_handler": handler} if handler else False
+
+
+@router.message(F.text | F.document, _conversation)
+async def route_conversation(msg: Message, state_handler):
+    await state_handler(msg)
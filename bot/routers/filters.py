@@ -4,24 +4,27 @@ bot/routers/filters.py
 User-filtering & message-filter mode toggle:
 • "add_filter" – prompt for numeric Telegram user_id to allow
 • accepts reply, stores display name
-• "mgr_filter" – list filtered IDs with ❌ delete buttons
-• "del_filter:<user_id>" – remove filter
-• "toggle_mode" – switch between 'all' and 'token' content filter
+• "mgr_filter" – list filtered IDs with ❌ delete buttons, paginated
+• "flt_page:<page>" – flip to another page of filtered users
+• "del_filter:<user_id>:<page>" – remove filter
+• "toggle_mode" – cycle the content filter: 'all' → 'token' → 'first'
+  (token messages, first mention of each address only)
 """
 from __future__ import annotations
 
 import logging
 
 from aiogram import Router, F
-from bot.utils.state import user_state, WAITING_FILTER
+from bot.utils.state import on_state, user_state, WAITING_FILTER
 from aiogram.types import (
     CallbackQuery,
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
     Message,
 )
 from aiogram.enums import ParseMode
 
+from bot.db import FILTER_MODES
+from bot.keyboards import FILTER_MODE_LABELS, PAGE_SIZE, kb_cache
+
 router = Router()
 logger = logging.getLogger(__name__)
 
@@ -45,15 +48,15 @@ async def ensure_user(entry: Message | CallbackQuery):
 # Keyboards
 # -----------------------------------------------------------------------------
 
-async def filters_kb(uid: int):
-    db, *_ = services()
-    ids = await db.list_filtered_users(uid)
-    rows = [
-        [InlineKeyboardButton(text=f"• {u} ❌", callback_data=f"del_filter:{u}")]
-        for u in ids
-    ]
-    rows.append([InlineKeyboardButton(text="⬅️ Back", callback_data="back_main")])
-    return InlineKeyboardMarkup(inline_keyboard=rows)
+async def filters_kb(uid: int, page: int = 0):
+    """One page of the user's filtered IDs; rows and rendered pages are cached."""
+    if kb_cache.items(uid, "flt") is None:
+        db, *_ = services()
+        kb_cache.store(uid, "flt", [
+            (f"• {u} ❌", f"del_filter:{u}:{i // PAGE_SIZE}")
+            for i, u in enumerate(await db.list_filtered_users(uid))
+        ])
+    return kb_cache.page(uid, "flt", "flt_page", page)
 
 # -----------------------------------------------------------------------------
 # Add filtered user flow
@@ -66,13 +69,13 @@ async def add_filter_start(call: CallbackQuery):
     await call.message.answer("Send the <code>user_id</code> you want to <b>allow</b>. Leave blank to cancel.", parse_mode=ParseMode.HTML)
 
 
-@router.message(F.text, lambda m: user_state.get(m.from_user.id) == WAITING_FILTER)
+@on_state(WAITING_FILTER)
 async def add_filter_finish(message: Message):
     db, auth, forwarder, main_menu = services()
     uid = message.from_user.id
     raw = message.text.strip()
     if not raw:
-        await message.answer("⏹️ Cancelled.", reply_markup=main_menu().as_markup())
+        await message.answer("⏹️ Cancelled.", reply_markup=main_menu())
         user_state.pop(uid, None)
         return
 
@@ -91,11 +94,12 @@ async def add_filter_finish(message: Message):
         display_name = "user"
 
     await db.add_filtered_user(uid, user_id, display_name)
+    kb_cache.invalidate(uid, "flt")
     logger.info("User %s added filter user %s", uid, user_id)
     if forwarder:
         await forwarder.refresh_user(uid)
 
-    await message.answer("✅ Filtered user added!", reply_markup=main_menu().as_markup())
+    await message.answer("✅ Filtered user added!", reply_markup=main_menu())
     user_state.pop(uid, None)
 
 # -----------------------------------------------------------------------------
@@ -112,15 +116,25 @@ async def manage_filtered(call: CallbackQuery):
 async def delete_filter(call: CallbackQuery):
     db, _, forwarder, _ = services()
     uid = await ensure_user(call)
-    _, user_id_str = call.data.split(":", 1)
+    _, user_id_str, *rest = call.data.split(":")
     user_id = int(user_id_str)
+    page = int(rest[0]) if rest else 0
 
     await db.remove_filtered_user(uid, user_id)
+    kb_cache.invalidate(uid, "flt")
     logger.info("User %s removed filter user %s", uid, user_id)
     if forwarder:
         await forwarder.refresh_user(uid)
 
-    await call.message.edit_reply_markup(reply_markup=await filters_kb(uid))
+    await call.message.edit_reply_markup(reply_markup=await filters_kb(uid, page))
+
+
+@router.callback_query(F.data.startswith("flt_page:"))
+async def filters_page(call: CallbackQuery):
+    uid = await ensure_user(call)
+    page = int(call.data.split(":", 1)[1])
+    await call.message.edit_reply_markup(reply_markup=await filters_kb(uid, page))
+    await call.answer()
 
 # -----------------------------------------------------------------------------
 # Toggle content filter mode
@@ -131,8 +145,9 @@ async def toggle_mode(call: CallbackQuery):
     db, _, forwarder, _ = services()
     uid = await ensure_user(call)
     current = await db.get_filter_mode(uid)
-    new_mode = "token" if current == "all" else "all"
+    nxt = FILTER_MODES.index(current) + 1 if current in FILTER_MODES else 0
+    new_mode = FILTER_MODES[nxt % len(FILTER_MODES)]
     await db.set_filter_mode(uid, new_mode)
     if forwarder:
         await forwarder.refresh_user(uid)
-    await call.answer("Switched!")
+    await call.answer(f"Switched to: {FILTER_MODE_LABELS[new_mode]}")
@@ -5,13 +5,18 @@ Odds-and-ends interactions that don't modify config:
 • "view_cfg" – show full config summary
 • "donate"   – display donation addresses
 • "back_main" – bring user back to main menu
+• "noop"     – inert buttons (e.g. the page counter)
 """
 from __future__ import annotations
 
+import html
+
 from aiogram import Router, F
 from aiogram.enums import ParseMode
 from aiogram.types import CallbackQuery
 
+from bot.keyboards import DELIVERY_MODE_LABELS, FILTER_MODE_LABELS
+
 router = Router()
 
 # -----------------------------------------------------------------------------
@@ -32,9 +37,18 @@ async def ensure_user(entry):
 # View configuration
 # -----------------------------------------------------------------------------
 
+def _duration(seconds: float) -> str:
+    minutes, _ = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return f"{days}d {hours}h"
+    return f"{hours}h {minutes}m" if hours else f"{minutes}m"
+
+
 @router.callback_query(F.data == "view_cfg")
 async def view_config(call: CallbackQuery):
-    db, _, _, main_menu = services()
+    db, _, forwarder, main_menu = services()
     uid = await ensure_user(call)
 
     srcs = await db.list_sources(uid)
@@ -51,10 +65,11 @@ async def view_config(call: CallbackQuery):
     lines.append("\n<b>Target:</b>")
     if tgt:
         lines.append(f"• {tgt.chat_id}{f':{tgt.topic_id}' if tgt.topic_id else ''}")
+        lines.append(f"  Delivery: {DELIVERY_MODE_LABELS.get(tgt.mode, tgt.mode)}")
     else:
         lines.append("  None ❌")
 
-    lines.append(f"\n<b>Filter mode:</b> {'All messages' if mode=='all' else 'Token-related only'}")
+    lines.append(f"\n<b>Filter mode:</b> {FILTER_MODE_LABELS.get(mode, mode)}")
 
     lines.append("\n<b>Filtered users:</b>")
     if flt:
@@ -62,7 +77,36 @@ async def view_config(call: CallbackQuery):
     else:
         lines.append("  None")
 
-    await call.message.answer("\n".join(lines), reply_markup=main_menu().as_markup())
+    if forwarder:
+        q = forwarder.queue_stats(uid)
+        lines.append(
+            f"\n<b>Queue:</b> {q['queued']} pending, "
+            f"avg wait {q['avg_wait']:.1f}s (max {q['max_wait']:.1f}s)"
+        )
+        if q["digest"]:
+            lines.append(f"<b>Next digest:</b> {q['digest']} messages waiting")
+        h = forwarder.health(uid)
+        if h:
+            state = "🟢 connected" if h["connected"] else ("🔴 session revoked" if h["revoked"] else "🟠 reconnecting")
+            lines.append(
+                f"<b>Connection:</b> {state}, up {_duration(h['uptime'])}, "
+                f"{h['availability']:.1%} available, {h['reconnects']} reconnects"
+            )
+        b = forwarder.target_state(uid)
+        if b and b["state"] != "closed":
+            lines.append(
+                f"<b>Target status:</b> 🔴 unreachable for {_duration(b['open_for'])}, "
+                f"{b['parked']} messages held, next check in {_duration(b['retry_in'])}"
+            )
+            if b["last_error"]:
+                lines.append(f"  Last error: {html.escape(b['last_error'], quote=False)}")
+        elif b and b["failures"]:
+            lines.append(f"<b>Target status:</b> 🟠 {b['failures']} failed deliveries in a row")
+    pending, dead = await db.outbox_counts(uid)
+    if pending or dead:
+        lines.append(f"<b>Outbox:</b> {pending} pending, {dead} failed permanently")
+
+    await call.message.answer("\n".join(lines), reply_markup=main_menu())
 
 # -----------------------------------------------------------------------------
 # Donate
@@ -76,7 +120,7 @@ async def donate(call: CallbackQuery):
         "• SOL: <code>So11111111111111111111111111111111111111112</code>\n"
         "• ETH: <code>0x0123456789abcdef0123456789abcdef01234567</code>"
     )
-    await call.message.answer(txt, parse_mode=ParseMode.HTML, reply_markup=main_menu().as_markup())
+    await call.message.answer(txt, parse_mode=ParseMode.HTML, reply_markup=main_menu())
 
 # -----------------------------------------------------------------------------
 # Back navigation
@@ -85,4 +129,9 @@ async def donate(call: CallbackQuery):
 @router.callback_query(F.data == "back_main")
 async def back_main(call: CallbackQuery):
     _, _, _, main_menu = services()
-    await call.message.answer("Main menu:", reply_markup=main_menu().as_markup())
+    await call.message.answer("Main menu:", reply_markup=main_menu())
+
+
+@router.callback_query(F.data == "noop")
+async def noop(call: CallbackQuery):
+    await call.answer()
@@ -4,8 +4,9 @@ bot/routers/sources.py
 Source‑chat management:
 • "add_src" – prompt user for <chat_id[:topic_id]>
 • receives the chat_id message, validates access, stores in DB
-• "mgr_src" – list existing sources with ❌ delete buttons
-• "del_src:<chat_id>:<topic_id>" – remove source, refresh forwarder
+• "mgr_src" – list existing sources with ❌ delete buttons, paginated
+• "src_page:<page>" – flip to another page of sources
+• "del_src:<chat_id>:<topic_id>:<page>" – remove source, refresh forwarder
 
 Relies on singletons in `bot.entry` (db, auth, forwarder) and
 `bot.keyboards.main_menu`.
@@ -15,15 +16,15 @@ from __future__ import annotations
 import logging
 
 from aiogram import Router, F
-from bot.utils.state import user_state, WAITING_SRC
+from bot.utils.state import on_state, user_state, WAITING_SRC
 from aiogram.types import (
     CallbackQuery,
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
     Message,
 )
 from aiogram.enums import ParseMode
 
+from bot.keyboards import PAGE_SIZE, kb_cache
+
 router = Router()
 logger = logging.getLogger(__name__)
 
@@ -54,19 +55,18 @@ async def ensure_user(entry: Message | CallbackQuery):
 # Keyboards
 # -----------------------------------------------------------------------------
 
-async def sources_kb(uid: int):
-    db, *_ = services()
-    rows = [
-        [
-            InlineKeyboardButton(
-                text=f"• {s.chat_id}{f':{s.topic_id}' if s.topic_id else ''} — {s.title} ❌",
-                callback_data=f"del_src:{s.chat_id}:{s.topic_id or 0}",
+async def sources_kb(uid: int, page: int = 0):
+    """One page of the user's sources; rows and rendered pages are cached."""
+    if kb_cache.items(uid, "src") is None:
+        db, *_ = services()
+        kb_cache.store(uid, "src", [
+            (
+                f"• {s.chat_id}{f':{s.topic_id}' if s.topic_id else ''} — {s.title} ❌",
+                f"del_src:{s.chat_id}:{s.topic_id or 0}:{i // PAGE_SIZE}",
             )
-        ]
-        for s in await db.list_sources(uid)
-    ]
-    rows.append([InlineKeyboardButton(text="⬅️ Back", callback_data="back_main")])
-    return InlineKeyboardMarkup(inline_keyboard=rows)
+            for i, s in enumerate(await db.list_sources(uid))
+        ])
+    return kb_cache.page(uid, "src", "src_page", page)
 
 # -----------------------------------------------------------------------------
 # Add Source flow
@@ -82,7 +82,7 @@ async def add_src_start(call: CallbackQuery):
     )
 
 
-@router.message(F.text, lambda m: user_state.get(m.from_user.id) == WAITING_SRC)
+@on_state(WAITING_SRC)
 async def add_src_finish(message: Message):
     db, auth, forwarder, main_menu = services()
     uid = message.from_user.id
@@ -112,11 +112,12 @@ async def add_src_finish(message: Message):
         return
 
     await db.add_source(uid, chat_id, topic_id, title)
+    kb_cache.invalidate(uid, "src")
     logger.info("User %s added source %s:%s", uid, chat_id, topic_id)
     if forwarder:
         await forwarder.refresh_user(uid)
 
-    await message.answer("✅ Source added!", reply_markup=main_menu().as_markup())
+    await message.answer("✅ Source added!", reply_markup=main_menu())
     user_state.pop(uid, None)
 
 # -----------------------------------------------------------------------------
@@ -134,12 +135,22 @@ async def delete_source(call: CallbackQuery):
     db, _, forwarder, _ = services()
     uid = await ensure_user(call)
 
-    _, cid_str, tid_str = call.data.split(":", 2)
+    _, cid_str, tid_str, *rest = call.data.split(":")
     chat_id, topic_id = int(cid_str), int(tid_str) or None
+    page = int(rest[0]) if rest else 0
 
     await db.remove_source(uid, chat_id, topic_id)
+    kb_cache.invalidate(uid, "src")
     logger.info("User %s removed source %s:%s", uid, chat_id, topic_id)
     if forwarder:
         await forwarder.refresh_user(uid)
 
-    await call.message.edit_reply_markup(reply_markup=await sources_kb(uid))
+    await call.message.edit_reply_markup(reply_markup=await sources_kb(uid, page))
+
+
+@router.callback_query(F.data.startswith("src_page:"))
+async def sources_page(call: CallbackQuery):
+    uid = await ensure_user(call)
+    page = int(call.data.split(":", 1)[1])
+    await call.message.edit_reply_markup(reply_markup=await sources_kb(uid, page))
+    await call.answer()
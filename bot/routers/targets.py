@@ -4,6 +4,7 @@ bot/routers/targets.py
 Target‑chat configuration:
 • "set_tgt" – prompt for chat_id[:topic_id]
 • Accepts user reply, validates access, stores in DB
+• "toggle_delivery" – cycle the target through 'forward', 'copy' and 'digest'
 
 After a target is set we restart the forwarding loop for that user.
 """
@@ -12,13 +13,16 @@ from __future__ import annotations
 import logging
 
 from aiogram import Router, F
-from bot.utils.state import user_state, WAITING_TGT
+from bot.utils.state import on_state, user_state, WAITING_TGT
 from aiogram.types import (
     CallbackQuery,
     Message,
 )
 from aiogram.enums import ParseMode
 
+from bot.db import DELIVERY_MODES
+from bot.keyboards import DELIVERY_MODE_LABELS
+
 router = Router()
 logger = logging.getLogger(__name__)
 
@@ -58,7 +62,7 @@ async def set_target_start(call: CallbackQuery):
     )
 
 
-@router.message(F.text, lambda m: user_state.get(m.from_user.id) == WAITING_TGT)
+@on_state(WAITING_TGT)
 async def set_target_finish(message: Message):
     db, auth, forwarder, main_menu = services()
     uid = message.from_user.id
@@ -86,5 +90,24 @@ async def set_target_finish(message: Message):
     if forwarder:
         await forwarder.refresh_user(uid)
 
-    await message.answer("✅ Target updated!", reply_markup=main_menu().as_markup())
+    await message.answer("✅ Target updated!", reply_markup=main_menu())
     user_state.pop(uid, None)
+
+# -----------------------------------------------------------------------------
+# Toggle delivery mode (forward with header / copy without it)
+# -----------------------------------------------------------------------------
+
+@router.callback_query(F.data == "toggle_delivery")
+async def toggle_delivery(call: CallbackQuery):
+    db, _, forwarder, _ = services()
+    uid = await ensure_user(call)
+    tgt = await db.get_target(uid)
+    if not tgt:
+        await call.answer("Set a target first.", show_alert=True)
+        return
+    nxt = DELIVERY_MODES.index(tgt.mode) + 1 if tgt.mode in DELIVERY_MODES else 0
+    new_mode = DELIVERY_MODES[nxt % len(DELIVERY_MODES)]
+    await db.set_delivery_mode(uid, new_mode)
+    if forwarder:
+        await forwarder.refresh_user(uid)
+    await call.answer(f"{DELIVERY_MODE_LABELS[new_mode]} on")
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from typing import Optional, TYPE_CHECKING
 
 from bot.db import Database
@@ -7,6 +8,8 @@ from bot.auth import AuthManager
 
 if TYPE_CHECKING:  # Only for type hints – avoids heavy import at runtime
     from bot.forwarding import ForwardManager
+    from bot.outbound import OutboundSender
+    from bot.profiling import LoopLagMonitor
 
 # Shared instances -----------------------------------------------------------
 
@@ -15,3 +18,6 @@ auth: AuthManager = AuthManager()
 
 # Will be created on startup in bot.entry
 forwarder: Optional["ForwardManager"] = None
+loop_monitor: Optional["LoopLagMonitor"] = None
+outbound: Optional["OutboundSender"] = None
+resume_task: Optional[asyncio.Task] = None
@@ -0,0 +1,246 @@
+"""Fair-share delivery scheduler shared by every user's forwarder.
+
+Each user gets a FIFO queue. A fixed pool of workers picks the next job by
+deficit round-robin over users with pending work, so a user watching a few
+firehose channels only ever gets their weighted share of the workers:
+
+• tier      – 'low' / 'normal' / 'high'; sets the DRR quantum (1 / 2 / 4)
+• quota     – optional messages-per-minute token bucket per user
+• ordering  – at most one in-flight job per user, so per-user order is kept
+
+Per-user queue length and wait time (enqueue → dispatch) are tracked and
+exposed through stats()."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+TIER_WEIGHTS = {"low": 1, "normal": 2, "high": 4}
+
+# Smoothing factor for the exponentially-weighted average wait
+_EWMA_ALPHA = 0.2
+
+
+@dataclass
+class Job:
+    chat_id: int
+    msg_id: int
+    msg: Any = None             # None when replayed from the outbox
+    attempts: int = 0
+    enqueued: float = 0.0
+
+
+@dataclass
+class UserQueue:
+    """Queue + accounting for one user."""
+
+    weight: int = TIER_WEIGHTS["normal"]
+    quota_per_min: Optional[int] = None
+    jobs: Deque[Job] = field(default_factory=deque)
+    deficit: float = 0.0
+    tokens: float = 0.0
+    refilled: float = 0.0
+    busy: bool = False
+    in_rotation: bool = False
+    # accounting
+    dispatched: int = 0
+    dropped: int = 0
+    avg_wait: float = 0.0
+    max_wait: float = 0.0
+
+    def refill(self, now: float) -> None:
+        if self.quota_per_min is None:
+            return
+        rate = self.quota_per_min / 60.0
+        self.tokens = min(float(self.quota_per_min), self.tokens + (now - self.refilled) * rate)
+        self.refilled = now
+
+    def seconds_until_token(self) -> float:
+        if self.quota_per_min is None or self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * 60.0 / self.quota_per_min
+
+
+class FairScheduler:
+    """Deficit round-robin across per-user queues feeding a fixed worker pool."""
+
+    def __init__(
+        self,
+        deliver: Callable[[int, Job], Awaitable[None]],
+        workers: int = 4,
+        max_queue: int = 1000,
+        default_quota: Optional[int] = None,
+    ):
+        self._deliver = deliver
+        self._workers_n = workers
+        self._max_queue = max_queue
+        self._default_quota = default_quota
+        self._queues: Dict[int, UserQueue] = {}
+        self._active: Deque[int] = deque()        # users with pending jobs, DRR order
+        self._wakeup = asyncio.Event()
+        self._workers: list[asyncio.Task] = []
+        self._completed = 0
+        self._in_flight = 0
+        self._draining = False      # quotas are ignored while draining
+
+    # ----------------------------- configuration ------------------------------
+    def configure(self, uid: int, tier: str = "normal", quota_per_min: Optional[int] = None):
+        """Set a user's priority tier and messages/min quota (None = default)."""
+        q = self._queue(uid)
+        q.weight = TIER_WEIGHTS.get(tier, TIER_WEIGHTS["normal"])
+        q.quota_per_min = quota_per_min if quota_per_min is not None else self._default_quota
+        q.tokens = float(q.quota_per_min or 0)
+        q.refilled = asyncio.get_running_loop().time()
+
+    def _queue(self, uid: int) -> UserQueue:
+        q = self._queues.get(uid)
+        if q is None:
+            q = self._queues[uid] = UserQueue(
+                quota_per_min=self._default_quota,
+                tokens=float(self._default_quota or 0),
+                refilled=asyncio.get_running_loop().time(),
+            )
+        return q
+
+    def forget(self, uid: int) -> List[Job]:
+        """Drop a user's queue; returns the jobs it still held."""
+        q = self._queues.pop(uid, None)
+        if q is None:
+            return []
+        if q.in_rotation:
+            self._active.remove(uid)
+        return list(q.jobs)
+
+    # ----------------------------- producer side ------------------------------
+    def submit(self, uid: int, job: Job) -> bool:
+        """Queue a job for uid; False if the user's queue is full."""
+        q = self._queue(uid)
+        if len(q.jobs) >= self._max_queue:
+            q.dropped += 1
+            return False
+        job.enqueued = asyncio.get_running_loop().time()
+        if not q.in_rotation:
+            q.in_rotation = True
+            self._active.append(uid)
+        q.jobs.append(job)
+        self._wakeup.set()
+        return True
+
+    # ----------------------------- consumer side ------------------------------
+    def _pick(self, now: float) -> tuple[Optional[int], float]:
+        """
+        Return (uid, 0) of the next user to serve, or (None, sleep) when nobody
+        is eligible right now; sleep is how long until a quota refills.
+        """
+        sleep = 0.0
+        for _ in range(len(self._active)):
+            uid = self._active[0]
+            q = self._queues[uid]
+            if not q.jobs:
+                q.deficit = 0.0
+                q.in_rotation = False
+                self._active.popleft()
+                continue
+            q.refill(now)
+            wait = 0.0 if self._draining else q.seconds_until_token()
+            if q.busy or wait:
+                if wait:
+                    sleep = wait if not sleep else min(sleep, wait)
+                self._active.rotate(-1)
+                continue
+            if q.deficit < 1:
+                q.deficit += q.weight
+            q.deficit -= 1
+            if q.deficit < 1:
+                self._active.rotate(-1)     # quantum spent → next user's turn
+            return uid, 0.0
+        return None, sleep
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            uid, sleep = self._pick(now)
+            if uid is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=sleep or None)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            q = self._queues[uid]
+            job = q.jobs.popleft()
+            if q.quota_per_min is not None:
+                q.tokens -= 1
+            waited = now - job.enqueued
+            q.avg_wait = waited if not q.dispatched else (
+                _EWMA_ALPHA * waited + (1 - _EWMA_ALPHA) * q.avg_wait
+            )
+            q.max_wait = max(q.max_wait, waited)
+            q.dispatched += 1
+            q.busy = True
+            self._in_flight += 1
+            try:
+                await self._deliver(uid, job)
+            except Exception as e:      # noqa: BLE001
+                log.warning("Delivery failed for %s: %s", uid, e)
+            finally:
+                q.busy = False
+                self._in_flight -= 1
+                self._completed += 1
+                if q.jobs:
+                    self._wakeup.set()
+
+    def start(self) -> None:
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker()) for _ in range(self._workers_n)
+            ]
+
+    def pending(self) -> int:
+        """Jobs queued or being delivered right now, across all users."""
+        return sum(len(q.jobs) for q in self._queues.values()) + self._in_flight
+
+    async def drain(self, timeout: float, poll: float = 0.05) -> tuple[int, int]:
+        """
+        Keep delivering until every queue is empty or `timeout` elapses.
+
+        Returns (drained, abandoned): jobs finished during the drain and jobs
+        still queued or in flight when it ended.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        start = self._completed
+        self._draining = True
+        self._wakeup.set()
+        while self.pending() and self._workers and loop.time() < deadline:
+            await asyncio.sleep(min(poll, max(0.0, deadline - loop.time())))
+        return self._completed - start, self.pending()
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # ----------------------------- introspection ------------------------------
+    def stats(self, uid: int) -> dict:
+        q = self._queues.get(uid)
+        if q is None:
+            return {"queued": 0, "dispatched": 0, "dropped": 0, "avg_wait": 0.0, "max_wait": 0.0}
+        return {
+            "queued": len(q.jobs),
+            "dispatched": q.dispatched,
+            "dropped": q.dropped,
+            "avg_wait": q.avg_wait,
+            "max_wait": q.max_wait,
+        }
+
+    def all_stats(self) -> Dict[int, dict]:
+        return {uid: self.stats(uid) for uid in self._queues}
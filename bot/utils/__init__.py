@@ -1,10 +1,14 @@
-from .state import user_state, WAITING_SRC, WAITING_TGT, WAITING_FILTER
-from .token_helpers import contains_token_related      # ← add this line
+from .state import user_state, on_state, WAITING_SRC, WAITING_TGT, WAITING_FILTER, WAITING_PWD, WAITING_IMPORT
+from .token_helpers import contains_token_related, extract_token_keys
 
 __all__ = [
     "user_state",
+    "on_state",
     "WAITING_SRC",
     "WAITING_TGT",
     "WAITING_FILTER",
-    "contains_token_related",                          # ← and add here
+    "WAITING_PWD",
+    "WAITING_IMPORT",
+    "contains_token_related",
+    "extract_token_keys",
 ]
\ No newline at end of file
@@ -1,28 +1,169 @@
 """
 bot/utils/state.py
 ------------------
-Tiny helper for per‑user in‑memory state machines shared across routers.
-Routers can do:
+Per‑user conversation state shared across routers ("waiting for a source",
+"waiting for the 2FA password", ...). Routers can do:
 
-    from bot.utils.state import user_state
-    user_state[user_id] = "awaiting_something"
+    from bot.utils.state import user_state, on_state
+    user_state[user_id] = WAITING_SRC
 
-This avoids each router having its own dict if you prefer a single map.
+    @on_state(WAITING_SRC)
+    async def add_src_finish(message): ...
+
+Entries expire after `STATE_TTL` seconds and the store never holds more than
+`STATE_MAX` users (least recently set are evicted first), so users who
+abandon a flow don't accumulate. Incoming text is routed to the handler
+registered for the user's state with a single dict lookup
+(see bot/routers/conversation.py). Set `STATE_DB_PATH` to keep flows across
+restarts.
 """
 from __future__ import annotations
 
-from typing import Dict
-
-# Global mutable map (uid → state‑str)
-user_state: Dict[int, str] = {}
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterator, Optional, Protocol, Tuple
 
 WAITING_SRC    = "waiting_for_source"
 WAITING_TGT    = "waiting_for_target"
 WAITING_FILTER = "waiting_for_filter"
+WAITING_PWD    = "waiting_for_password"
+WAITING_IMPORT = "waiting_for_import"
+
+
+class StateBackend(Protocol):
+    """Persistence hook for StateStore; the in-memory map is always authoritative."""
+
+    def load(self) -> Iterator[Tuple[int, str, float]]: ...
+    def save(self, uid: int, state: str, expires: float) -> None: ...
+    def delete(self, uid: int) -> None: ...
+
+
+class SqliteStateBackend:
+    """Tiny write-through SQLite file so half-finished flows survive a restart."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conv_state ("
+            " uid INTEGER PRIMARY KEY, state TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+
+    def load(self) -> Iterator[Tuple[int, str, float]]:
+        self._conn.execute("DELETE FROM conv_state WHERE expires<=?", (time.time(),))
+        yield from self._conn.execute("SELECT uid, state, expires FROM conv_state ORDER BY expires")
+
+    def save(self, uid: int, state: str, expires: float) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO conv_state(uid, state, expires) VALUES(?, ?, ?)",
+            (uid, state, expires),
+        )
+
+    def delete(self, uid: int) -> None:
+        self._conn.execute("DELETE FROM conv_state WHERE uid=?", (uid,))
+
+
+class StateStore:
+    """
+    uid → state map with per-entry TTL and a hard size bound.
+
+    Entries are kept in expiry order (every write moves the user to the end),
+    so expiring and evicting only ever looks at the front: O(1) amortised.
+    """
+
+    def __init__(self, ttl: float = 900, max_size: int = 10_000, backend: StateBackend | None = None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._backend = backend
+        self._data: "OrderedDict[int, Tuple[str, float]]" = OrderedDict()
+        if backend:
+            now = time.time()
+            for uid, state, expires in backend.load():
+                if expires > now:
+                    self._data[uid] = (state, expires)
+
+    def _sweep(self, now: float) -> None:
+        while self._data:
+            uid, (_, expires) = next(iter(self._data.items()))
+            if expires > now and len(self._data) <= self.max_size:
+                break
+            self._data.popitem(last=False)
+            if self._backend:
+                self._backend.delete(uid)
+
+    def get(self, uid: int, default: Optional[str] = None) -> Optional[str]:
+        entry = self._data.get(uid)
+        if entry is None:
+            return default
+        if entry[1] <= time.time():
+            self.pop(uid)
+            return default
+        return entry[0]
+
+    def __getitem__(self, uid: int) -> str:
+        state = self.get(uid)
+        if state is None:
+            raise KeyError(uid)
+        return state
+
+    def __setitem__(self, uid: int, state: str) -> None:
+        now = time.time()
+        expires = now + self.ttl
+        self._data[uid] = (state, expires)
+        self._data.move_to_end(uid)
+        if self._backend:
+            self._backend.save(uid, state, expires)
+        self._sweep(now)
+
+    def pop(self, uid: int, default: Optional[str] = None) -> Optional[str]:
+        entry = self._data.pop(uid, None)
+        if entry is None:
+            return default
+        if self._backend:
+            self._backend.delete(uid)
+        return entry[0] if entry[1] > time.time() else default
+
+    def __contains__(self, uid: int) -> bool:
+        return self.get(uid) is not None
+
+    def __len__(self) -> int:
+        self._sweep(time.time())
+        return len(self._data)
+
+
+def _make_store() -> StateStore:
+    from bot.config import settings
+
+    backend = SqliteStateBackend(settings.STATE_DB_PATH) if settings.STATE_DB_PATH else None
+    return StateStore(ttl=settings.STATE_TTL, max_size=settings.STATE_MAX, backend=backend)
+
+
+# Global store (uid → state‑str)
+user_state: StateStore = _make_store()
+
+# (state‑str, content) → handler for the message that completes that step;
+# content is "text" or "document"
+STATE_HANDLERS: Dict[Tuple[str, str], Callable[..., Awaitable]] = {}
+
+
+def on_state(state: str, content: str = "text"):
+    """Register the handler that receives a user's next message while in `state`."""
+    def decorator(fn):
+        STATE_HANDLERS[(state, content)] = fn
+        return fn
+    return decorator
+
 
 __all__ = [
     "user_state",
+    "on_state",
+    "STATE_HANDLERS",
+    "StateStore",
+    "SqliteStateBackend",
     "WAITING_SRC",
     "WAITING_TGT",
     "WAITING_FILTER",
-]
\ No newline at end of file
+    "WAITING_PWD",
+    "WAITING_IMPORT",
+]
@@ -1,5 +1,5 @@
 import re
-from typing import Optional
+from typing import FrozenSet, Optional
 
 REGEX_TICKER = re.compile(r"\$[A-Z]{2,10}")
 REGEX_ETH    = re.compile(r"0x[a-fA-F0-9]{40}")
@@ -9,4 +9,21 @@ REGEX_SOL    = re.compile(r"[1-9A-HJ-NP-Za-km-z]{32,44}")
 def contains_token_related(text: Optional[str]) -> bool:
     if not text:
         return False
-    return bool(REGEX_TICKER.search(text) or REGEX_ETH.search(text) or REGEX_SOL.search(text))
\ No newline at end of file
+    return bool(REGEX_TICKER.search(text) or REGEX_ETH.search(text) or REGEX_SOL.search(text))
+
+
+def extract_token_keys(text: Optional[str]) -> FrozenSet[str]:
+    """
+    Normalised token identifiers mentioned in `text`: ETH addresses
+    (lower-cased) and Solana addresses, or the $TICKERs when no address
+    is present.
+    """
+    if not text:
+        return frozenset()
+    keys = {m.lower() for m in REGEX_ETH.findall(text)}
+    if keys:
+        text = REGEX_ETH.sub(" ", text)     # hex tails would also match REGEX_SOL
+    keys.update(REGEX_SOL.findall(text))
+    if not keys:
+        keys = {m.upper() for m in REGEX_TICKER.findall(text)}
+    return frozenset(keys)
@@ -0,0 +1,86 @@
+"""
+tools/bench_outbox.py
+---------------------
+Throughput of the durable outbox versus naive one-commit-per-row writes.
+
+    python -m tools.bench_outbox [messages]
+
+Each message is appended and then marked delivered, which is exactly the
+work the forwarder adds per accepted message.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# bot.config insists on these; the benchmark never talks to Telegram
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "bench")
+
+
+async def _fresh_db(path: str):
+    from bot.config import settings
+    from bot.db import Database
+
+    settings.DB_PATH = path
+    db = Database()
+    await db.init()
+    return db
+
+
+async def bench_naive(path: str, n: int) -> float:
+    db = await _fresh_db(path)
+    start = time.perf_counter()
+    for i in range(n):
+        await db.conn.execute(
+            "INSERT OR IGNORE INTO outbox(tg_id, chat_id, msg_id) VALUES(?, ?, ?)", (1, -100, i)
+        )
+        await db.conn.commit()
+    for i in range(n):
+        await db.conn.execute(
+            "DELETE FROM outbox WHERE tg_id=? AND chat_id=? AND msg_id=?", (1, -100, i)
+        )
+        await db.conn.commit()
+    elapsed = time.perf_counter() - start
+    await db.conn.close()
+    return elapsed
+
+
+async def bench_outbox(path: str, n: int) -> float:
+    from bot.outbox import Outbox
+
+    db = await _fresh_db(path)
+    outbox = Outbox(db)
+    outbox.start()
+    start = time.perf_counter()
+    for i in range(n):
+        outbox.add((1, -100, i))
+        if i % 100 == 99:
+            await asyncio.sleep(0)      # let the flush loop run, like a live loop would
+    for i in range(n):
+        outbox.done((1, -100, i))
+        if i % 100 == 99:
+            await asyncio.sleep(0)
+    await outbox.stop()
+    elapsed = time.perf_counter() - start
+    cur = await db.conn.execute("SELECT COUNT(*) FROM outbox")
+    assert (await cur.fetchone())[0] == 0
+    await db.conn.close()
+    return elapsed
+
+
+async def main(n: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        naive = await bench_naive(os.path.join(tmp, "naive.db"), n)
+        batched = await bench_outbox(os.path.join(tmp, "outbox.db"), n)
+    print(f"messages: {n}")
+    print(f"naive   : {naive:8.3f}s  {n / naive:10.0f} msg/s")
+    print(f"outbox  : {batched:8.3f}s  {n / batched:10.0f} msg/s  ({naive / batched:.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000))
@@ -0,0 +1,174 @@
+"""
+tools/bench_registry.py
+-----------------------
+Per-user memory of the forwarder's runtime state: the slotted UserRegistry
+versus what the original forwarder kept – `_clients[uid] = (client, task)`,
+the NewMessage handler as a closure over the target and the filtered-ids
+list, one NewMessage builder per source, and AuthManager's `_active` entry.
+
+    python -m tools.bench_registry [users] [sources] [filtered]
+
+The baseline is built by the original refresh_user code (minus connecting);
+the registry by ForwardManager's own _resolve_runtime / _attach. Each user
+gets a stand-in client whose handler list is real Telethon code, and every
+builder is resolved as on the first update. Clients and tasks themselves are
+the same either way and not counted; the fair-share scheduler's queue is a
+separate feature and left out too. Memory is measured with tracemalloc, so it
+includes dict/list over-allocation and everything the closures keep alive.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import tracemalloc
+from typing import Dict, List, Tuple
+
+# bot.config insists on these; the benchmark never talks to Telegram
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "bench")
+
+from telethon import TelegramClient, events, utils  # noqa: E402
+from telethon.tl.custom import Message  # noqa: E402
+from telethon.tl.types import InputPeerChannel  # noqa: E402
+
+from bot.auth import AuthManager  # noqa: E402
+from bot.db import Database, Source, Target  # noqa: E402
+from bot.forwarding import ForwardManager  # noqa: E402
+from bot.registry import ClientHealth, compact_ids  # noqa: E402
+from bot.utils import contains_token_related  # noqa: E402
+
+TASK = object()     # stands in for the run/supervise task
+
+
+class BenchClient:
+    """Just enough of a TelegramClient: handler registration and peer lookup."""
+
+    add_event_handler = TelegramClient.add_event_handler
+    remove_event_handler = TelegramClient.remove_event_handler
+
+    def __init__(self, access_hashes: Dict[int, int]):
+        self._event_builders: List[tuple] = []
+        self._hashes = access_hashes
+
+    async def get_input_entity(self, chat_id: int) -> InputPeerChannel:
+        channel_id = -chat_id - 10**12
+        return InputPeerChannel(channel_id, self._hashes[chat_id])
+
+    async def resolve_builders(self) -> None:
+        for builder, _ in self._event_builders:
+            await builder.resolve(self)
+
+
+# ----------------------------------------------------------- original layout --
+
+class BaselineForwarder:
+    """The original ForwardManager.refresh_user, minus connecting and the task."""
+
+    def __init__(self):
+        self._clients: Dict[int, Tuple[BenchClient, object]] = {}
+        self._active: Dict[int, BenchClient] = {}       # AuthManager's
+
+    def refresh_user(self, tg_id: int, client, sources: List[Source], target: Target,
+                     filter_mode: str, filtered_ids: List[int]):
+        self._active[tg_id] = client
+
+        async def _handler(event: events.NewMessage.Event):
+            msg: Message = event.message
+
+            # 1️⃣ Optional user‑ID filter
+            if filtered_ids and (msg.from_id is None or msg.from_id.user_id not in filtered_ids):
+                return
+
+            # 2️⃣ Content filter
+            if filter_mode != "all" and not contains_token_related(msg.raw_text):
+                return
+
+            try:
+                await client.forward_messages(
+                    entity=(target.chat_id, target.topic_id) if target.topic_id else target.chat_id,
+                    messages=msg,
+                )
+            except Exception:
+                pass
+
+        for src in sources:
+            chat = (src.chat_id, src.topic_id) if src.topic_id else src.chat_id
+            client.add_event_handler(_handler, events.NewMessage(chats=chat))
+
+        self._clients[tg_id] = (client, TASK)
+
+
+# --------------------------------------------------------------------- bench --
+
+def user_data(uid: int, sources: int, filtered: int):
+    chats = {-10**12 - uid * 100 - i: uid * 10**6 + i for i in range(sources)}
+    srcs = [Source(chat_id, None, f"source {i}") for i, chat_id in enumerate(chats)]
+    target = Target(-10**12 - 10**9 - uid, None)
+    chats[target.chat_id] = uid
+    return chats, srcs, target, filtered
+
+
+def filtered_ids(uid: int, count: int) -> List[int]:
+    """Fresh int objects on every call, like rows read from the database."""
+    return [10**9 + uid * 1000 + i for i in range(count)]
+
+
+async def main(users: int, sources: int, filtered: int) -> None:
+    data = [user_data(uid, sources, filtered) for uid in range(users)]   # shared by both
+
+    async def baseline():
+        clients = [BenchClient(chats) for chats, *_ in data]
+        fwd = BaselineForwarder()
+        before = tracemalloc.get_traced_memory()[0]
+        for uid, (_, srcs, target, flt) in enumerate(data):
+            fwd.refresh_user(uid, clients[uid], srcs, target, "token", filtered_ids(uid, flt))
+            await clients[uid].resolve_builders()
+        return fwd, clients, before
+
+    fm = ForwardManager(Database(), AuthManager())
+    fm.auth._active, fm.auth._status = {}, {}
+
+    async def registry():
+        clients = [BenchClient(chats) for chats, *_ in data]
+        before = tracemalloc.get_traced_memory()[0]
+        for uid, (_, srcs, target, flt) in enumerate(data):
+            client = clients[uid]
+            # What _rebuild does once the session checks out
+            fm.auth._active[uid] = client
+            fm.auth.set_status(uid, True)
+            rt = await fm._resolve_runtime(uid, client, srcs, target)
+            rt.filter_mode = "token"
+            rt.allowed_senders = compact_ids(filtered_ids(uid, flt))
+            fm._attach(uid, rt)
+            slot = fm.users.slot(uid)
+            slot.runtime = rt
+            rt.task = TASK
+            slot.health = ClientHealth()
+            slot.health.up()
+            await client.resolve_builders()
+        return clients, before
+
+    async def net(build):
+        # Only what the build adds on top of the (identical) stand-in clients
+        tracemalloc.start()
+        keep = await build()
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return after - keep[-1]
+
+    old = await net(baseline)
+    new = await net(registry)
+    report = fm.users.memory_report()
+    print(f"users: {users}, sources/user: {sources}, filtered ids/user: {filtered}")
+    print(f"original _clients + closures: {old / users:8.0f} B/user  {old / 2**20:7.1f} MiB total")
+    print(f"slotted registry            : {new / users:8.0f} B/user  {new / 2**20:7.1f} MiB total"
+          f"  ({abs(1 - new / old):.0%} {'less' if new < old else 'more'})")
+    print(f"registry.memory_report()    : {report['per_user']:8.0f} B/user (sys.getsizeof walk)")
+    assert utils.get_peer_id(fm.users.runtime(0).target_peer) == data[0][2].chat_id
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    asyncio.run(main(*(args + [10_000, 3, 0][len(args):])))
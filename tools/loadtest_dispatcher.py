@@ -0,0 +1,450 @@
+"""
+tools/loadtest_dispatcher.py
+----------------------------
+Load test for the aiogram side: many simulated users clicking through the
+menus at once, against the real `dp` from bot/entry.py.
+
+    python -m tools.loadtest_dispatcher [--users 1000] [--rounds 3]
+                                        [--think 0.0] [--telethon-ms 30]
+
+A local stand-in for the Bot API (aiohttp, 127.0.0.1) serves getUpdates from
+an in-memory queue and answers sendMessage / sendPhoto / sendDocument /
+editMessageReplyMarkup / editMessageText / answerCallbackQuery with plausible
+objects. Telethon is replaced by a fake client whose calls just sleep for
+--telethon-ms. Everything else (routers, middlewares, DB, forwarder rebuilds)
+is the production code, on a throwaway database.
+
+Each user runs: /start, then per round two add_src + chat id, mgr_src, a
+del_src button from the keyboard it got back, view_cfg and toggle_mode. Once
+every session is done the test waits for the debounced forwarder rebuilds
+those clicks scheduled. Reported:
+
+• updates/sec over the whole run
+• forwarder rebuilds: how many ran, how many requests they absorbed, their
+  duration (p50 / p95 / max) and how long after the last click they were done
+• end-to-end latency per update (handed out by getUpdates → dispatcher done)
+• the per-route handler table from bot.metrics (total / DB / Telethon p95)
+• DB contention: round-trip of a `SELECT 1` probe issued every 50 ms while the
+  test runs (time spent queued behind handler queries), and how often the
+  transaction lock was found held
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+_TMP = tempfile.mkdtemp(prefix="loadtest-")
+
+# bot.config insists on these and reads paths at import time
+os.environ.setdefault("BOT_TOKEN", "123456:loadtest")
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "loadtest")
+os.environ["DB_PATH"] = os.path.join(_TMP, "bot.db")
+os.environ["SESSION_DIR"] = os.path.join(_TMP, "sessions")
+os.environ["LOG_FILE"] = os.path.join(_TMP, "bot.log")
+os.environ.setdefault("LOOP_LAG_THRESHOLD", "0")
+
+from aiohttp import web  # noqa: E402
+from telethon.tl.types import InputPeerChannel  # noqa: E402
+
+from bot.metrics import io_timer  # noqa: E402
+
+BOT_ID = 123456
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+# -----------------------------------------------------------------------------
+# Fake Telethon
+# -----------------------------------------------------------------------------
+
+class FakeClient:
+    """Just enough of TelegramClient for the routers and ForwardManager."""
+
+    latency = 0.03
+
+    def __init__(self, uid: int):
+        self.uid = uid
+        self._connected = False
+        self._disconnected = asyncio.Event()
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def _rpc(self):
+        with io_timer("telethon"):
+            await asyncio.sleep(self.latency)
+
+    async def connect(self):
+        await self._rpc()
+        self._connected = True
+        self._disconnected.clear()
+
+    async def start(self):
+        await self.connect()
+
+    async def disconnect(self):
+        self._connected = False
+        self._disconnected.set()
+
+    async def is_user_authorized(self) -> bool:
+        return True
+
+    async def get_entity(self, peer):
+        await self._rpc()
+        return SimpleNamespace(id=peer, title=f"Chat {peer}", first_name=f"User {peer}")
+
+    async def get_input_entity(self, peer):
+        await self._rpc()
+        return InputPeerChannel(channel_id=abs(int(peer)) % 10**12 or 1, access_hash=0)
+
+    def add_event_handler(self, *_):
+        pass
+
+    def remove_event_handler(self, *_):
+        pass
+
+    async def run_until_disconnected(self):
+        await self._disconnected.wait()
+
+# -----------------------------------------------------------------------------
+# Fake Bot API
+# -----------------------------------------------------------------------------
+
+class FakeBotAPI:
+    def __init__(self):
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self.served_at: Dict[int, float] = {}
+        self.keyboards: Dict[int, list] = {}        # chat id → last inline keyboard
+        self.calls: Dict[str, int] = {}
+        self._msg_ids = itertools.count(1)
+        self.port = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{self.port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def _message(self, chat_id: int, text: str = "", reply_markup=None) -> dict:
+        msg = {
+            "message_id": next(self._msg_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": BOT_ID, "is_bot": True, "first_name": "Bot"},
+            "text": text,
+        }
+        if reply_markup:
+            msg["reply_markup"] = reply_markup
+        return msg
+
+    def _remember_keyboard(self, chat_id: int, params: dict):
+        markup = params.get("reply_markup")
+        if markup:
+            markup = json.loads(markup) if isinstance(markup, str) else markup
+            if "inline_keyboard" in markup:
+                self.keyboards[chat_id] = markup["inline_keyboard"]
+
+    async def _get_updates(self, params: dict) -> list:
+        timeout = min(float(params.get("timeout") or 0), 1.0)
+        batch = []
+        try:
+            batch.append(await asyncio.wait_for(self.updates.get(), timeout) if timeout else self.updates.get_nowait())
+        except (asyncio.TimeoutError, asyncio.QueueEmpty):
+            return []
+        while len(batch) < 100 and not self.updates.empty():
+            batch.append(self.updates.get_nowait())
+        now = time.perf_counter()
+        for upd in batch:
+            self.served_at[upd["update_id"]] = now
+        return batch
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[method] = self.calls.get(method, 0) + 1
+        m = method.lower()
+        chat_id = int(params.get("chat_id") or 0)
+
+        if m == "getupdates":
+            result = await self._get_updates(params)
+        elif m == "getme":
+            result = {"id": BOT_ID, "is_bot": True, "first_name": "Bot", "username": "loadtest_bot"}
+        elif m in ("sendmessage", "sendphoto", "senddocument"):
+            self._remember_keyboard(chat_id, params)
+            result = self._message(chat_id, params.get("text") or params.get("caption") or "")
+        elif m in ("editmessagereplymarkup", "editmessagetext"):
+            self._remember_keyboard(chat_id, params)
+            result = self._message(chat_id, params.get("text") or "")
+        else:                   # answerCallbackQuery, deleteWebhook, ...
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+# -----------------------------------------------------------------------------
+# Simulated users
+# -----------------------------------------------------------------------------
+
+class Simulation:
+    def __init__(self, api: FakeBotAPI, think: float):
+        self.api = api
+        self.think = think
+        self._update_ids = itertools.count(1)
+        self._waiting: Dict[int, asyncio.Future] = {}
+        self.latencies: List[float] = []
+        self.errors = 0
+
+    def done(self, update_id: int, failed: bool):
+        """Called by the outer middleware once the dispatcher is finished."""
+        served = self.api.served_at.pop(update_id, None)
+        if served is not None:
+            self.latencies.append(time.perf_counter() - served)
+        if failed:
+            self.errors += 1
+        fut = self._waiting.pop(update_id, None)
+        if fut and not fut.done():
+            fut.set_result(None)
+
+    async def _send(self, update: dict):
+        uid = update["update_id"]
+        fut = asyncio.get_running_loop().create_future()
+        self._waiting[uid] = fut
+        await self.api.updates.put(update)
+        try:
+            await asyncio.wait_for(fut, 60)
+        except asyncio.TimeoutError:
+            self._waiting.pop(uid, None)
+            self.errors += 1
+        if self.think:
+            await asyncio.sleep(random.uniform(0, 2 * self.think))
+
+    def _user(self, uid: int) -> dict:
+        return {"id": uid, "is_bot": False, "first_name": f"u{uid}"}
+
+    async def text(self, uid: int, text: str):
+        upd = next(self._update_ids)
+        await self._send({
+            "update_id": upd,
+            "message": {
+                "message_id": upd,
+                "date": int(time.time()),
+                "chat": {"id": uid, "type": "private"},
+                "from": self._user(uid),
+                "text": text,
+                **({"entities": [{"type": "bot_command", "offset": 0, "length": len(text)}]}
+                   if text.startswith("/") else {}),
+            },
+        })
+
+    async def click(self, uid: int, data: str):
+        upd = next(self._update_ids)
+        await self._send({
+            "update_id": upd,
+            "callback_query": {
+                "id": str(upd),
+                "from": self._user(uid),
+                "chat_instance": str(uid),
+                "data": data,
+                "message": self.api._message(uid, "menu"),
+            },
+        })
+
+    async def session(self, uid: int, rounds: int):
+        await self.text(uid, "/start")
+        for n in range(rounds):
+            for i in range(2):          # two in, one out: sources still accumulate
+                await self.click(uid, "add_src")
+                await self.text(uid, str(-1000000000000 - uid * 100 - 2 * n - i))
+            await self.click(uid, "mgr_src")
+            buttons = [
+                b["callback_data"]
+                for row in self.api.keyboards.get(uid, [])
+                for b in row
+                if b.get("callback_data", "").startswith("del_src:")
+            ]
+            if buttons:
+                await self.click(uid, random.choice(buttons))
+            await self.click(uid, "view_cfg")
+            await self.click(uid, "toggle_mode")
+
+# -----------------------------------------------------------------------------
+# DB contention probe
+# -----------------------------------------------------------------------------
+
+async def probe_db(db, samples: List[float], lock_held: List[int], stop: asyncio.Event):
+    while not stop.is_set():
+        lock_held[1] += 1
+        if db._tx_lock.locked():
+            lock_held[0] += 1
+        start = time.perf_counter()
+        await db.conn.execute("SELECT 1")
+        samples.append(time.perf_counter() - start)
+        try:
+            await asyncio.wait_for(stop.wait(), 0.05)
+        except asyncio.TimeoutError:
+            pass
+
+async def settle_rebuilds(fwd, timeout: float) -> float:
+    """Wait until no debounced rebuild is pending or running; seconds it took."""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    while loop.time() - start < timeout:
+        if not fwd.refresh_stats()["pending"] and not fwd._refresh_tasks:
+            break
+        await asyncio.sleep(0.05)
+    return loop.time() - start
+
+# -----------------------------------------------------------------------------
+# Main
+# -----------------------------------------------------------------------------
+
+async def main(args) -> None:
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.enums import ParseMode
+
+    from bot import runtime as r
+    from bot.config import settings
+    from bot.entry import dp
+    from bot.forwarding import ForwardManager
+    from bot.metrics import metrics
+
+    class TimedForwardManager(ForwardManager):
+        """ForwardManager that records how long each rebuild takes."""
+
+        rebuild_times: List[float] = []
+
+        async def _rebuild(self, tg_id: int):
+            start = time.perf_counter()
+            try:
+                await super()._rebuild(tg_id)
+            finally:
+                self.rebuild_times.append(time.perf_counter() - start)
+
+    FakeClient.latency = args.telethon_ms / 1000
+    r.auth._new_client = FakeClient
+    await r.db.init()
+    r.forwarder = TimedForwardManager(r.db, r.auth)
+    r.forwarder.start()
+
+    api = FakeBotAPI()
+    base = await api.start()
+    sim = Simulation(api, args.think)
+
+    @dp.update.outer_middleware()
+    async def _completion(handler, update, data):
+        failed = False
+        try:
+            return await handler(update, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            sim.done(update.update_id, failed)
+
+    users = [10_000 + i for i in range(args.users)]
+    for uid in users:
+        await r.db.add_user_if_missing(uid)
+        await r.db.set_target(uid, -1009999999999, None)    # so refreshes rebuild fully
+        r.auth.set_status(uid, True)
+
+    bot = Bot(
+        settings.BOT_TOKEN,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(base)),
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+    await asyncio.sleep(0.2)
+    metrics.reset()
+
+    stop = asyncio.Event()
+    probe_samples: List[float] = []
+    lock_held = [0, 0]
+    probe = asyncio.create_task(probe_db(r.db, probe_samples, lock_held, stop))
+
+    print(f"{args.users} users × {args.rounds} rounds, Telethon {args.telethon_ms:g} ms, think {args.think:g}s")
+    start = time.perf_counter()
+    await asyncio.gather(*(sim.session(uid, args.rounds) for uid in users))
+    elapsed = time.perf_counter() - start
+    settled = await settle_rebuilds(r.forwarder, settings.REFRESH_MAX_DELAY + 30)
+
+    stop.set()
+    await probe
+    await dp.stop_polling()
+    await asyncio.gather(polling, return_exceptions=True)
+    await r.forwarder.stop_all(deadline=2)
+    await bot.session.close()
+    await api.stop()
+    await r.db.conn.close()
+
+    lat = sorted(sim.latencies)
+    probe_sorted = sorted(probe_samples)
+    n = len(lat)
+    print(f"\nupdates   : {n} in {elapsed:.1f}s → {n / elapsed:.0f} updates/s, {sim.errors} errors")
+    print(
+        "latency   : p50 {:.1f} ms, p95 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms".format(
+            *(1000 * _quantile(lat, q) for q in (0.5, 0.95, 0.99)), 1000 * (lat[-1] if lat else 0)
+        )
+    )
+    print(
+        "db probe  : p50 {:.1f} ms, p95 {:.1f} ms, max {:.1f} ms; tx lock held in {:.1%} of samples".format(
+            1000 * _quantile(probe_sorted, 0.5), 1000 * _quantile(probe_sorted, 0.95),
+            1000 * (probe_sorted[-1] if probe_sorted else 0),
+            lock_held[0] / lock_held[1] if lock_held[1] else 0,
+        )
+    )
+    rs = r.forwarder.refresh_stats()
+    rebuilds = sorted(r.forwarder.rebuild_times)
+    print(
+        f"rebuilds  : {rs['rebuilds']} for {rs['requested']} requests ({rs['coalesced']} coalesced, "
+        f"{rs['pending']} still pending), done {settled:.1f}s after the last click"
+    )
+    print(
+        "rebuild   : p50 {:.1f} ms, p95 {:.1f} ms, max {:.1f} ms".format(
+            1000 * _quantile(rebuilds, 0.5), 1000 * _quantile(rebuilds, 0.95),
+            1000 * (rebuilds[-1] if rebuilds else 0),
+        )
+    )
+    print(f"api calls : {dict(sorted(api.calls.items()))}")
+    print("\n" + metrics.render())
+
+
+def _parse(argv) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    p.add_argument("--users", type=int, default=1000)
+    p.add_argument("--rounds", type=int, default=3)
+    p.add_argument("--think", type=float, default=0.0, help="mean pause between a user's clicks (s)")
+    p.add_argument("--telethon-ms", type=float, default=30.0, help="latency of each fake Telethon call")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        asyncio.run(main(_parse(sys.argv[1:])))
+    finally:
+        shutil.rmtree(_TMP, ignore_errors=True)
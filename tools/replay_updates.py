@@ -0,0 +1,319 @@
+"""
+tools/replay_updates.py
+-----------------------
+Replay a recording made with RECORD_UPDATES (bot/recorder.py) through the real
+forwarding pipeline, offline.
+
+    python -m tools.replay_updates recording.jsonl [--speed 1|10|max]
+                                   [--mode forward|copy|digest]
+                                   [--filter all|token|first] [--rpc-ms 30]
+
+Every recorded user gets a live runtime on a ForwardManager backed by a
+throwaway database, with all the chats they were recorded in as whole-chat
+sources. Records are then handed to its NewMessage / MessageEdited /
+MessageDeleted handlers at the recorded pace (divided by --speed; `max`
+just yields between records), so filters, outbox, scheduler, ledger and
+digest all run as in production. Telethon is replaced by a fake client whose
+calls sleep for --rpc-ms and answer with a fresh target message id.
+
+Texts are synthesised from the recording: the original length, filled with
+words, carrying one made-up address or $TICKER per recorded token hash, so the
+'token' and 'first' filters take the same decisions they took live. Photos and
+documents become dummy media; other media kinds go through copy mode's
+forward fallback, as they would in production.
+
+Reported: injected vs. delivered messages, throughput, latency from handler
+to delivery done (p50/p95/p99/max), scheduler deferrals, and fake RPC counts.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime
+import hashlib
+import itertools
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple
+
+_TMP = tempfile.mkdtemp(prefix="replay-")
+
+# bot.config insists on these and reads paths at import time
+os.environ.setdefault("BOT_TOKEN", "123456:replay")
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "replay")
+os.environ["DB_PATH"] = os.path.join(_TMP, "bot.db")
+os.environ["SESSION_DIR"] = os.path.join(_TMP, "sessions")
+os.environ["LOG_FILE"] = os.path.join(_TMP, "bot.log")
+os.environ["RECORD_UPDATES"] = ""       # never record the replay itself
+
+from telethon.tl import types  # noqa: E402
+
+from bot.forwarding import ForwardManager  # noqa: E402
+from bot.outbox import Key  # noqa: E402
+from bot.recorder import read_recording  # noqa: E402
+from bot.registry import UserRuntime  # noqa: E402
+
+TARGET = types.InputPeerChannel(channel_id=999_999_999, access_hash=0)
+FILLER = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor ".split()
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+# -----------------------------------------------------------------------------
+# Fake Telethon
+# -----------------------------------------------------------------------------
+
+class FakeClient:
+    """Answers every request after `latency` seconds with a new message id."""
+
+    latency = 0.03
+    calls: Counter = Counter()
+    _ids = itertools.count(1)
+
+    def is_connected(self) -> bool:
+        return True
+
+    async def disconnect(self):
+        pass
+
+    def remove_event_handler(self, *_):
+        pass
+
+    async def __call__(self, request):
+        self.calls[type(request).__name__] += 1
+        await asyncio.sleep(self.latency)
+        random_id = getattr(request, "random_id", None)
+        if isinstance(random_id, list):
+            random_id = random_id[0]
+        updates = [] if random_id is None else [types.UpdateMessageID(id=next(self._ids), random_id=random_id)]
+        return types.Updates(updates=updates, users=[], chats=[], date=None, seq=0)
+
+    async def send_message(self, *_, **__):
+        self.calls["send_message"] += 1
+        await asyncio.sleep(self.latency)
+
+    async def delete_messages(self, _peer, ids):
+        self.calls["delete_messages"] += 1
+        await asyncio.sleep(self.latency)
+
+# -----------------------------------------------------------------------------
+# Synthetic messages
+# -----------------------------------------------------------------------------
+
+def _token(kind: str, h: int) -> str:
+    digest = hashlib.blake2b(str(h).encode(), digest_size=20).digest()
+    if kind == "t":
+        return "$" + "".join(chr(65 + b % 26) for b in digest[:6])
+    return "0x" + digest.hex()
+
+
+def synth_text(length: int, keys: List[list]) -> str:
+    words = [_token(kind, h) for kind, h in keys]
+    text = " ".join(words)
+    filler = itertools.cycle(FILLER)
+    while len(text) < length:
+        text = f"{text} {next(filler)}" if text else next(filler)
+    return text[:max(length, len(" ".join(words)))]
+
+
+def synth_entity(name: str, offset: int, length: int):
+    cls = getattr(types, "MessageEntity" + name, None)
+    if cls is types.MessageEntityTextUrl:
+        return cls(offset, length, url="https://example.invalid")
+    try:
+        return cls(offset, length)
+    except TypeError:           # unknown type or one needing more fields
+        return types.MessageEntityUnknown(offset, length)
+
+
+def synth_media(kind: Optional[str], msg_id: int):
+    if kind is None:
+        return None
+    if kind == "photo":
+        return types.MessageMediaPhoto(photo=types.Photo(
+            id=msg_id, access_hash=0, file_reference=b"\0" * 16, date=None, sizes=[], dc_id=2,
+        ))
+    if kind == "document":
+        return types.MessageMediaDocument(document=types.Document(
+            id=msg_id, access_hash=0, file_reference=b"\0" * 16, date=None,
+            mime_type="application/octet-stream", size=0, dc_id=2, attributes=[],
+        ))
+    if kind == "webpage":
+        return types.MessageMediaWebPage(webpage=types.WebPageEmpty(id=0))
+    return types.MessageMediaUnsupported()
+
+
+def synth_event(record: list):
+    kind, _, _, chat_id, msg_id, sender, topic, grouped, length, _, entities, media, keys = record
+    text = synth_text(length, keys)
+    msg = SimpleNamespace(
+        id=msg_id,
+        message=text,
+        raw_text=text,
+        entities=[synth_entity(*e) for e in entities] or None,
+        media=synth_media(media, msg_id),
+        reply_to=types.MessageReplyHeader(
+            reply_to_msg_id=topic, reply_to_top_id=topic, forum_topic=True
+        ) if topic else None,
+        from_id=types.PeerUser(sender) if sender else None,
+        grouped_id=grouped,
+        edit_date=datetime.datetime.now(datetime.timezone.utc) if kind == "e" else None,
+        edit_hide=False,
+    )
+    return SimpleNamespace(chat_id=chat_id, message=msg)
+
+# -----------------------------------------------------------------------------
+# Replay
+# -----------------------------------------------------------------------------
+
+class ReplayManager(ForwardManager):
+    """ForwardManager that counts what its filters let through and times deliveries."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.injected: Dict[Tuple[int, int, int], float] = {}
+        self.latencies: List[float] = []
+        self.accepted = 0
+        # Past the filters a new message goes to exactly one of these
+        self.outbox.add = self._counted(self.outbox.add)
+        self.digest.add = self._counted(self.digest.add)
+        # Only a delivered job settles as done (sources never change mid-replay)
+        self.outbox.done = self._timed(self.outbox.done)
+
+    def _counted(self, add: Callable) -> Callable:
+        def counted(*args):
+            self.accepted += 1
+            add(*args)
+        return counted
+
+    def _timed(self, done: Callable[[Key], None]) -> Callable[[Key], None]:
+        def timed(key: Key):
+            done(key)
+            sent = self.injected.pop(key, None)
+            if sent is not None:
+                self.latencies.append(time.perf_counter() - sent)
+        return timed
+
+
+async def _outbox_pending(fm: ForwardManager) -> int:
+    await fm.outbox.flush()
+    cur = await fm.db.conn.execute("SELECT COUNT(*) FROM outbox WHERE status='pending'")
+    return (await cur.fetchone())[0]
+
+
+async def main(args) -> None:
+    from bot.db import Database
+
+    records = list(read_recording(args.recording))
+    if not records:
+        print("empty recording")
+        return
+    kinds = Counter(r[0] for r in records)
+    chats: Dict[int, set] = {}
+    for rec in records:
+        if rec[3] is not None:
+            chats.setdefault(rec[2], set()).add(rec[3])
+
+    db = Database()
+    await db.init()
+    FakeClient.latency = args.rpc_ms / 1000
+    fm = ReplayManager(db, auth=None)
+    fm.start()
+    for uid, chat_ids in chats.items():
+        rt = UserRuntime(
+            client=FakeClient(), target_peer=TARGET, top_msg_id=None, mode=args.mode,
+            source_peers={cid: types.InputPeerChannel(abs(cid) % 10**12, 0) for cid in chat_ids},
+            filter_mode=args.filter,
+        )
+        fm.users.slot(uid).runtime = rt
+        fm.scheduler.configure(uid)
+
+    speed = None if args.speed == "max" else float(args.speed)
+    span = records[-1][1] / 1000
+    print(
+        f"{len(records)} records ({kinds['n']} new, {kinds['e']} edits, {kinds['d']} deletions) "
+        f"over {span:.1f}s, {len(chats)} users, {sum(map(len, chats.values()))} chats; "
+        f"replaying at {args.speed}{'x' if speed else ''}, mode {args.mode}, filter {args.filter}"
+    )
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    wall = time.perf_counter()
+    for rec in records:
+        if speed:
+            delay = start + rec[1] / 1000 / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            await asyncio.sleep(0)
+        uid = rec[2]
+        rt = fm.users.runtime(uid)
+        if rt is None:
+            continue            # only ever seen deleting in chats it doesn't source
+        if rec[0] == "d":
+            await fm._on_delete(uid, rt, SimpleNamespace(chat_id=rec[3], deleted_ids=rec[4]))
+            continue
+        event = synth_event(rec)
+        if rec[0] == "n":
+            fm.injected[(uid, rec[3], rec[4])] = time.perf_counter()
+            await fm._on_message(uid, rt, event)
+        else:
+            await fm._on_edit(uid, rt, event)
+    injected = time.perf_counter() - wall
+
+    # Let the queues and outbox retries run dry
+    settle = loop.time() + args.settle
+    while loop.time() < settle and (fm.scheduler.pending() or await _outbox_pending(fm)):
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - wall
+    stats = fm.scheduler.all_stats()
+    await fm.stop_all(deadline=2)
+    await db.conn.close()
+
+    lat = sorted(fm.latencies)
+    delivered = len(lat)
+    print(f"\ninjected  : {len(records)} records in {injected:.1f}s ({len(records) / max(injected, 1e-9):.0f}/s)")
+    accepted = fm.accepted
+    print(f"filters   : {accepted} of {kinds['n']} new messages accepted")
+    print(
+        f"delivered : {delivered} in {elapsed:.1f}s → {delivered / max(elapsed, 1e-9):.0f} msg/s"
+        f" ({accepted - delivered - fm.digest.digested} not delivered)"
+    )
+    print(
+        "latency   : p50 {:.1f} ms, p95 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms".format(
+            *(1000 * _quantile(lat, q) for q in (0.5, 0.95, 0.99)), 1000 * (lat[-1] if lat else 0)
+        )
+    )
+    print(f"scheduler : {sum(s['dropped'] for s in stats.values())} deferred (queue full)")
+    print(f"digest    : {fm.digest.emitted} sent, {fm.digest.digested} messages")
+    print(f"ledger    : {fm.ledger.stats()}")
+    print(f"rpc calls : {dict(sorted(FakeClient.calls.items()))}")
+
+
+def _parse(argv) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    p.add_argument("recording")
+    p.add_argument("--speed", default="1", help="time compression factor, or 'max'")
+    p.add_argument("--mode", default="forward", choices=("forward", "copy", "digest"))
+    p.add_argument("--filter", default="all", choices=("all", "token", "first"))
+    p.add_argument("--rpc-ms", type=float, default=30.0, help="latency of each fake Telethon call")
+    p.add_argument("--settle", type=float, default=30.0, help="max seconds to wait for queues to drain")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        asyncio.run(main(_parse(sys.argv[1:])))
+    finally:
+        shutil.rmtree(_TMP, ignore_errors=True)
@@ -0,0 +1,464 @@
+"""
+tools/soak.py
+-------------
+Soak test: hours of simulated traffic against the real bot, watching for
+memory, task and file-descriptor leaks.
+
+    python -m tools.soak [--hours 6] [--speed 360] [--users 50]
+                         [--rate 20] [--sample 5]
+                         [--max-mem-growth 16] [--max-task-growth 20]
+                         [--max-fd-growth 8] [--max-orphan-growth 2]
+
+Time is compressed by --speed: every TTL, debounce, backoff, retention and
+digest interval in settings is divided by it (and Bot API rate limits
+multiplied), so `--hours 6 --speed 360` covers six hours of expiry and
+pruning cycles in one real minute.
+
+The harness is tools/loadtest_dispatcher.py's: the real `dp` with every router
+and middleware polling a local fake Bot API, Telethon replaced by fake
+clients, a throwaway database. On top of the menu clicks, simulated users
+log in by QR (scanned, 2FA, or left to expire), log out, and keep their
+sources busy: --rate messages/s (real time) go through the forwarder's
+NewMessage / MessageEdited / MessageDeleted handlers, and live clients drop
+their connection now and then so the supervisor reconnects them.
+
+Every --sample seconds the process is measured after a full gc: traced Python
+memory (tracemalloc), live asyncio tasks, open file descriptors, and the
+sizes of the long-lived maps (AuthManager caches, conversation state, the
+forwarder's registry, ledger and first-seen index, outbound chat lanes), and
+how many fake clients are still connected although neither AuthManager nor
+a forwarder runtime refers to them any more.
+Growth is the lowest of the last three samples minus the lowest of the first
+three after a warm-up (the first 20% of the run), so requests that happen to
+be in flight don't count; the test fails (exit status 1) if any of it passes
+its threshold. The report lists the allocation sites that grew most.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime
+import gc
+import itertools
+import logging
+import os
+import random
+import shutil
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Dict, List
+
+from tools import loadtest_dispatcher as lt    # sets up env + a throwaway dir
+
+from telethon.errors import SessionPasswordNeededError  # noqa: E402
+from telethon.tl import types  # noqa: E402
+
+# settings scaled by --speed: durations shrink, rates grow
+_DURATIONS = (
+    "STATE_TTL", "AUTH_STATUS_TTL", "REFRESH_DEBOUNCE", "REFRESH_MAX_DELAY",
+    "RECONNECT_BASE", "RECONNECT_MAX", "FIRST_SEEN_WINDOW", "DIGEST_INTERVAL",
+    "LEDGER_RETENTION", "LEDGER_DELETE_DELAY", "OUTBOX_RETRY_INTERVAL",
+)
+_RATES = ("OUTBOUND_GLOBAL_RATE", "OUTBOUND_CHAT_RATE", "OUTBOUND_GROUP_PER_MIN")
+
+QR_EXPIRY = 30.0        # seconds a login QR stays valid
+
+# -----------------------------------------------------------------------------
+# Fake Telethon, with login, RPCs and dispatch of source events
+# -----------------------------------------------------------------------------
+
+class FakeQRLogin:
+    def __init__(self, client: "SoakClient", outcome: str, expiry: float):
+        self.client = client
+        self.outcome = outcome
+        self.expiry = expiry
+        self.url = f"tg://login?token={random.getrandbits(64):x}"
+
+    async def wait(self):
+        if self.outcome == "expire":
+            await asyncio.sleep(self.expiry)
+            raise asyncio.TimeoutError()
+        await asyncio.sleep(random.uniform(0, self.expiry / 10))
+        if self.outcome == "2fa":
+            raise SessionPasswordNeededError(None)
+        SoakClient.authorized.add(self.client.uid)
+
+
+class SoakClient(lt.FakeClient):
+    authorized: set = set()
+    clients: List["SoakClient"] = []
+    qr_expiry = QR_EXPIRY
+    _ids = itertools.count(1)
+
+    def __init__(self, uid: int):
+        super().__init__(uid)
+        self.handlers: List[tuple] = []
+        SoakClient.clients.append(self)
+
+    async def is_user_authorized(self) -> bool:
+        return self.uid in self.authorized
+
+    async def qr_login(self):
+        await self._rpc()
+        outcome = random.choices(("scan", "2fa", "expire"), (0.6, 0.2, 0.2))[0]
+        return FakeQRLogin(self, outcome, self.qr_expiry)
+
+    async def sign_in(self, password=None):
+        await self._rpc()
+        self.authorized.add(self.uid)
+
+    def add_event_handler(self, callback, event=None):
+        self.handlers.append((callback, event))
+
+    def remove_event_handler(self, callback, event=None):
+        self.handlers = [h for h in self.handlers if h[0] is not callback]
+
+    async def __call__(self, request):
+        await self._rpc()
+        random_id = getattr(request, "random_id", None)
+        if isinstance(random_id, list):
+            random_id = random_id[0]
+        updates = [] if random_id is None else [types.UpdateMessageID(id=next(self._ids), random_id=random_id)]
+        return types.Updates(updates=updates, users=[], chats=[], date=None, seq=0)
+
+    async def send_message(self, *_, **__):
+        await self._rpc()
+
+    async def delete_messages(self, *_):
+        await self._rpc()
+
+    def drop(self):
+        """Simulate the connection going away under run_until_disconnected."""
+        self._connected = False
+        self._disconnected.set()
+
+
+def _message(msg_id: int, edited: bool = False):
+    text = random.choice((
+        "gm", "new listing 0x" + "%040x" % random.getrandbits(40), "$PEPE to the moon",
+        "a longer update " * random.randint(1, 40),
+    ))
+    return SimpleNamespace(
+        id=msg_id, message=text, raw_text=text, entities=None, media=None, reply_to=None,
+        from_id=types.PeerUser(random.randint(1, 50)), grouped_id=None,
+        edit_date=datetime.datetime.now(datetime.timezone.utc) if edited else None, edit_hide=False,
+    )
+
+
+async def pump_messages(forwarder, rate: float, stop: asyncio.Event, counts: Dict[str, int]):
+    """Feed source events to every live runtime's registered handlers."""
+    from telethon import events
+
+    msg_ids = itertools.count(1)
+    recent: List[tuple] = []
+    loop = asyncio.get_running_loop()
+    due = loop.time()
+    while not stop.is_set():
+        due += 1 / rate
+        await asyncio.sleep(max(0.0, due - loop.time()))
+        live = list(forwarder.users.runtimes())
+        if not live:
+            continue
+        uid, rt = random.choice(live)
+        chat_id = random.choice(list(rt.source_peers))
+        roll = random.random()
+        if roll < 0.85 or not recent:
+            kind, msg_id = events.NewMessage, next(msg_ids)
+            recent = (recent + [(uid, chat_id, msg_id)])[-200:]
+            event = SimpleNamespace(chat_id=chat_id, message=_message(msg_id))
+        elif roll < 0.95:
+            kind = events.MessageEdited
+            _, chat_id, msg_id = random.choice(recent)
+            event = SimpleNamespace(chat_id=chat_id, message=_message(msg_id, edited=True))
+        else:
+            kind = events.MessageDeleted
+            _, chat_id, msg_id = random.choice(recent)
+            event = SimpleNamespace(chat_id=chat_id, deleted_ids=[msg_id])
+        for callback, builder in list(rt.client.handlers):
+            if type(builder) is kind:
+                try:
+                    await callback(event)
+                except Exception as e:      # noqa: BLE001
+                    counts["errors"] += 1
+                    logging.getLogger(__name__).warning("Handler failed: %s", e)
+        counts[kind.__name__] += 1
+
+
+async def chaos(forwarder, interval: float, stop: asyncio.Event, counts: Dict[str, int]):
+    """Every `interval`, drop a random live client's connection."""
+    while not stop.is_set():
+        await asyncio.sleep(interval)
+        live = list(forwarder.users.runtimes())
+        if live:
+            random.choice(live)[1].client.drop()
+            counts["drops"] += 1
+
+# -----------------------------------------------------------------------------
+# Simulated users
+# -----------------------------------------------------------------------------
+
+async def user_loop(sim: "lt.Simulation", uid: int, stop: asyncio.Event):
+    from bot.utils.state import WAITING_PWD, user_state
+
+    while not stop.is_set():
+        await sim.text(uid, "/start")
+        roll = random.random()
+        if roll < 0.15:
+            await sim.click(uid, "login")
+            if user_state.get(uid) == WAITING_PWD:
+                await sim.text(uid, "hunter2")
+        elif roll < 0.2:
+            await sim.click(uid, "logout")
+        await sim.click(uid, "add_src")
+        await sim.text(uid, str(-1000000000000 - uid * 10 - random.randint(0, 5)))
+        await sim.click(uid, "mgr_src")
+        buttons = [
+            b["callback_data"]
+            for row in sim.api.keyboards.get(uid, [])
+            for b in row
+            if b.get("callback_data", "").startswith(("del_src:", "src_page:"))
+        ]
+        for data in random.sample(buttons, min(2, len(buttons))):
+            await sim.click(uid, data)
+        await sim.click(uid, random.choice(("view_cfg", "toggle_mode", "toggle_delivery", "mgr_filter")))
+        if random.random() < 0.1:
+            await sim.click(uid, "add_src")     # abandoned flow: left to expire
+        await asyncio.sleep(random.uniform(0.5, 2.0))
+
+# -----------------------------------------------------------------------------
+# Measurement
+# -----------------------------------------------------------------------------
+
+def _fd_count() -> int:
+    try:
+        return len(os.listdir(f"/proc/{os.getpid()}/fd"))
+    except OSError:
+        return -1           # not Linux; fd growth is then not checked
+
+
+def structure_sizes() -> Dict[str, int]:
+    from bot import runtime as r
+    from bot.utils.state import user_state
+
+    fwd = r.forwarder
+    sizes = {
+        "auth._pending": len(r.auth._pending),
+        "auth._active": len(r.auth._active),
+        "auth._qr_event": len(r.auth._qr_event),
+        "auth._status": len(r.auth._status),
+        "auth._verifying": len(r.auth._verifying),
+        "user_state": len(user_state),
+    }
+    # Connected clients nothing refers to any more can never be disconnected
+    owned = {id(c) for c in (*r.auth._active.values(), *r.auth._pending.values())}
+    if fwd:
+        owned.update(id(rt.client) for _, rt in fwd.users.runtimes())
+    connected = [c for c in SoakClient.clients if c.is_connected()]
+    SoakClient.clients[:] = connected
+    sizes["connected clients"] = len(connected)
+    sizes["orphaned clients"] = sum(1 for c in connected if id(c) not in owned)
+    if fwd:
+        sizes.update({
+            "registry users": len(fwd.users),
+            "ledger hot": fwd.ledger.stats()["hot"],
+            "first_seen keys": fwd.first_seen.stats()["keys"],
+        })
+    if r.outbound:
+        sizes["outbound lanes"] = len(r.outbound._lanes)
+    return sizes
+
+
+class Sample(SimpleNamespace):
+    pass
+
+
+def take_sample(started: float) -> Sample:
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, pattern) for pattern in ("*tracemalloc*", "*linecache*", "<frozen *>")]
+    )
+    return Sample(
+        at=time.perf_counter() - started,
+        snapshot=snapshot,
+        memory=sum(s.size for s in snapshot.statistics("filename")),
+        tasks=len(asyncio.all_tasks()),
+        fds=_fd_count(),
+        sizes=structure_sizes(),
+    )
+
+
+def growth_report(base: Sample, last: Sample, top: int) -> List[str]:
+    lines = []
+    for stat in last.snapshot.compare_to(base.snapshot, "lineno")[:top * 3]:
+        if stat.size_diff <= 0:
+            continue
+        frame = stat.traceback[0]
+        where = frame.filename.replace(os.getcwd() + os.sep, "")
+        lines.append(f"  {stat.size_diff / 1024:+9.1f} KiB {stat.count_diff:+7d} blocks  {where}:{frame.lineno}")
+        if len(lines) >= top:
+            break
+    return lines
+
+# -----------------------------------------------------------------------------
+# Main
+# -----------------------------------------------------------------------------
+
+async def main(args) -> int:
+    from bot.config import settings
+
+    for name in _DURATIONS:
+        setattr(settings, name, getattr(settings, name) / args.speed)
+    for name in _RATES:
+        setattr(settings, name, getattr(settings, name) * args.speed)
+    SoakClient.qr_expiry = QR_EXPIRY / args.speed
+
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.enums import ParseMode
+
+    from bot import runtime as r
+    from bot.entry import dp
+    from bot.forwarding import ForwardManager
+
+    lt.FakeClient.latency = args.telethon_ms / 1000
+    r.auth._new_client = SoakClient
+    await r.db.init()
+    r.auth.load_status_index()
+    r.forwarder = ForwardManager(r.db, r.auth)
+    r.forwarder.start()
+
+    api = lt.FakeBotAPI()
+    base_url = await api.start()
+    sim = lt.Simulation(api, think=0)
+
+    @dp.update.outer_middleware()
+    async def _completion(handler, update, data):
+        failed = False
+        try:
+            return await handler(update, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            sim.done(update.update_id, failed)
+
+    users = [20_000 + i for i in range(args.users)]
+    for uid in users:
+        await r.db.add_user_if_missing(uid)
+        await r.db.set_target(uid, -1009999999999, None)
+        SoakClient.authorized.add(uid)
+        r.auth.set_status(uid, True)
+
+    bot = Bot(
+        settings.BOT_TOKEN,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)),
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+    bot.session.middleware(r.outbound)
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+
+    duration = args.hours * 3600 / args.speed
+    print(
+        f"soak: {args.hours:g} h simulated at {args.speed:g}x → {duration:.0f}s real, "
+        f"{args.users} users, {args.rate:g} source msgs/s, sampling every {args.sample:g}s"
+    )
+    tracemalloc.start(args.frames)
+    started = time.perf_counter()
+    stop = asyncio.Event()
+    counts: Dict[str, int] = {"NewMessage": 0, "MessageEdited": 0, "MessageDeleted": 0, "drops": 0, "errors": 0}
+    workers = [asyncio.create_task(user_loop(sim, uid, stop)) for uid in users]
+    workers.append(asyncio.create_task(pump_messages(r.forwarder, args.rate, stop, counts)))
+    workers.append(asyncio.create_task(chaos(r.forwarder, max(1.0, duration / 60), stop, counts)))
+
+    samples: List[Sample] = []
+    warm: Sample | None = None
+    warm_at = 0
+    last: Sample | None = None
+    print(f"\n{'t(s)':>6}{'MiB':>8}{'tasks':>7}{'fds':>6}  structures")
+    while time.perf_counter() - started < duration:
+        await asyncio.sleep(min(args.sample, max(0.0, duration - (time.perf_counter() - started))))
+        s = take_sample(started)
+        samples.append(Sample(**{k: v for k, v in vars(s).items() if k != "snapshot"}))
+        if warm is None and s.at >= duration * 0.2:
+            warm, warm_at = s, len(samples) - 1
+        last = s
+        sizes = " ".join(f"{k}={v}" for k, v in s.sizes.items() if v)
+        print(f"{s.at:>6.0f}{s.memory / 2**20:>8.1f}{s.tasks:>7}{s.fds:>6}  {sizes}")
+
+    stop.set()
+    await asyncio.gather(*workers, return_exceptions=True)
+    await dp.stop_polling()
+    await asyncio.gather(polling, return_exceptions=True)
+    await r.forwarder.stop_all(deadline=2)
+    await bot.session.close()
+    await api.stop()
+    await r.db.conn.close()
+
+    if warm is None or len(samples) - warm_at < 4:
+        print("\nrun too short for a warm-up baseline; raise --hours or lower --sample")
+        return 1
+    head, tail = samples[warm_at:warm_at + 3], samples[-3:]
+
+    def grew(attr: str) -> float:
+        return min(getattr(x, attr) for x in tail) - min(getattr(x, attr) for x in head)
+
+    mem = grew("memory") / 2**20
+    tasks = grew("tasks")
+    fds = grew("fds") if last.fds >= 0 else 0
+    orphans = min(x.sizes["orphaned clients"] for x in tail) - min(x.sizes["orphaned clients"] for x in head)
+    print(
+        f"\ntraffic  : {counts['NewMessage']} new, {counts['MessageEdited']} edits, "
+        f"{counts['MessageDeleted']} deletions, {counts['drops']} connection drops, "
+        f"{len(sim.latencies)} bot updates ({sim.errors + counts['errors']} errors)"
+    )
+    print(f"growth   : since t={warm.at:.0f}s (after warm-up)")
+    checks = (
+        ("memory", mem, args.max_mem_growth, "MiB"),
+        ("tasks", tasks, args.max_task_growth, ""),
+        ("fds", fds, args.max_fd_growth, ""),
+        ("orphaned clients", orphans, args.max_orphan_growth, ""),
+    )
+    failed = False
+    for name, grew, limit, unit in checks:
+        verdict = "FAIL" if grew > limit else "ok"
+        failed |= grew > limit
+        print(f"  {name:<16} {grew:+8.1f}{unit:<4} (limit {limit:g})  {verdict}")
+    for key, value in last.sizes.items():
+        before = warm.sizes.get(key, 0)
+        if value != before:
+            print(f"  {key:<18} {before} → {value}")
+    print(f"\ntop growing allocation sites (t={warm.at:.0f}s → t={last.at:.0f}s):")
+    print("\n".join(growth_report(warm, last, args.top)) or "  none")
+    tracemalloc.stop()
+    print("\nFAIL" if failed else "\nPASS")
+    return 1 if failed else 0
+
+
+def _parse(argv) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    p.add_argument("--hours", type=float, default=6.0, help="simulated duration")
+    p.add_argument("--speed", type=float, default=360.0, help="simulated seconds per real second")
+    p.add_argument("--users", type=int, default=50)
+    p.add_argument("--rate", type=float, default=20.0, help="source messages/s (real time)")
+    p.add_argument("--sample", type=float, default=5.0, help="seconds between measurements")
+    p.add_argument("--telethon-ms", type=float, default=5.0, help="latency of each fake Telethon call")
+    p.add_argument("--frames", type=int, default=1, help="traceback depth kept by tracemalloc")
+    p.add_argument("--top", type=int, default=15, help="allocation sites to list")
+    p.add_argument("--max-mem-growth", type=float, default=16.0, help="MiB")
+    p.add_argument("--max-task-growth", type=int, default=20)
+    p.add_argument("--max-fd-growth", type=int, default=8)
+    p.add_argument("--max-orphan-growth", type=int, default=2, help="connected clients nothing refers to")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    try:
+        code = asyncio.run(main(_parse(sys.argv[1:])))
+    finally:
+        shutil.rmtree(lt._TMP, ignore_errors=True)
+    sys.exit(code)